@@ -79,26 +79,24 @@ def create_app():
     # Import models
     from app.main.models.grouping_model import GroupModel, GroupIPModel
     from app.main.models.firewall_model import FirewallRuleModel
+    from app.main.routes.firewall_routes import rule_to_dict
+    from app.utils.change_feed import record_change, record_changes
+    from app.utils.upsert import insert_ignore
     
     def initialize_defaults():
+        # Defaults created here go through the change log like any other policy write,
+        # so the controller's change feed and conditional fetches see them
         with app.app_context():
-            windows_group = GroupModel.query.filter_by(name='windows_group').first()
-            linux_group = GroupModel.query.filter_by(name='linux_group').first()
-
-            if not windows_group:
-                new_group = GroupModel(name='windows_group')
-                db.session.add(new_group)
-                logger.info("Created windows_group")
-
-            if not linux_group:
-                new_group = GroupModel(name='linux_group')
-                db.session.add(new_group)
-                logger.info("Created linux_group")
+            for group_name in ('windows_group', 'linux_group'):
+                if insert_ignore(GroupModel.__table__, [{'name': group_name}]):
+                    group_id = db.session.query(GroupModel.id).filter_by(name=group_name).scalar()
+                    record_change('group', 'create', group_id=group_id, group_name=group_name)
+                    logger.info("Created %s", group_name)
 
             db.session.commit()
 
-            windows_group_id = windows_group.id if windows_group else None
-            linux_group_id = linux_group.id if linux_group else None
+            windows_group_id = db.session.query(GroupModel.id).filter_by(name='windows_group').scalar()
+            linux_group_id = db.session.query(GroupModel.id).filter_by(name='linux_group').scalar()
 
             arp_rule = FirewallRuleModel.query.filter_by(
                 dl_type='0x0806', nw_proto='any', tp_src='any', tp_dst='any', nw_src='any', nw_dst='any', action='allow', priority=1000
@@ -116,11 +114,13 @@ def create_app():
                 dl_type='any', nw_proto='any', tp_src='any', tp_dst='any', nw_src='any', nw_dst='any', action='deny', priority=0
                 ).first()
             
+            created_rules = []
             if not arp_rule:
                 arp_rule = FirewallRuleModel(
                     dl_type='0x0806', nw_proto='any', tp_src='any', tp_dst='any', nw_src='any', nw_dst='any', action='allow', priority=1000
                 )
                 db.session.add(arp_rule)
+                created_rules.append(arp_rule)
                 logger.info("Created arp_policy")
             
 
@@ -129,6 +129,7 @@ def create_app():
                     dl_type='any', nw_proto='tcp', tp_src='any', tp_dst='22', nw_src='any', nw_dst=f"group:{linux_group_id}", action='allow', priority=100
                 ) 
                 db.session.add(ssh_rule)
+                created_rules.append(ssh_rule)
                 logger.info("Created ssh_policy")
 
             if not rdp_rule and windows_group_id:
@@ -136,6 +137,7 @@ def create_app():
                     dl_type='any', nw_proto='tcp', tp_src='any', tp_dst='3389', nw_src='any', nw_dst=f"group:{windows_group_id}", action='allow', priority=100
                 )
                 db.session.add(rdp_rule)
+                created_rules.append(rdp_rule)
                 logger.info("Created rdp_policy")
 
             if not default_rule:
@@ -143,15 +145,25 @@ def create_app():
                     dl_type='any', nw_proto='any', tp_src='any', tp_dst='any', nw_src='any', nw_dst='any', action='deny', priority=0
                 )
                 db.session.add(default_rule)
+                created_rules.append(default_rule)
                 logger.info("Created default_policy")
 
+            if created_rules:
+                db.session.flush()
+                record_changes('rule', 'create', [{'rule': rule_to_dict(rule)} for rule in created_rules])
             db.session.commit()
 
 
     def initialize_database():
+        from app.utils.group_snapshot import rebuild_group_snapshots
+        from app.utils.migrations import run_migrations
         with app.app_context():
             db.create_all()
+            run_migrations(db.engine)
             initialize_defaults()
+            # Groups may have changed while snapshots were off
+            rebuild_group_snapshots()
+            db.session.commit()
 
     
     initialize_database()
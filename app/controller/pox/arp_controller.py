@@ -5,10 +5,26 @@ from pox.lib.packet.arp import arp
 from pox.lib.packet.ipv4 import ipv4
 from pox.lib.packet.icmp import icmp
 from pox.lib.revent import EventMixin
-import requests
-import logging
+from pox.lib.recoco import Timer
+from pox.lib.addresses import EthAddr
+from event_sender import EventSender
+from host_table import HostTable
+from os_scan_pool import OsScanPool, UNKNOWN_OS
+from fingerprint_store import FingerprintStore, SCAN_CONFIDENCE
+from packet_filter import is_arp_or_icmp
+from rule_compiler import FIREWALL_PRIORITY_BASE
+import time
 import logging
 
+# Learned forwarding flows sit below the firewall's priority band, so any firewall entry overlapping
+# them, default deny included, takes precedence; their cookie has no firewall marker, so reconciliation
+# leaves them alone
+FORWARDING_PRIORITY = FIREWALL_PRIORITY_BASE - 1
+FORWARDING_COOKIE = 0x4c32
+
+# Pruned early when an ARP storm fills it between expiry runs
+MAX_RECENT_FLOODS = 65536
+
 # Get a reference to the log
 log = core.getLogger()
 
@@ -23,16 +39,44 @@ log.addHandler(console_handler)
 # Set the logging level to capture messages of desired severity
 log.setLevel(logging.DEBUG)  # Set the desired logging level
 
-# Dictionaries to keep track of reported IP and MAC addresses
-reported_ips = set()
-reported_macs = set()
-
 class ArpController(EventMixin):
-    def __init__(self):
+    def __init__(self, event_queue_size=10000, event_batch_size=100, event_flush_interval=0.5,
+                 host_capacity=100000, host_ttl=1800, host_expiry_interval=60,
+                 flow_idle_timeout=10, flow_hard_timeout=60, arp_flood_window=1.0,
+                 os_scan_workers=4, os_scan_per_subnet=2, os_scan_cache_ttl=86400,
+                 fingerprint_db='/home/ubuntu/prosec/fingerprints.db', fingerprint_max_age=7 * 86400,
+                 fingerprint_min_confidence=0.7):
         super(ArpController, self).__init__()
         self.listenTo(core.openflow)
-        self.mac_to_port = {}  # Store MAC to port mapping for each switch
-        self.mac_to_ip = {}    # Store MAC to IP mapping
+
+        # Known destinations get a forwarding flow so later packets stay in the data plane
+        self.flow_idle_timeout = flow_idle_timeout
+        self.flow_hard_timeout = flow_hard_timeout
+
+        # The same ARP request seen again within arp_flood_window seconds is not flooded twice
+        self.arp_flood_window = arp_flood_window
+        self.recent_floods = {}  # (dpid, hwsrc, protodst) -> time of the last flood
+        self.counts = {"flows_installed": 0, "flows_removed": 0, "floods": 0, "floods_suppressed": 0,
+                       "packets_filtered": 0}
+
+        # Learned hosts per (dpid, mac); hosts not seen for host_ttl seconds age out and are reported as gone
+        self.hosts = HostTable(capacity=host_capacity, ttl=host_ttl)
+        self.expiry_timer = Timer(host_expiry_interval, self.expire_hosts, recurring=True)
+
+        # Discovery events are queued and posted in batches by a background thread,
+        # so a slow management plane never holds up packet-in handling
+        self.event_sender = EventSender("http://localhost:5000/prosec/api/events/bulk", queue_size=event_queue_size,
+                                        batch_size=event_batch_size, flush_interval=event_flush_interval)
+        self.event_sender.start()
+
+        # OS fingerprinting runs in worker processes; new hosts are reported at once with a
+        # provisional OS type and again with an "os_updated" event when their scan completes
+        self.scanner = OsScanPool(self.handle_scan_result, workers=os_scan_workers, per_subnet=os_scan_per_subnet,
+                                  cache_ttl=os_scan_cache_ttl, dispatch=core.callLater)
+
+        # Fingerprints survive restarts, and MAC vendor or TTL settles the obvious cases without a scan
+        self.fingerprints = FingerprintStore(fingerprint_db, max_age=fingerprint_max_age,
+                                             min_confidence=fingerprint_min_confidence)
         log.info("ArpController initialized and listeners added.")
 
     def _handle_ConnectionUp(self, event):
@@ -48,6 +92,10 @@ class ArpController(EventMixin):
         connection.send(arp_rule)
 
     def _handle_PacketIn(self, event):
+        # Traffic other than ARP and ICMP is dropped from the raw bytes, before any packet objects are built
+        if not is_arp_or_icmp(event.data):
+            self.counts["packets_filtered"] += 1
+            return
         try:
             packet = event.parsed
             if not packet.parsed:
@@ -75,23 +123,34 @@ class ArpController(EventMixin):
                 source_ip = arp_request.protosrc
                 source_mac = arp_request.hwsrc
 
-                # Learn the MAC to port mapping
-                previous_port = self.mac_to_port.get((event.dpid, source_mac))
-                self.mac_to_port[(event.dpid, source_mac)] = event.port
-                self.mac_to_ip[source_mac] = source_ip
+                # Learn the MAC to port and IP mapping
+                previous_port = self.hosts.port_for(event.dpid, source_mac)
+                host, previous_ip, evicted = self.hosts.learn(event.dpid, source_mac, event.port, source_ip)
+                self.report_gone(evicted)
+
+                if previous_ip is not None and host.os_type is not None:
+                    # The host came back under a new address; the old one is gone
+                    if self.hosts.known_os_type(source_mac, previous_ip, exclude=host) is None:
+                        self.send_event(previous_ip, source_mac, host.os_type, event='os_deleted')
+                    host.os_type = None
+                    host.ttl_checked = False
 
-                if source_ip not in reported_ips and source_mac not in reported_macs:
+                if host.os_type is None:
+                    host.os_type = self.hosts.known_os_type(source_mac, source_ip, exclude=host)
+                if host.os_type is None:
                     log.info("Received ARP request with source IP %s and source MAC %s", source_ip, source_mac)
-                    reported_ips.add(source_ip)
-                    reported_macs.add(source_mac)
-                    os_type = self.scan_os(source_ip)
-                    self.send_event(source_ip, source_mac, os_type)
+                    host.os_type = self.scan_os(source_ip, source_mac)
+                    self.send_event(source_ip, source_mac, host.os_type)
 
-                # Forward the ARP packet to all ports except the input port
-                self.flood_packet(event)
+                # Forward the ARP packet to all ports except the input port, once per window
+                if self.should_flood(event.dpid, source_mac, arp_request.protodst):
+                    self.flood_packet(event)
 
                 # Log MAC addresses if there's a change
                 if previous_port != event.port:
+                    if previous_port is not None:
+                        # The host moved; flows still pointing at its old port are wrong now
+                        self.remove_forwarding_flows(event.dpid, source_mac)
                     self.log_mac_addresses(event.dpid)
 
         except Exception as e:
@@ -101,14 +160,18 @@ class ArpController(EventMixin):
         try:
             ip_packet = packet.payload
             dest_mac = packet.dst
+            host = self.hosts.touch(event.dpid, packet.src)
+            if host is not None and host.os_type == UNKNOWN_OS and not host.ttl_checked:
+                # Still waiting for a scan; the first packet's TTL may already tell, later ones would not
+                host.ttl_checked = True
+                self.classify_host(host.ip, host.mac, ip_packet.ttl)
 
             # Check if we have learned the destination MAC address
-            if (event.dpid, dest_mac) in self.mac_to_port:
-                out_port = self.mac_to_port[(event.dpid, dest_mac)]
-                msg = of.ofp_packet_out()
-                msg.data = event.ofp
-                msg.actions.append(of.ofp_action_output(port=out_port))
-                event.connection.send(msg)
+            out_port = self.hosts.port_for(event.dpid, dest_mac)
+            if out_port == event.port:
+                return  # The destination is behind the port the packet came from
+            if out_port is not None:
+                self.install_forwarding_flow(event, dest_mac, out_port)
             else:
                 # Flood the packet if destination is unknown
                 self.flood_packet(event)
@@ -116,45 +179,131 @@ class ArpController(EventMixin):
         except Exception as e:
             log.exception("Error handling ICMP packet: %s", e)
 
+    def install_forwarding_flow(self, event, dest_mac, out_port):
+        # ICMP to the learned destination from this port; the flow also releases the packet
+        msg = of.ofp_flow_mod()
+        msg.match = of.ofp_match(in_port=event.port, dl_dst=dest_mac, dl_type=ethernet.IP_TYPE,
+                                 nw_proto=ipv4.ICMP_PROTOCOL)
+        msg.priority = FORWARDING_PRIORITY
+        msg.cookie = FORWARDING_COOKIE
+        msg.idle_timeout = self.flow_idle_timeout
+        msg.hard_timeout = self.flow_hard_timeout
+        msg.data = event.ofp
+        msg.actions.append(of.ofp_action_output(port=out_port))
+        event.connection.send(msg)
+        self.counts["flows_installed"] += 1
+
+    def remove_forwarding_flows(self, dpid, mac):
+        # A non-strict delete on dl_dst only hits flows matching that MAC, never the wildcarded firewall flows
+        connection = core.openflow.getConnection(dpid)
+        if connection is not None:
+            connection.send(of.ofp_flow_mod(command=of.OFPFC_DELETE, match=of.ofp_match(dl_dst=mac)))
+            self.counts["flows_removed"] += 1
+
+    def should_flood(self, dpid, hwsrc, protodst):
+        now = time.monotonic()
+        key = (dpid, hwsrc, protodst)
+        last = self.recent_floods.get(key)
+        if last is not None and now - last < self.arp_flood_window:
+            self.counts["floods_suppressed"] += 1
+            return False
+        self.recent_floods[key] = now
+        if len(self.recent_floods) > MAX_RECENT_FLOODS:
+            self.prune_floods()
+        return True
+
+    def prune_floods(self):
+        # Forget floods older than the suppression window
+        deadline = time.monotonic() - self.arp_flood_window
+        self.recent_floods = {key: last for key, last in self.recent_floods.items() if last > deadline}
+
     def flood_packet(self, event):
         try:
             msg = of.ofp_packet_out()
             msg.data = event.ofp
             msg.actions.append(of.ofp_action_output(port=of.OFPP_FLOOD))
             event.connection.send(msg)
+            self.counts["floods"] += 1
         except Exception as e:
             log.exception("Error flooding packet: %s", e)
 
-    def send_event(self, ip_address, mac_address, os_type):
-        try:
-            url = "http://localhost:5000/prosec/api/events"
-            data = {
-                'event': 'os_discovered',
-                'os_type': os_type,
-                'ipv4': str(ip_address),
-                'arp': str(mac_address)
-            }
-            response = requests.post(url, json=data)
-            if response.status_code == 201:
-                log.info("Event sent successfully: %s", data)
-            else:
-                log.error("Failed to send event: %s", response.text)
-        except Exception as e:
-            log.error("Error sending event: %s", e)
+    def expire_hosts(self):
+        expired = self.hosts.expire()
+        if expired:
+            log.info("Aged out %d hosts", len(expired))
+            self.report_gone(expired)
+            for host in expired:
+                self.remove_forwarding_flows(host.dpid, host.mac)
+        self.prune_floods()
+
+    def get_metrics(self, params=None):
+        return dict(self.counts, hosts=self.hosts.metrics(), recent_floods=len(self.recent_floods),
+                    os_scan=self.scanner.metrics(), fingerprints=self.fingerprints.metrics())
+
+    def report_gone(self, hosts):
+        # A host still seen on another switch at the same address stays reported
+        for host in hosts:
+            if host.os_type is not None and self.hosts.known_os_type(host.mac, host.ip) is None:
+                self.send_event(host.ip, host.mac, host.os_type, event='os_deleted')
 
-    def scan_os(self, ip):
-        # Placeholder method for OS detection
-        os_type = "Windows"  # Example: replace with actual OS detection logic
+    def send_event(self, ip_address, mac_address, os_type, event='os_discovered'):
+        data = {
+            'event': event,
+            'os_type': os_type,
+            'ipv4': str(ip_address),
+            'arp': str(mac_address)
+        }
+        self.event_sender.send(data)
+        log.info("Queued event: %s", data)
+
+    def scan_os(self, ip, mac):
+        # A cached or stored fingerprint is final; otherwise report the host as unknown until its scan completes
+        os_type = self.scanner.lookup(str(ip), str(mac)) or self.classify_host(ip, mac)
+        if os_type is None:
+            self.scanner.submit(str(ip), str(mac))
+            os_type = UNKNOWN_OS
+        return os_type
+
+    def classify_host(self, ip, mac, ttl=None):
+        # Stored fingerprints and confident guesses; a guess is stored and applied to hosts already reported
+        known = self.fingerprints.classify(mac, ttl)
+        if known is None:
+            return None
+        os_type, confidence, source = known
+        if source != "stored":
+            self.fingerprints.put(mac, ip, os_type, confidence, source)
+            self.update_os_type(str(ip), str(mac), os_type)
         return os_type
 
+    def handle_scan_result(self, ip, mac, os_type):
+        if os_type != UNKNOWN_OS:
+            self.fingerprints.put(mac, ip, os_type, SCAN_CONFIDENCE, "nmap")
+        self.update_os_type(ip, mac, os_type)
+
+    def update_os_type(self, ip, mac, os_type):
+        hosts = [host for host in self.hosts.by_mac.get(EthAddr(mac), {}).values() if str(host.ip) == ip]
+        if not hosts:
+            return  # Aged out or readdressed while it was being classified
+        previous = hosts[0].os_type
+        if previous is None:
+            return  # Not reported yet; the caller reports it with this type
+        for host in hosts:
+            host.os_type = os_type
+        if previous == os_type or os_type == UNKNOWN_OS:
+            return
+
+        log.info("OS of %s (%s): %s", ip, mac, os_type)
+        if previous not in (None, UNKNOWN_OS):
+            self.send_event(ip, mac, previous, event='os_deleted')
+        self.send_event(ip, mac, os_type, event='os_updated')
+
     def log_mac_addresses(self, dpid):
         log.info("+-------------------+---------------+-----------------------+------------------+")
         log.info("| Switch            | Port          | MAC Address           | IP Address       |")
         log.info("+-------------------+---------------+-----------------------+------------------+")
-        for (sw, mac), port in self.mac_to_port.items():
-            if sw == dpid:
-                ip = self.mac_to_ip.get(mac, "N/A")
-                log.info("| %-17s | %-13s | %-21s | %-17s |", sw, port, mac, ip)
+        for host in self.hosts.entries.values():
+            if host.dpid == dpid:
+                log.info("| %-17s | %-13s | %-21s | %-17s |", host.dpid, host.port, host.mac, host.ip or "N/A")
         log.info("+-------------------+---------------+-----------------------+------------------+")
 
 
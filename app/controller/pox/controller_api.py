@@ -0,0 +1,50 @@
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import urlparse, parse_qs
+
+log = logging.getLogger(__name__)
+
+class ControllerApi(object):
+    """Small read-only JSON API the management plane uses to query controller state.
+
+    Each route maps a path to a provider called with the parsed query string. Providers
+    run on the HTTP server thread and must be safe to call from outside the POX loop.
+    """
+    def __init__(self, port=8081, address="127.0.0.1"):
+        self.routes = {}
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                provider = api.routes.get(url.path)
+                if provider is None:
+                    return self._reply(404, {"error": "Not found"})
+                try:
+                    params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                    self._reply(200, provider(params))
+                except Exception as e:
+                    log.exception("Error serving %s: %s", url.path, e)
+                    self._reply(500, {"error": str(e)})
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                log.debug(format, *args)
+
+        self.server = ThreadingHTTPServer((address, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        log.info("Controller API listening on %s:%s", address, port)
+
+    def add_route(self, path, provider):
+        self.routes[path] = provider
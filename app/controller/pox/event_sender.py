@@ -0,0 +1,83 @@
+import time
+import logging
+import requests
+from queue import Queue, Empty, Full
+from threading import Thread
+
+log = logging.getLogger(__name__)
+
+class EventSender(Thread):
+    """Delivers discovery events to the management plane off the POX thread.
+
+    send() only appends to a bounded queue and never blocks; when the queue is full
+    the event is dropped and counted. A background thread drains the queue into
+    batches of up to `batch_size` events, waiting at most `flush_interval` seconds
+    for a batch to fill, and POSTs each batch as one JSON array over a pooled
+    session. Failed batches are retried with exponential backoff up to
+    `max_retries` times before they are dropped.
+    """
+    def __init__(self, url, queue_size=10000, batch_size=100, flush_interval=0.5, max_retries=5,
+                 backoff=0.5, max_backoff=30, timeout=10):
+        super(EventSender, self).__init__(daemon=True)
+        self.url = url
+        self.queue = Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.counts = {"queued": 0, "sent": 0, "dropped": 0, "failed": 0, "batches": 0, "retries": 0}
+
+    def send(self, event):
+        try:
+            self.queue.put_nowait(event)
+            self.counts["queued"] += 1
+        except Full:
+            self.counts["dropped"] += 1
+            log.warning("Event queue full, dropping event: %s", event)
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except Empty:
+                    break
+            self.post(batch)
+
+    def post(self, batch):
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.url, json=batch, timeout=self.timeout)
+                if response.status_code < 500:
+                    break
+                log.error("Event endpoint returned %s: %s", response.status_code, response.text)
+            except requests.RequestException as e:
+                log.error("Error sending %d events: %s", len(batch), e)
+            if attempt == self.max_retries:
+                self.counts["failed"] += len(batch)
+                log.error("Dropping %d events after %d retries", len(batch), self.max_retries)
+                return
+            self.counts["retries"] += 1
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+
+        self.counts["batches"] += 1
+        if response.status_code == 201:
+            self.counts["sent"] += len(batch)
+            log.info("Sent %d events", len(batch))
+        else:
+            # Client errors will not succeed on retry
+            self.counts["failed"] += len(batch)
+            log.error("Event endpoint rejected %d events: %s", len(batch), response.text)
+
+    def metrics(self, params=None):
+        return dict(self.counts, pending=self.queue.qsize())
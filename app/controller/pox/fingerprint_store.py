@@ -0,0 +1,118 @@
+import sqlite3
+import time
+import logging
+from threading import Lock
+
+log = logging.getLogger(__name__)
+
+# Vendors whose devices run one OS family, by the first three octets of the MAC
+OUI_OS_TYPES = {
+    "b8:27:eb": "Linux",  # Raspberry Pi Foundation
+    "dc:a6:32": "Linux",
+    "e4:5f:01": "Linux",
+    "d8:3a:dd": "Linux",
+    "28:cd:c1": "Linux",
+}
+OUI_CONFIDENCE = 0.9
+
+# Initial TTLs: Windows starts at 128, Linux at 64 (as do macOS and the BSDs, hence the lower confidence)
+TTL_OS_TYPES = ((64, "Linux", 0.6), (128, "Windows", 0.8))
+
+SCAN_CONFIDENCE = 1.0
+
+def initial_ttl(ttl):
+    # Packets lose one per hop, so the sender started at the next common initial value
+    for initial in (32, 64, 128, 255):
+        if ttl <= initial:
+            return initial
+    return None
+
+
+def guess_os(mac, ttl=None):
+    """Classify a host from its MAC vendor and, if a packet was seen, its IP TTL.
+
+    Returns (os_type, confidence, source), or None when neither says anything.
+    """
+    os_type = OUI_OS_TYPES.get(str(mac).lower()[:8])
+    if os_type is not None:
+        return os_type, OUI_CONFIDENCE, "oui"
+    if ttl is not None:
+        initial = initial_ttl(ttl)
+        for value, os_type, confidence in TTL_OS_TYPES:
+            if initial == value:
+                return os_type, confidence, "ttl"
+    return None
+
+
+class FingerprintStore(object):
+    """OS fingerprints by MAC address, kept in a local SQLite file across restarts.
+
+    A fingerprint is trusted for `max_age` seconds; after that the host is
+    fingerprinted again. Only results with at least `min_confidence` are used.
+    """
+    def __init__(self, path, max_age=7 * 86400, min_confidence=0.7):
+        self.path = path
+        self.max_age = max_age
+        self.min_confidence = min_confidence
+        self.lock = Lock()
+        # Scan results arrive on the POX thread; the API thread only reads metrics
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS fingerprints ("
+                        "mac TEXT PRIMARY KEY, ip TEXT, os_type TEXT NOT NULL, confidence REAL NOT NULL, "
+                        "source TEXT NOT NULL, updated_at REAL NOT NULL)")
+        self.db.commit()
+        self.counts = {"hits": 0, "misses": 0, "stale": 0, "stored": 0}
+
+    def get(self, mac):
+        """Return the stored OS type for the MAC, or None if unknown, stale or uncertain."""
+        with self.lock:
+            row = self.db.execute("SELECT os_type, confidence, updated_at FROM fingerprints WHERE mac = ?",
+                                  (str(mac),)).fetchone()
+        if row is None or row[1] < self.min_confidence:
+            self.counts["misses"] += 1
+            return None
+        if time.time() - row[2] > self.max_age:
+            self.counts["stale"] += 1
+            return None
+        self.counts["hits"] += 1
+        return row[0]
+
+    def put(self, mac, ip, os_type, confidence, source):
+        with self.lock:
+            # A weaker guess never replaces a stronger fresh result
+            self.db.execute("INSERT INTO fingerprints (mac, ip, os_type, confidence, source, updated_at) "
+                            "VALUES (?, ?, ?, ?, ?, ?) "
+                            "ON CONFLICT (mac) DO UPDATE SET ip = excluded.ip, os_type = excluded.os_type, "
+                            "confidence = excluded.confidence, source = excluded.source, "
+                            "updated_at = excluded.updated_at "
+                            "WHERE excluded.confidence >= fingerprints.confidence "
+                            "OR fingerprints.updated_at < ?",
+                            (str(mac), str(ip), os_type, confidence, source, time.time(),
+                             time.time() - self.max_age))
+            self.db.commit()
+        self.counts["stored"] += 1
+
+    def classify(self, mac, ttl=None):
+        """Return (os_type, confidence, source) from the store or a confident guess, else None.
+
+        Guesses are not stored here, as the caller knows the address to store them with.
+        """
+        os_type = self.get(mac)
+        if os_type is not None:
+            return os_type, None, "stored"
+        guess = guess_os(mac, ttl)
+        if guess is None or guess[1] < self.min_confidence:
+            return None
+        self.counts[guess[2]] = self.counts.get(guess[2], 0) + 1
+        return guess
+
+    def metrics(self, params=None):
+        with self.lock:
+            stored = self.db.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+        return dict(self.counts, fingerprints=stored)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
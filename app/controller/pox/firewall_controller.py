@@ -1,16 +1,22 @@
 from pox.core import core
 import pox.openflow.libopenflow_01 as of
+import pox.openflow.nicira as nx
 import requests
 from pox.lib.addresses import IPAddr
-import json
-import sqlite3
 import time
-import os
 import traceback
-from threading import Thread
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from threading import Thread, Event
 from pox.lib.revent import EventMixin
+from pox.lib.util import dpid_to_str
+from pox.lib.recoco import Timer
+from pox.lib.packet.ethernet import ethernet
+from sync_scheduler import SyncScheduler
+from flow_programmer import FlowProgrammer
+from flow_stats import FlowStatsCollector, format_flow
+from reconciler import FlowReconciler
+from reactive_realizer import ReactiveRealizer
+from policy_index import PolicyIndex
+from rule_compiler import RuleCompiler, CompiledRule, compile_rules, POLICY_TABLE, RULE_COOKIE_MASK, VERSION_COOKIE_MASK
 import logging
 
 log = core.getLogger()
@@ -25,58 +31,145 @@ log.addHandler(console_handler)
 # Set the logging level to capture messages of desired severity
 log.setLevel(logging.DEBUG)  # Set the desired logging level
 
-db_path = "/home/ubuntu/prosec/instance/app.db"
+# Seconds the controller API waits for a lookup handed to the POX thread
+LOOKUP_TIMEOUT = 5
 
-class DBChangeHandler(FileSystemEventHandler):
-    def __init__(self, controller):
-        self.controller = controller
+class ChangeFeedWatcher(Thread):
+    """Long-polls the management plane change feed and hands new entries to the controller.
 
-    def on_modified(self, event):
-        if event.src_path.endswith(db_path):
-            log.info("Detected change in database")
-            self.controller.handle_db_change()
+    Entries are applied on the POX thread through core.callLater; the watcher only
+    tracks the cursor it has already received.
+    """
+    def __init__(self, controller, url, since, wait=20):
+        super(ChangeFeedWatcher, self).__init__(daemon=True)
+        self.controller = controller
+        self.url = url
+        self.since = since
+        self.wait = wait
+        self.session = requests.Session()
+
+    def run(self):
+        backoff = 1
+        while True:
+            try:
+                response = self.session.get(self.url, params={"since": self.since, "timeout": self.wait},
+                                            timeout=self.wait + 10)
+                response.raise_for_status()
+                feed = response.json()
+                backoff = 1
+            except Exception as e:
+                log.error("Error polling change feed: %s", e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+
+            if feed.get("reset"):
+                log.info("Change feed reset at sequence %s", feed["last_seq"])
+                core.callLater(self.controller.handle_feed_reset, feed["last_seq"])
+            elif feed.get("changes"):
+                log.info("Received %d changes up to sequence %s", len(feed["changes"]), feed["last_seq"])
+                core.callLater(self.controller.apply_changes, feed["changes"])
+            self.since = feed.get("last_seq", self.since)
 
 class FirewallController(EventMixin):
-    def __init__(self):
+    def __init__(self, sync_debounce=0.2, sync_max_latency=2.0, multi_table=False, pipeline_threshold=64,
+                 batch_size=256, max_in_flight=4, stats_timeout=5.0, stats_ttl=2.0, reconcile_interval=60,
+                 barrier_timeout=10.0, nicira=False, reactive=False, reactive_idle_timeout=10, reactive_hard_timeout=0):
         super(FirewallController, self).__init__()
         self.listenTo(core.openflow)        
         log.info("FirewallController initialized and listeners added.")
         self.rule_url = "http://localhost:5000/prosec/api/firewall/rules"
         self.group_url = "http://localhost:5000/prosec/api/groups"
+        self.change_url = "http://localhost:5000/prosec/api/changes"
+        self.etags = {}  # url -> ETag of the copy last fetched, sent back as If-None-Match
+        self.not_modified = 0  # Fetches answered with 304
+
+        # Read the feed position before the snapshot so no change falls in between;
+        # replaying a change the snapshot already contains is harmless
+        self.change_seq = self.fetch(self.change_url).get("last_seq", 0)
         self.rules, self.groups = self.fetch_rules_and_groups()
+        # Membership by address and rules by group, kept up to date with every change so a
+        # sync only re-expands the rules whose groups changed
+        self.index = PolicyIndex()
+        self.index.load(self.rules, self.groups)
         self.connections = {}
-        self.flow_stats = []
+        self.realized_flows = {}  # dpid -> {flow key: flow entry} last pushed to the switch
+        self.sync_generation = 0  # Bumped on every sync so reconciliation can discard stale comparisons
+
+        # Multi-table pipelines and cookie-masked deletes need the Nicira extensions (Open vSwitch)
+        self.multi_table = multi_table
+        self.nicira = nicira or multi_table
+        if reactive and multi_table:
+            log.warning("Reactive mode installs group rules per flow, ignoring multi_table")
+            self.multi_table = multi_table = False
+        self.desired_flows = {}  # Flow table of the last sync, used to spot rules worth retiring and to reconcile
+        self.rule_generations = {}  # rule id -> generation, bumped to retire a rule's flows with one delete
+        self.cookie_deletes = 0
+        self.compiler = RuleCompiler(multi_table=multi_table, pipeline_threshold=pipeline_threshold)
+        self.compile_stats = {}
+
+        # Realized flow tables are read back with one stats round across all switches
+        self.stats_collector = FlowStatsCollector(timeout=stats_timeout, ttl=stats_ttl)
+
+        # Switches are programmed concurrently, each paced by its own barrier replies
+        self.programmer = FlowProgrammer(batch_size=batch_size, max_in_flight=max_in_flight,
+                                         barrier_timeout=barrier_timeout)
+
+        # Periodically compare flow stats to the desired state and repair only the differences;
+        # unanswered barriers are swept on the same timer, or on their own when reconciling is off
+        self.reconciler = FlowReconciler(self)
+        if reconcile_interval:
+            self.reconcile_timer = Timer(reconcile_interval, self.reconcile, recurring=True)
+        else:
+            self.reconcile_timer = Timer(barrier_timeout, self.programmer.expire_barriers, recurring=True)
+
+        # Optionally realize group rules per flow from packet-ins to bound switch table use;
+        # the handler runs before ArpController so classified packets are not forwarded twice
+        self.reactive = None
+        if reactive:
+            self.reactive = ReactiveRealizer(self, idle_timeout=reactive_idle_timeout,
+                                             hard_timeout=reactive_hard_timeout)
+            core.openflow.addListenerByName("PacketIn", self.reactive.handle_packet_in, priority=1)
 
-        # Connect to the SQLite database
-        self.db_conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.db_cur = self.db_conn.cursor()
+        # Switches connecting before the first sync are reconciled against this table
+        self.desired_flows = self.compile_flows()
 
-        # Start file monitoring for the database file
-        self.observer = Observer()
-        self.event_handler = DBChangeHandler(self)
-        self.observer.schedule(self.event_handler, \
-             path=os.path.dirname(db_path), recursive=False)
+        # Bursts of changes collapse into a single realization pass
+        self.sync_scheduler = SyncScheduler(self.sync_flows, debounce=sync_debounce,
+                                            max_latency=sync_max_latency, dispatch=core.callLater)
 
-        self.observer.start()
+        # Follow the change feed instead of re-reading everything on every write
+        self.change_watcher = ChangeFeedWatcher(self, self.change_url, self.change_seq)
+        self.change_watcher.start()
 
     def fetch_rules_and_groups(self):
         try:
             rules_data = self.fetch(self.rule_url)
             groups_data = self.fetch(self.group_url)
-            rules = rules_data.get("rules", [])
+            rules = compile_rules(rules_data.get("rules", []))
             groups = self.convert_groups_to_dict(groups_data.get("groups", []))
             log.info("Fetched firewall rules: %s", rules)
             log.info("Fetched groups: %s", groups)
             return rules, groups
         except Exception as e:
+            # Nothing was loaded, so the next fetch must not be answered with 304
+            self.etags.clear()
             log.error("Error fetching firewall rules and groups: %s", e)
             traceback.print_exc()  # Print traceback for detailed error information
             return [], {}
 
     def fetch(self, url):
-        response = requests.get(url)
+        """GET url as JSON; returns None when the server answers 304 to the ETag of our last copy."""
+        headers = {"If-None-Match": self.etags[url]} if url in self.etags else {}
+        response = requests.get(url, headers=headers)
+        if response.status_code == 304:
+            self.not_modified += 1
+            return None
         if response.status_code == 200:
-            return response.json()
+            data = response.json()
+            if response.headers.get("ETag"):
+                self.etags[url] = response.headers["ETag"]
+            return data
         else:
             log.error("Failed to fetch data from %s: %s", url, response.status_code)
             return {}
@@ -89,167 +182,415 @@ class FirewallController(EventMixin):
 
     def _handle_ConnectionUp(self, event):
         log.info("Switch %s has connected", event.dpid)
-        self.install_rules(event.connection)
-        self.connections[event.dpid] = event.connection
+        if self.multi_table:
+            event.connection.send(nx.nx_flow_mod_table_id())
+
+        # Read the table first and push only what is missing or wrong; the switch
+        # joins self.connections once that comparison is done
+        self.reconciler.reconcile_switch(event.dpid, event.connection)
 
     def _handle_ConnectionDown(self, event):
         log.info("Switch %s has disconnected", event.dpid)
         if event.dpid in self.connections:
             del self.connections[event.dpid]
+        self.realized_flows.pop(event.dpid, None)
+        self.programmer.connection_down(event.dpid)
+        if self.reactive:
+            self.reactive.connection_down(event.dpid)
+
+    def _handle_BarrierIn(self, event):
+        self.programmer.handle_barrier(event)
+
+    def compile_flows(self):
+        """Compile the current rules and groups into the desired flow table.
 
-    def install_rules(self, connection):
+        Returns a dict mapping flow key to the flow entry that realizes it.
+        """
         for rule in self.rules:
-            log.info("Processing rule: %s", rule)
-            src_ips = self.expand_groups_if_needed(rule.get("nw_src"))
-            dst_ips = self.expand_groups_if_needed(rule.get("nw_dst"))
-
-            if not src_ips:
-                src_ips = [None]
-            if not dst_ips:
-                dst_ips = [None]
-
-            for src_ip in src_ips:
-                for dst_ip in dst_ips:
-                    rule_copy = rule.copy()
-                    if src_ip:
-                        rule_copy["nw_src"] = src_ip
-                    if dst_ip:
-                        rule_copy["nw_dst"] = dst_ip
-                    self.install_rule(connection, rule_copy)
-
-    def expand_groups_if_needed(self, field):
-        if field and field.startswith("group:"):
-            group_id = field.split(":")[1]
-            log.info("Expanding group: %s", group_id)
-            if group_id in self.groups:
-                return self.groups[group_id]
-            else:
-                log.error("Group %s not found in groups", group_id)
-                return []
-        return [field] if field else []
+            rule.generation = self.rule_generations.get(rule.id, 0)
+
+        rules = self.rules
+        if self.reactive:
+            # Only the rules that can be installed up front are compiled; the rest are classified per packet
+            rules, reactive_rules = self.reactive.split_rules(self.rules)
+            self.reactive.refresh(reactive_rules, self.groups)
+
+        policy = self.compiler.compile(rules, self.groups, index=self.index)
+        if self.reactive:
+            default = self.reactive.default_entry()
+            if default is not None:
+                policy.flows[default.key] = default
+        self.compile_stats = policy.stats()
+        if self.reactive:
+            self.compile_stats["reactive_rules"] = len(reactive_rules)
+        log.info("Compiled %d rules (%d expanded again) into %d flows (%d classifier, %d pipelined rules), "
+                 "%d with per-IP expansion", len(self.rules), policy.recompiled_rules, policy.flow_count,
+                 policy.classifier_flow_count, policy.pipelined_rules, policy.naive_flow_count)
+        return policy.flows
 
     def handle_db_change(self):
         try:
             log.info("Handling database change...")
-            # Fetch changes from the rules and groups tables
-            new_rules = self.fetch(self.rule_url).get("rules", [])
-            group_changes = self.fetch(self.group_url).get("groups", [])
-            log.info("Fetched group changes: %s", group_changes)
-
-            self.handle_new_rules(new_rules)
-            self.handle_group_changes(group_changes)
+            # Fetch changes from the rules and groups tables; an unchanged list costs a 304 without a body
+            rules_data = self.fetch(self.rule_url)
+            groups_data = self.fetch(self.group_url)
+            if rules_data is None and groups_data is None:
+                log.info("Rules and groups unchanged since the last fetch")
+                return
+            if rules_data is not None:
+                self.handle_new_rules(rules_data.get("rules", []))
+            if groups_data is not None:
+                log.info("Fetched group changes: %s", groups_data.get("groups", []))
+                self.handle_group_changes(groups_data.get("groups", []))
+            self.sync_scheduler.request_sync()
         except Exception as e:
+            self.etags.clear()
             log.error("Error handling database change: %s", e)
             traceback.print_exc()  # Print traceback for detailed error information
 
+    def handle_feed_reset(self, last_seq):
+        # The feed can no longer be replayed from our position, fall back to a full reload
+        self.change_seq = last_seq
+        self.handle_db_change()
+
+    def apply_changes(self, changes):
+        applied = 0
+        for change in changes:
+            if change["seq"] <= self.change_seq:
+                continue
+            try:
+                self.apply_change(change)
+            except Exception as e:
+                log.error("Error applying change %s: %s", change, e)
+            self.change_seq = change["seq"]
+            applied += 1
+
+        if applied:
+            self.sync_scheduler.request_sync()
+
+    def apply_change(self, change):
+        entity, op, data = change["entity"], change["op"], change["data"]
+
+        if entity == "rule":
+            rule_id = data["rule"]["id"] if op == "create" else data["id"]
+            self.rules = [rule for rule in self.rules if rule.id != rule_id]
+            if op == "create":
+                self.rules.append(CompiledRule(data["rule"]))
+            else:
+                self.rule_generations.pop(rule_id, None)
+            self.index.set_rules(self.rules)
+
+        elif entity == "group":
+            group_id = str(data["group_id"])
+            if op == "create":
+                self.index.set_group(group_id, self.groups.setdefault(group_id, []))
+            elif op == "delete":
+                self.groups.pop(group_id, None)
+                self.index.remove_group(group_id)
+
+        elif entity == "group_ip":
+            group_id = str(data["group_id"])
+            ips = self.groups.setdefault(group_id, [])
+            ip_address = data["ip_address"]
+            if op == "add" and ip_address not in ips:
+                ips.append(ip_address)
+                self.index.add_member(group_id, ip_address)
+            elif op == "remove" and ip_address in ips:
+                ips.remove(ip_address)
+                self.index.remove_member(group_id, ip_address)
+            log.debug("Group %s changed, affecting rules %s", group_id, sorted(self.index.affected_rules(group_id)))
+
+        elif entity == "group_ips":
+            # A batch of one group's IP changes, written as a single entry
+            group_id = str(data["group_id"])
+            ips = self.groups.setdefault(group_id, [])
+            removed = set(data["removed"])
+            if removed:
+                ips[:] = [ip_address for ip_address in ips if ip_address not in removed]
+                for ip_address in removed:
+                    self.index.remove_member(group_id, ip_address)
+            current = set(ips)
+            for ip_address in data["added"]:
+                if ip_address not in current:
+                    current.add(ip_address)
+                    ips.append(ip_address)
+                    self.index.add_member(group_id, ip_address)
+            log.debug("Group %s: %d IPs added, %d removed, affecting rules %s", group_id, len(data["added"]),
+                      len(removed), sorted(self.index.affected_rules(group_id)))
+
+        else:
+            log.warning("Ignoring unknown change entity: %s", entity)
+
     def handle_new_rules(self, new_rules):
-        self.rules = new_rules
-        for connection in self.connections.values():
-            self.install_rules(connection)
+        self.rules = compile_rules(new_rules)
+        rule_ids = {rule.id for rule in self.rules}
+        self.rule_generations = {rule_id: generation for rule_id, generation in self.rule_generations.items()
+                                 if rule_id in rule_ids}
+        self.index.set_rules(self.rules)
 
     def handle_group_changes(self, group_changes):
         self.groups = self.convert_groups_to_dict(group_changes)
-        for connection in self.connections.values():
-            self.install_rules(connection)
-
-    def install_rule(self, connection, rule):
-        flow_mod = of.ofp_flow_mod()
-        flow_mod.match = self.create_match(rule)
-
-        if rule["action"] == "allow":
-            flow_mod.actions.append(of.ofp_action_output(port=of.OFPP_NORMAL))
-
-        # Set the priority of the flow_mod
-        flow_mod.priority = rule.get("priority", 0)
-
-        connection.send(flow_mod)
-        log.info("Installed rule: %s", rule)
-
-
-    def create_match(self, rule):
-        try:
-            match = of.ofp_match()
-
-            # Set Ethernet type
-            if "dl_type" in rule and rule["dl_type"] != "any":
-                match.dl_type = int(rule["dl_type"], 0)
-
-            # Set network protocol
-            if "nw_proto" in rule and rule["nw_proto"] != "any":
-                match.nw_proto = self.convert_proto_to_int(rule["nw_proto"])
-
-            # Set source and destination transport ports
-            if "tp_src" in rule and rule["tp_src"] != "any":
-                match.tp_src = int(rule["tp_src"])
-            if "tp_dst" in rule and rule["tp_dst"] != "any":
-                match.tp_dst = int(rule["tp_dst"])
-
-            # Set source IP address
-            if "nw_src" in rule and rule["nw_src"] != "any":
-                match.nw_src = IPAddr(rule["nw_src"])
-
-            # Set destination IP address
-            if "nw_dst" in rule and rule["nw_dst"] != "any":
-                try:
-                    if rule["nw_dst"].startswith("group:"):
-                        dst_ips = self.expand_groups(rule["nw_dst"])
-                        if dst_ips:
-                            match.nw_dst = IPAddr(dst_ips[0])
-                    else:
-                        match.nw_dst = IPAddr(rule["nw_dst"])
-                except Exception as e:
-                    log.error("Invalid IP address string for nw_dst: %s", e)
-
-            return match
-        except Exception as e:
-            log.exception("Error creating match: %s", e)
-            return None
-
-    def convert_proto_to_int(self, proto):
-        if proto == "any":
-            return None
-        elif proto.lower() == "icmp":
-            return 1
-        elif proto.lower() == "udp":
-            return 17
-        elif proto.lower() == "tcp":
-            return 6
+        self.index.set_groups(self.groups)
+
+    def sync_flows(self):
+        # Compile once and push only the delta to every connected switch
+        self.sync_generation += 1
+        desired = self.compile_flows()
+        if self.nicira and self.retire_shrunk_rules(desired):
+            desired = self.compile_flows()
+        self.desired_flows = desired
+        for dpid, connection in list(self.connections.items()):
+            self.sync_connection(dpid, connection, desired)
+
+    def retire_shrunk_rules(self, desired):
+        """Bump the generation of rules that lost more flows than they kept.
+
+        Re-adding the surviving flows under the new cookie and deleting the old
+        generation with one cookie-masked delete then costs fewer flow_mods than
+        deleting every stale flow on its own. Returns whether any rule was bumped.
+        """
+        stale, kept = {}, {}
+        for key, entry in self.desired_flows.items():
+            if entry.rule_id is None:
+                continue
+            counts = kept if key in desired else stale
+            counts[entry.rule_id] = counts.get(entry.rule_id, 0) + 1
+
+        live_rules = {entry.rule_id for entry in desired.values()}
+        retired = [rule_id for rule_id, count in stale.items()
+                   if rule_id in live_rules and count > kept.get(rule_id, 0)]
+        for rule_id in retired:
+            self.rule_generations[rule_id] = self.rule_generations.get(rule_id, 0) + 1
+        if retired:
+            log.info("Retiring the current generation of rules %s", retired)
+        return bool(retired)
+
+    def get_metrics(self, params=None):
+        return {
+            "sync": self.sync_scheduler.metrics(),
+            "compile": self.compile_stats,
+            "change_seq": self.change_seq,
+            "not_modified_fetches": self.not_modified,
+            "connected_switches": len(self.connections),
+            "cookie_deletes": self.cookie_deletes,
+            "switches": self.programmer.metrics(),
+            "drift": self.reconciler.metrics(),
+            "reactive": self.reactive.metrics() if self.reactive else None,
+            "index": self.index.metrics()
+        }
+
+    def reconcile(self):
+        # A switch stuck on a lost barrier would never count as converged and never be reconciled
+        self.programmer.expire_barriers()
+        self.reconciler.reconcile_all()
+
+    def lookup_address(self, params=None):
+        """Controller API provider: the groups and rules an address falls under.
+
+        Runs on the HTTP thread; the index is read on the POX thread, which is the only one changing it.
+        """
+        address = (params or {}).get("ip")
+        if not address:
+            raise ValueError("Missing ip parameter")
+        done = Event()
+        results = []
+
+        def lookup():
+            try:
+                results.append((sorted(self.index.groups_for(address)), self.index.rules_for(address)))
+            except Exception as e:
+                results.append(e)
+            done.set()
+
+        core.callLater(lookup)
+        if not done.wait(LOOKUP_TIMEOUT):
+            raise RuntimeError("Timed out waiting for the policy lookup")
+        if isinstance(results[0], Exception):
+            raise results[0]
+        groups, rules = results[0]
+        return {
+            "ip": address,
+            "groups": groups,
+            "rules": [{"id": rule.id, "priority": rule.priority, "action": rule.action, "side": side}
+                      for rule, side in rules]
+        }
+
+    def sync_connection(self, dpid, connection, desired):
+        realized = self.realized_flows.get(dpid, {})
+        added = modified = deleted = 0
+        messages = []
+
+        for key, entry in desired.items():
+            current = realized.get(key)
+            if current is None:
+                added += 1
+            elif not current.same_actions(entry):
+                # OFPFC_ADD over an identical match and priority replaces the actions
+                modified += 1
+            else:
+                continue
+            messages.append(self.packed_flow_mod(entry, of.OFPFC_ADD))
+
+        # Flows of a deleted rule, or of a retired version of one, go with a single cookie-masked
+        # delete; the ADDs above already moved every surviving flow to its new cookie
+        live_rules = live_versions = ()
+        if self.nicira:
+            live_rules = {entry.cookie & RULE_COOKIE_MASK for entry in desired.values()}
+            live_versions = {entry.cookie & VERSION_COOKIE_MASK for entry in desired.values()}
+        bulk = set()
+        for key, entry in realized.items():
+            if key in desired:
+                continue
+            deleted += 1
+            if not self.nicira or entry.rule_id is None:
+                messages.append(self.packed_flow_mod(entry, of.OFPFC_DELETE_STRICT))
+            elif entry.cookie & RULE_COOKIE_MASK not in live_rules:
+                bulk.add((entry.cookie & RULE_COOKIE_MASK, RULE_COOKIE_MASK))
+            elif entry.cookie & VERSION_COOKIE_MASK not in live_versions:
+                bulk.add((entry.cookie & VERSION_COOKIE_MASK, VERSION_COOKIE_MASK))
+            else:
+                messages.append(self.packed_flow_mod(entry, of.OFPFC_DELETE_STRICT))
+
+        for cookie, mask in sorted(bulk):
+            messages.append(self.cookie_delete(cookie, mask))
+        self.cookie_deletes += len(bulk)
+
+        self.realized_flows[dpid] = desired
+        self.programmer.submit(dpid, connection, messages)
+
+        sent = len(messages)
+        log.info("Synced switch %s: %d added, %d modified, %d deleted (%d cookie-masked deletes), "
+                 "%d flow_mods saved versus full reinstall", dpid, added, modified, deleted, len(bulk),
+                 len(desired) - sent)
+        return sent
+
+    def cookie_delete(self, cookie, mask):
+        """Delete every flow whose cookie matches under the mask, in all tables."""
+        flow_mod = nx.nx_flow_mod(command=of.OFPFC_DELETE, out_port=of.OFPP_NONE)
+        if self.multi_table:
+            flow_mod.table_id = of.OFPTT_ALL
+        flow_mod.match.append(nx.NXM_NX_COOKIE(cookie, mask))
+        return flow_mod.pack()
+
+    def packed_flow_mod(self, entry, command):
+        # Pack once per entry and reuse the bytes for every connected switch
+        packed = entry.packed.get(command)
+        if packed is None:
+            packed = self.create_flow_mod(entry, command).pack()
+            entry.packed[command] = packed
+        return packed
+
+    def create_flow_mod(self, entry, command):
+        if self.multi_table:
+            flow_mod = nx.nx_flow_mod(command=command, table_id=entry.table)
+            flow_mod.match = self.create_nx_match(entry)
         else:
-            return int(proto)
-
-    def get_flow_stats(self):
-        self.flow_stats = []
-        for connection in self.connections.values():
-            connection.send(of.ofp_stats_request(body=of.ofp_flow_stats_request()))
+            flow_mod = of.ofp_flow_mod(command=command)
+            flow_mod.match = self.create_match(entry)
+
+        # Set the priority and the cookie identifying the rule and version
+        flow_mod.priority = entry.priority
+        flow_mod.cookie = entry.cookie
+
+        if command == of.OFPFC_ADD:
+            if entry.action == "allow":
+                flow_mod.actions.append(of.ofp_action_output(port=of.OFPP_NORMAL))
+            elif entry.action == "classify":
+                if entry.set_tag is not None:
+                    flow_mod.actions.append(nx.nx_reg_load(dst=nx.NXM_NX_REG0, value=entry.set_tag, nbits=32))
+                flow_mod.actions.append(nx.nx_action_resubmit.resubmit_table(table=POLICY_TABLE))
+            elif entry.action == "controller":
+                flow_mod.actions.append(of.ofp_action_output(port=of.OFPP_CONTROLLER))
+        return flow_mod
+
+    def create_match(self, entry):
+        match = of.ofp_match()
+
+        # Match fields were parsed when the rule was compiled
+        if entry.dl_type is not None:
+            match.dl_type = entry.dl_type
+        if entry.nw_proto is not None:
+            match.nw_proto = entry.nw_proto
+        if entry.tp_src is not None:
+            match.tp_src = entry.tp_src
+        if entry.tp_dst is not None:
+            match.tp_dst = entry.tp_dst
+        if entry.nw_src is not None:
+            match.nw_src = self.parse_prefix(entry.nw_src)
+        if entry.nw_dst is not None:
+            match.nw_dst = self.parse_prefix(entry.nw_dst)
+        return match
+
+    def create_nx_match(self, entry):
+        match = nx.nx_match()
+        dl_type = entry.dl_type
+        if dl_type is not None:
+            match.append(nx.NXM_OF_ETH_TYPE(dl_type))
+
+        if dl_type == ethernet.ARP_TYPE:
+            src_field, dst_field = nx.NXM_OF_ARP_SPA, nx.NXM_OF_ARP_TPA
+        else:
+            src_field, dst_field = nx.NXM_OF_IP_SRC, nx.NXM_OF_IP_DST
+            if entry.nw_proto is not None:
+                match.append(nx.NXM_OF_IP_PROTO(entry.nw_proto))
+
+        for prefix, nxm_field in ((entry.nw_src, src_field), (entry.nw_dst, dst_field)):
+            if prefix is not None:
+                address, bits = self.parse_prefix(prefix)
+                match.append(nxm_field(address, IPAddr((0xffffffff << (32 - bits)) & 0xffffffff)))
+
+        port_fields = {6: (nx.NXM_OF_TCP_SRC, nx.NXM_OF_TCP_DST),
+                       17: (nx.NXM_OF_UDP_SRC, nx.NXM_OF_UDP_DST),
+                       1: (nx.NXM_OF_ICMP_TYPE, nx.NXM_OF_ICMP_CODE)}.get(entry.nw_proto)
+        for port, nxm_field in zip((entry.tp_src, entry.tp_dst), port_fields or ()):
+            if port is not None:
+                match.append(nxm_field(port))
+
+        if entry.src_tag is not None:
+            match.append(nx.NXM_NX_REG0(entry.src_tag))
+        return match
+
+    def parse_prefix(self, prefix):
+        if "/" in prefix:
+            address, bits = prefix.split("/")
+            return IPAddr(address), int(bits)
+        return IPAddr(prefix), 32
 
     def _handle_FlowStatsReceived(self, event):
-        for flow in event.stats:
-            self.flow_stats.append({
-                "priority": flow.priority,
-                "dl_type": flow.match.dl_type,
-                "nw_proto": flow.match.nw_proto,
-                "tp_src": flow.match.tp_src,
-                "tp_dst": flow.match.tp_dst,
-                "nw_src": str(flow.match.nw_src),
-                "nw_dst": str(flow.match.nw_dst),
-                "actions": [str(action) for action in flow.actions]
-            })
-            log.info("Flow: %s", flow)
-
-    def get_formatted_flow_stats(self):
-        formatted_stats = []
-        for flow in self.flow_stats:
-            rule = {
-                "priority": flow["priority"],
-                "dl_type": flow["dl_type"],
-                "nw_proto": flow["nw_proto"],
-                "tp_src": flow["tp_src"],
-                "tp_dst": flow["tp_dst"],
-                "nw_src": flow["nw_src"],
-                "nw_dst": flow["nw_dst"],
-                "action": "allow" if any("OUTPUT" in action for action in flow["actions"]) else "deny"
+        self.stats_collector.handle_flow_stats(event)
+
+    def _handle_FlowRemoved(self, event):
+        if self.reactive:
+            self.reactive.handle_flow_removed(event)
+
+    def get_realized_flows(self, params=None):
+        """Controller API provider: the flow tables of all switches as JSON.
+
+        Runs on the HTTP thread; the stats round itself is driven on the POX thread.
+        """
+        params = params or {}
+        max_age = float(params["max_age"]) if "max_age" in params else None
+        done = Event()
+        results = []
+
+        def deliver(result):
+            results.append(result)
+            done.set()
+
+        core.callLater(lambda: self.stats_collector.collect(dict(self.connections), deliver, max_age))
+        if not done.wait(self.stats_collector.timeout + 1):
+            raise RuntimeError("Timed out waiting for flow stats")
+
+        result = results[0]
+        return {
+            "collected_at": result["collected_at"],
+            "duration": result["duration"],
+            "timed_out": [dpid_to_str(dpid) for dpid in result["timed_out"]],
+            "switches": {
+                dpid_to_str(dpid): {
+                    "flow_count": len(flows),
+                    "flows": [format_flow(flow) for flow in flows]
+                }
+                for dpid, flows in result["flows"].items()
             }
-            formatted_stats.append(rule)
-        return formatted_stats
-
-
+        }
@@ -0,0 +1,111 @@
+import time
+import logging
+import pox.openflow.libopenflow_01 as of
+
+log = logging.getLogger(__name__)
+
+class DatapathSession(object):
+    __slots__ = ("dpid", "connection", "queue", "pending", "started", "sent", "last_convergence", "batches",
+                 "barrier_timeouts")
+
+    def __init__(self, dpid, connection):
+        self.dpid = dpid
+        self.connection = connection
+        self.queue = []  # Packed flow_mods not yet written to the socket
+        self.pending = {}  # Barrier xid -> (number of flow_mods it confirms, time it was sent)
+        self.started = None  # When the current unconverged work was first submitted
+        self.sent = 0
+        self.last_convergence = None
+        self.batches = 0
+        self.barrier_timeouts = 0
+
+
+class FlowProgrammer(object):
+    """Programs flow_mods on many datapaths at once with per-connection flow control.
+
+    Submitted messages are packed into batches of up to `batch_size` flow_mods and
+    written to the socket in one send, followed by an ofp_barrier_request. At most
+    `max_in_flight` batches per switch wait for a barrier reply; the next batch
+    for a switch goes out as soon as one of its barriers is confirmed. Every switch
+    advances on its own barrier replies, so a slow datapath never holds back the
+    others. A barrier not answered within `barrier_timeout` seconds is given up
+    on by expire_barriers(), so a switch that drops one still drains its queue;
+    the flow_mods of that batch are left to reconciliation. All methods run on
+    the POX thread.
+    """
+    def __init__(self, batch_size=256, max_in_flight=4, barrier_timeout=10.0):
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.barrier_timeout = barrier_timeout
+        self.sessions = {}
+
+    def submit(self, dpid, connection, messages):
+        if not messages:
+            return
+        session = self.sessions.get(dpid)
+        if session is None or session.connection is not connection:
+            session = self.sessions[dpid] = DatapathSession(dpid, connection)
+        if session.started is None:
+            session.started = time.monotonic()
+        session.queue.extend(messages)
+        self._pump(session)
+
+    def _pump(self, session):
+        while session.queue and len(session.pending) < self.max_in_flight:
+            batch = session.queue[:self.batch_size]
+            del session.queue[:self.batch_size]
+
+            barrier = of.ofp_barrier_request()
+            session.pending[barrier.xid] = (len(batch), time.monotonic())
+            session.connection.send(b"".join(batch) + barrier.pack())
+            session.batches += 1
+
+    def handle_barrier(self, event):
+        session = self.sessions.get(event.dpid)
+        if session is None or event.xid not in session.pending:
+            return
+        session.sent += session.pending.pop(event.xid)[0]
+        self._pump(session)
+        self._check_converged(session)
+
+    def expire_barriers(self, now=None):
+        """Drop the barriers that went unanswered for barrier_timeout seconds and send the next batches."""
+        deadline = (time.monotonic() if now is None else now) - self.barrier_timeout
+        for session in list(self.sessions.values()):
+            expired = [xid for xid, (count, sent_at) in session.pending.items() if sent_at <= deadline]
+            if not expired:
+                continue
+            for xid in expired:
+                del session.pending[xid]
+            session.barrier_timeouts += len(expired)
+            log.warning("Switch %s did not answer %d barrier(s) within %.1fs; reconciliation will repair "
+                        "what they confirmed", session.dpid, len(expired), self.barrier_timeout)
+            self._pump(session)
+            self._check_converged(session)
+
+    def _check_converged(self, session):
+        if not session.queue and not session.pending and session.started is not None:
+            session.last_convergence = time.monotonic() - session.started
+            session.started = None
+            log.info("Switch %s converged in %.3fs", session.dpid, session.last_convergence)
+
+    def is_converged(self, dpid):
+        session = self.sessions.get(dpid)
+        return session is None or session.started is None
+
+    def connection_down(self, dpid):
+        self.sessions.pop(dpid, None)
+
+    def metrics(self):
+        return {
+            str(dpid): {
+                "queued": len(session.queue),
+                "in_flight_batches": len(session.pending),
+                "confirmed_flow_mods": session.sent,
+                "batches": session.batches,
+                "barrier_timeouts": session.barrier_timeouts,
+                "converged": session.started is None,
+                "last_convergence_time": session.last_convergence
+            }
+            for dpid, session in list(self.sessions.items())
+        }
@@ -0,0 +1,127 @@
+import time
+import logging
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+
+log = logging.getLogger(__name__)
+
+def format_flow(flow):
+    """Reduce an ofp_flow_stats entry to plain JSON-friendly values."""
+    match = flow.match
+    return {
+        "table_id": flow.table_id,
+        "cookie": flow.cookie,
+        "priority": flow.priority,
+        "dl_type": match.dl_type,
+        "nw_proto": match.nw_proto,
+        "tp_src": match.tp_src,
+        "tp_dst": match.tp_dst,
+        "nw_src": format_prefix(match.get_nw_src()),
+        "nw_dst": format_prefix(match.get_nw_dst()),
+        "action": "allow" if any(isinstance(action, of.ofp_action_output) for action in flow.actions) else "deny",
+        "packet_count": flow.packet_count,
+        "byte_count": flow.byte_count,
+        "duration_sec": flow.duration_sec,
+        "idle_timeout": flow.idle_timeout,
+        "hard_timeout": flow.hard_timeout
+    }
+
+
+def format_prefix(prefix):
+    address, bits = prefix
+    if address is None:
+        return None
+    return str(address) if bits == 32 else "%s/%s" % (address, bits)
+
+
+class StatsRound(object):
+    def __init__(self, dpids):
+        self.started = time.time()
+        self.dpids = frozenset(dpids)
+        self.outstanding = set(dpids)
+        self.results = {}  # dpid -> list of ofp_flow_stats
+        self.callbacks = []
+        self.timer = None
+
+
+class FlowStatsCollector(object):
+    """Collects flow tables from every switch with one request/response round.
+
+    A stats request goes to all switches at once and replies are matched back by
+    xid. The round completes when every switch answered or `timeout` expires, and
+    its result is cached for `ttl` seconds. Callers arriving while a round covering
+    their switches is in progress join it instead of starting another. collect()
+    and the event handler run on the POX thread; callbacks receive the raw
+    ofp_flow_stats per dpid.
+    """
+    def __init__(self, timeout=5.0, ttl=2.0):
+        self.timeout = timeout
+        self.ttl = ttl
+        self.rounds = []  # Rounds still waiting for replies
+        self.xids = {}  # xid -> (round, dpid)
+        self.cached = None
+        self.cached_at = 0
+
+    def cached_result(self, dpids, max_age=None):
+        max_age = self.ttl if max_age is None else max_age
+        if self.cached is not None and time.time() - self.cached_at <= max_age \
+                and dpids <= set(self.cached["flows"]):
+            return self.cached
+        return None
+
+    def collect(self, connections, callback, max_age=None):
+        dpids = frozenset(connections)
+        cached = self.cached_result(dpids, max_age)
+        if cached is not None:
+            return callback(cached)
+
+        stats_round = next((pending for pending in self.rounds if pending.dpids >= dpids), None)
+        if stats_round is None:
+            stats_round = StatsRound(dpids)
+            self.rounds.append(stats_round)
+            for dpid, connection in connections.items():
+                request = of.ofp_stats_request(body=of.ofp_flow_stats_request())
+                self.xids[request.xid] = (stats_round, dpid)
+                connection.send(request)
+            stats_round.timer = core.callDelayed(self.timeout, self._finish, stats_round)
+        stats_round.callbacks.append(callback)
+
+        if not stats_round.outstanding:
+            self._finish(stats_round)
+
+    def handle_flow_stats(self, event):
+        xid = event.ofp[0].xid if isinstance(event.ofp, list) else event.ofp.xid
+        stats_round, dpid = self.xids.pop(xid, (None, None))
+        if stats_round is None:
+            log.debug("Ignoring unsolicited flow stats from %s", event.dpid)
+            return
+        stats_round.results[dpid] = event.stats
+        stats_round.outstanding.discard(dpid)
+        if not stats_round.outstanding:
+            self._finish(stats_round)
+
+    def _finish(self, stats_round):
+        if stats_round not in self.rounds:
+            return  # Already completed
+        self.rounds.remove(stats_round)
+        if stats_round.timer is not None:
+            stats_round.timer.cancel()
+        for xid in [xid for xid, (owner, _) in self.xids.items() if owner is stats_round]:
+            del self.xids[xid]
+        if stats_round.outstanding:
+            log.warning("Flow stats timed out for switches: %s", sorted(stats_round.outstanding))
+
+        result = {
+            "collected_at": stats_round.started,
+            "duration": time.time() - stats_round.started,
+            "flows": stats_round.results,
+            "timed_out": sorted(stats_round.outstanding)
+        }
+        if not stats_round.outstanding:
+            self.cached, self.cached_at = result, time.time()
+
+        for callback in stats_round.callbacks:
+            try:
+                callback(result)
+            except Exception as e:
+                log.exception("Error in flow stats callback: %s", e)
@@ -0,0 +1,112 @@
+import time
+from collections import OrderedDict
+
+class HostEntry(object):
+    __slots__ = ("dpid", "mac", "port", "ip", "os_type", "ttl_checked", "last_seen")
+
+    def __init__(self, dpid, mac, port, ip, last_seen):
+        self.dpid = dpid
+        self.mac = mac
+        self.port = port
+        self.ip = ip
+        self.os_type = None  # Set once the host has been reported
+        self.ttl_checked = False  # Set once a packet's TTL has been tried on the host
+        self.last_seen = last_seen
+
+    def __repr__(self):
+        return "<HostEntry %s %s port=%s ip=%s>" % (self.dpid, self.mac, self.port, self.ip)
+
+
+class HostTable(object):
+    """Hosts learned per switch, keyed by (dpid, mac) and ordered by last sighting.
+
+    Every sighting moves the entry to the end, so expiry and eviction only look at
+    the front: entries not seen for `ttl` seconds are expired by expire(), and
+    learning a new host beyond `capacity` evicts the least recently seen one.
+    Removed entries are returned to the caller so it can report the host as gone.
+    An index by MAC tells whether a host is still known on another switch.
+    """
+    def __init__(self, capacity=100000, ttl=1800):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.entries = OrderedDict()  # (dpid, mac) -> HostEntry, least recently seen first
+        self.by_mac = {}  # mac -> {dpid: HostEntry}
+        self.counts = {"learned": 0, "moved": 0, "readdressed": 0, "expired": 0, "evicted": 0}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, dpid, mac):
+        return self.entries.get((dpid, mac))
+
+    def port_for(self, dpid, mac):
+        entry = self.entries.get((dpid, mac))
+        return entry.port if entry is not None else None
+
+    def learn(self, dpid, mac, port, ip=None, now=None):
+        """Record a sighting and return (entry, previous ip, evicted entries).
+
+        The previous ip is None unless the host was already known under another
+        address; the entry keeps the os_type it was reported with until the caller
+        has reported the old address as gone.
+        """
+        now = time.time() if now is None else now
+        key = (dpid, mac)
+        entry = self.entries.get(key)
+        previous_ip = None
+        evicted = []
+        if entry is None:
+            entry = self.entries[key] = HostEntry(dpid, mac, port, ip, now)
+            self.by_mac.setdefault(mac, {})[dpid] = entry
+            self.counts["learned"] += 1
+            while len(self.entries) > self.capacity:
+                evicted.append(self.remove(next(iter(self.entries))))
+                self.counts["evicted"] += 1
+        else:
+            if entry.port != port:
+                entry.port = port
+                self.counts["moved"] += 1
+            if ip is not None and entry.ip != ip:
+                previous_ip, entry.ip = entry.ip, ip
+                self.counts["readdressed"] += 1
+            entry.last_seen = now
+            self.entries.move_to_end(key)
+        return entry, previous_ip, evicted
+
+    def touch(self, dpid, mac, now=None):
+        entry = self.entries.get((dpid, mac))
+        if entry is not None:
+            entry.last_seen = time.time() if now is None else now
+            self.entries.move_to_end((dpid, mac))
+        return entry
+
+    def expire(self, now=None):
+        """Remove and return the entries not seen for `ttl` seconds."""
+        deadline = (time.time() if now is None else now) - self.ttl
+        expired = []
+        while self.entries:
+            entry = next(iter(self.entries.values()))
+            if entry.last_seen > deadline:
+                break
+            expired.append(self.remove((entry.dpid, entry.mac)))
+        self.counts["expired"] += len(expired)
+        return expired
+
+    def remove(self, key):
+        entry = self.entries.pop(key)
+        sightings = self.by_mac.get(entry.mac)
+        if sightings is not None:
+            sightings.pop(entry.dpid, None)
+            if not sightings:
+                del self.by_mac[entry.mac]
+        return entry
+
+    def known_os_type(self, mac, ip, exclude=None):
+        """The OS type a host was reported with at this address on another switch, if any."""
+        for entry in self.by_mac.get(mac, {}).values():
+            if entry is not exclude and entry.ip == ip and entry.os_type is not None:
+                return entry.os_type
+        return None
+
+    def metrics(self, params=None):
+        return dict(self.counts, hosts=len(self.entries), capacity=self.capacity, ttl=self.ttl)
@@ -1,10 +1,12 @@
 import logging
 import sys
 from pox.core import core
+from pox.lib.util import str_to_bool
 
 #importing controller classes
 from arp_controller import ArpController
 from firewall_controller import FirewallController
+from controller_api import ControllerApi
 
 # Initialize logging
 log = core.getLogger()
@@ -15,15 +17,64 @@ ch.setFormatter(formatter)
 log.addHandler(ch)
 
 # Start the core components
-def launch():
+# Options are given on the command line, e.g. ./pox.py main_controller --sync_debounce=0.5
+def launch(api_port=8081, sync_debounce=0.2, sync_max_latency=2.0, multi_table=False, pipeline_threshold=64,
+           batch_size=256, max_in_flight=4, stats_timeout=5.0, stats_ttl=2.0, reconcile_interval=60,
+           barrier_timeout=10.0, nicira=False, reactive=False, reactive_idle_timeout=10, reactive_hard_timeout=0,
+           event_queue_size=10000, event_batch_size=100, event_flush_interval=0.5,
+           host_capacity=100000, host_ttl=1800, host_expiry_interval=60,
+           flow_idle_timeout=10, flow_hard_timeout=60, arp_flood_window=1.0,
+           os_scan_workers=4, os_scan_per_subnet=2, os_scan_cache_ttl=86400,
+           fingerprint_db='/home/ubuntu/prosec/fingerprints.db', fingerprint_max_age=7 * 86400,
+           fingerprint_min_confidence=0.7):
     try:
-        core.registerNew(ArpController)
+        api = core.registerNew(ControllerApi, port=int(api_port))
+    except Exception as e:
+        log.exception("An error occurred while starting the controller API: %s", e)
+        api = None
+
+    try:
+        arp = core.registerNew(ArpController, event_queue_size=int(event_queue_size),
+                               event_batch_size=int(event_batch_size),
+                               event_flush_interval=float(event_flush_interval),
+                               host_capacity=int(host_capacity),
+                               host_ttl=float(host_ttl),
+                               host_expiry_interval=float(host_expiry_interval),
+                               flow_idle_timeout=int(flow_idle_timeout),
+                               flow_hard_timeout=int(flow_hard_timeout),
+                               arp_flood_window=float(arp_flood_window),
+                               os_scan_workers=int(os_scan_workers),
+                               os_scan_per_subnet=int(os_scan_per_subnet),
+                               os_scan_cache_ttl=float(os_scan_cache_ttl),
+                               fingerprint_db=fingerprint_db,
+                               fingerprint_max_age=float(fingerprint_max_age),
+                               fingerprint_min_confidence=float(fingerprint_min_confidence))
+        if api:
+            api.add_route("/events", arp.event_sender.metrics)
+            api.add_route("/hosts", arp.get_metrics)
     except Exception as e:
         log.exception("An error occurred while registering ArpController: %s", e)
     
     try:
-        core.registerNew(FirewallController)
+        firewall = core.registerNew(FirewallController, sync_debounce=float(sync_debounce),
+                                    sync_max_latency=float(sync_max_latency),
+                                    multi_table=str_to_bool(multi_table),
+                                    pipeline_threshold=int(pipeline_threshold),
+                                    batch_size=int(batch_size),
+                                    max_in_flight=int(max_in_flight),
+                                    stats_timeout=float(stats_timeout),
+                                    stats_ttl=float(stats_ttl),
+                                    reconcile_interval=float(reconcile_interval),
+                                    barrier_timeout=float(barrier_timeout),
+                                    nicira=str_to_bool(nicira),
+                                    reactive=str_to_bool(reactive),
+                                    reactive_idle_timeout=int(reactive_idle_timeout),
+                                    reactive_hard_timeout=int(reactive_hard_timeout))
+        if api:
+            api.add_route("/metrics", firewall.get_metrics)
+            api.add_route("/flows", firewall.get_realized_flows)
+            api.add_route("/policy", firewall.lookup_address)
     except Exception as e:
-        log.exception("An error occurred while registering LoadBalancerController: %s", e)
+        log.exception("An error occurred while registering FirewallController: %s", e)
 
 
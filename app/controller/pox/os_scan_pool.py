@@ -0,0 +1,145 @@
+import ipaddress
+import logging
+import multiprocessing
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import RLock
+
+log = logging.getLogger(__name__)
+
+UNKNOWN_OS = "Unknown"
+
+def nmap_scan(ip_address):
+    """Default scanner backend: nmap OS detection, returning the OS family or None.
+
+    Runs in a worker process, so it must stay a module-level function.
+    """
+    import nmap
+    scanner = nmap.PortScanner()
+    scanner.scan(ip_address, arguments='-O')
+    if ip_address not in scanner.all_hosts():
+        return None
+    matches = scanner[ip_address].get('osmatch') or []
+    if not matches:
+        return None
+    # The family ("Windows", "Linux") is what the OS groups are named after
+    classes = matches[0].get('osclass') or []
+    return classes[0].get('osfamily') if classes else matches[0].get('name')
+
+
+class OsScanPool(object):
+    """Runs OS fingerprint scans in a bounded worker pool.
+
+    At most `workers` scans run at once and at most `per_subnet` of them within
+    one /`subnet_prefix` network, so a burst of discoveries on one segment does
+    not flood it with nmap probes; the rest wait in per-subnet queues, up to
+    `max_pending` in total. An address already being scanned is not scanned again
+    and results are cached per (ip, mac) for `cache_ttl` seconds.
+
+    `backend(ip)` returns an OS type or None and runs in a worker process unless
+    `processes` is False (fake backends in tests need not be picklable). Results
+    are handed to `callback(ip, mac, os_type)` through `dispatch`, e.g.
+    core.callLater to get back onto the POX thread.
+    """
+    def __init__(self, callback, backend=nmap_scan, workers=4, per_subnet=2, subnet_prefix=24,
+                 cache_ttl=86400, cache_size=100000, max_pending=10000, processes=True, dispatch=None):
+        self.callback = callback
+        self.backend = backend
+        self.per_subnet = per_subnet
+        self.subnet_prefix = subnet_prefix
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.max_pending = max_pending
+        self.dispatch = dispatch or (lambda function, *args: function(*args))
+        if processes:
+            # Spawned workers do not inherit the controller's threads and sockets
+            self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        # Reentrant: a scan that finishes at once runs its done callback inside submit()
+        self.lock = RLock()
+        self.cache = OrderedDict()  # (ip, mac) -> (os_type, scanned at), oldest first
+        self.in_flight = {}  # ip -> set of macs waiting for its result
+        self.running = {}  # subnet -> scans running
+        self.waiting = {}  # subnet -> deque of ips
+        self.pending = 0
+        self.counts = {"submitted": 0, "scanned": 0, "failed": 0, "deduplicated": 0, "cache_hits": 0,
+                       "rejected": 0}
+
+    def lookup(self, ip, mac):
+        """Return the cached OS type for the host, or None when it has to be scanned."""
+        with self.lock:
+            cached = self.cache.get((ip, mac))
+            if cached is None or time.time() - cached[1] > self.cache_ttl:
+                return None
+            self.counts["cache_hits"] += 1
+            return cached[0]
+
+    def submit(self, ip, mac):
+        """Schedule a scan; returns False if the queue is full."""
+        subnet = ipaddress.ip_network("%s/%s" % (ip, self.subnet_prefix), strict=False)
+        with self.lock:
+            if ip in self.in_flight:
+                self.in_flight[ip].add(mac)
+                self.counts["deduplicated"] += 1
+                return True
+            if self.pending >= self.max_pending:
+                self.counts["rejected"] += 1
+                log.warning("OS scan queue full, not scanning %s", ip)
+                return False
+            self.in_flight[ip] = {mac}
+            self.pending += 1
+            self.counts["submitted"] += 1
+            if self.running.get(subnet, 0) < self.per_subnet:
+                self._start(subnet, ip)
+            else:
+                self.waiting.setdefault(subnet, deque()).append(ip)
+        return True
+
+    def _start(self, subnet, ip):
+        # Called with the lock held
+        self.running[subnet] = self.running.get(subnet, 0) + 1
+        future = self.executor.submit(self.backend, ip)
+        future.add_done_callback(lambda future: self._done(subnet, ip, future))
+
+    def _done(self, subnet, ip, future):
+        try:
+            os_type = future.result()
+        except Exception as e:
+            log.error("OS scan of %s failed: %s", ip, e)
+            os_type = None
+
+        with self.lock:
+            macs = self.in_flight.pop(ip, set())
+            self.pending -= 1
+            self.counts["scanned" if os_type else "failed"] += 1
+            # Only real results are cached; a host that could not be fingerprinted is retried next time
+            if os_type:
+                now = time.time()
+                for mac in macs:
+                    self.cache[(ip, mac)] = (os_type, now)
+                    self.cache.move_to_end((ip, mac))
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+            self.running[subnet] -= 1
+            queue = self.waiting.get(subnet)
+            if queue:
+                self._start(subnet, queue.popleft())
+                if not queue:
+                    del self.waiting[subnet]
+            elif not self.running[subnet]:
+                del self.running[subnet]
+
+        for mac in macs:
+            self.dispatch(self.callback, ip, mac, os_type or UNKNOWN_OS)
+
+    def metrics(self, params=None):
+        with self.lock:
+            return dict(self.counts, pending=self.pending, running=sum(self.running.values()),
+                        cached=len(self.cache))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
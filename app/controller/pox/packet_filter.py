@@ -0,0 +1,36 @@
+# Kept free of POX imports so the check can be benchmarked without it
+ARP_TYPE = 0x0806
+IP_TYPE = 0x0800
+VLAN_TYPE = 0x8100
+ICMP_PROTOCOL = 1
+
+def is_arp_or_icmp(data):
+    """Whether a raw Ethernet frame is ARP or ICMP over IPv4, read without parsing it.
+
+    Only the outer ethertype counts, as ArpController dispatches on packet.type;
+    frames too short to tell are left to the parser.
+    """
+    frame = memoryview(data)
+    if len(frame) < 14:
+        return True
+    ethertype = frame[12] << 8 | frame[13]
+    if ethertype == ARP_TYPE:
+        return True
+    # The IPv4 protocol field is the tenth byte of the header that follows
+    return ethertype == IP_TYPE and (len(frame) < 24 or frame[23] == ICMP_PROTOCOL)
+
+
+def is_ipv4(data):
+    """Whether a raw Ethernet frame carries IPv4, directly or behind one VLAN tag.
+
+    Frames too short to tell are left to the parser.
+    """
+    frame = memoryview(data)
+    if len(frame) < 14:
+        return True
+    ethertype = frame[12] << 8 | frame[13]
+    if ethertype == VLAN_TYPE:
+        if len(frame) < 18:
+            return True
+        ethertype = frame[16] << 8 | frame[17]
+    return ethertype == IP_TYPE
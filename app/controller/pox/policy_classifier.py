@@ -0,0 +1,98 @@
+import bisect
+import ipaddress
+import logging
+from rule_compiler import aggregate_prefixes, IP_TYPE
+
+log = logging.getLogger(__name__)
+
+def split_rules(rules):
+    """Split rules into those installed up front and those realized per flow in reactive mode.
+
+    Returns (proactive, reactive, punt priority). IPv4 is sent to the controller
+    just above the highest group rule priority and per-flow entries go one above
+    that, so every rule below them is decided by the classifier and every rule
+    above them is installed as usual. Catch-all rules are also installed so they
+    keep covering non-IP traffic. Without group rules everything is proactive and
+    the punt priority is None.
+    """
+    ip_rules = [rule for rule in rules if rule.dl_type in (None, IP_TYPE)]
+    group_priorities = [rule.priority for rule in ip_rules
+                        if rule.src_group is not None or rule.dst_group is not None]
+    if not group_priorities:
+        return list(rules), [], None
+
+    punt_priority = max(group_priorities) + 1
+    flow_priority = punt_priority + 1
+    proactive = [rule for rule in rules if rule.dl_type not in (None, IP_TYPE)
+                 or rule.priority > flow_priority or is_catch_all(rule)]
+    reactive = [rule for rule in ip_rules if rule.priority <= flow_priority]
+    return proactive, reactive, punt_priority
+
+
+def is_catch_all(rule):
+    return rule.dl_type is None and rule.nw_proto is None and rule.nw_src == "any" and rule.nw_dst == "any"
+
+
+def address_ranges(prefixes):
+    """Turn aggregated prefixes into sorted (starts, ends) lists of integer addresses."""
+    starts, ends = [], []
+    for prefix in prefixes:
+        network = ipaddress.ip_network(prefix)
+        starts.append(int(network.network_address))
+        ends.append(int(network.broadcast_address))
+    return starts, ends
+
+
+def in_ranges(ranges, address):
+    if ranges is None:
+        return True  # "any"
+    starts, ends = ranges
+    index = bisect.bisect_right(starts, address) - 1
+    return index >= 0 and address <= ends[index]
+
+
+class PolicyClassifier(object):
+    """Answers which rule applies to a single IPv4 packet without expanding groups.
+
+    Each rule keeps its source and destination as sorted ranges of aggregated
+    prefixes, so a lookup costs one binary search per field of every rule tried,
+    highest priority first. Rules referring to a missing or empty group never
+    match, like their proactive counterparts that compile to no flows.
+    """
+    def __init__(self, rules, groups):
+        self.rules = []
+        self.group_ranges = {}  # Each group is aggregated once however many rules use it
+        for rule in sorted(rules, key=lambda rule: -rule.priority):
+            if rule.dl_type not in (None, IP_TYPE):
+                continue
+            src = self.ranges(rule.nw_src, rule.src_group, groups)
+            dst = self.ranges(rule.nw_dst, rule.dst_group, groups)
+            if src == ([], []) or dst == ([], []):
+                continue
+            self.rules.append((rule, src, dst))
+
+    def ranges(self, field, group_id, groups):
+        if group_id is not None:
+            if group_id not in self.group_ranges:
+                self.group_ranges[group_id] = address_ranges(aggregate_prefixes(groups.get(group_id, [])))
+            return self.group_ranges[group_id]
+        if field == "any":
+            return None
+        return address_ranges(aggregate_prefixes([field]))
+
+    def classify(self, nw_proto, nw_src, nw_dst, tp_src=None, tp_dst=None):
+        """Return the highest priority rule matching the packet, or None.
+
+        Addresses are integers; ports are only compared for TCP, UDP and ICMP.
+        """
+        for rule, src, dst in self.rules:
+            if rule.nw_proto is not None and rule.nw_proto != nw_proto:
+                continue
+            if rule.nw_proto in (1, 6, 17):
+                if rule.tp_src is not None and rule.tp_src != tp_src:
+                    continue
+                if rule.tp_dst is not None and rule.tp_dst != tp_dst:
+                    continue
+            if in_ranges(src, nw_src) and in_ranges(dst, nw_dst):
+                return rule
+        return None
@@ -0,0 +1,184 @@
+import ipaddress
+import itertools
+import logging
+from rule_compiler import aggregate_prefixes
+
+log = logging.getLogger(__name__)
+
+MASKS = [(0xffffffff << (32 - length)) & 0xffffffff for length in range(33)]
+
+def parse_member(address):
+    """Return (prefix length, network as integer) for an IPv4 address or CIDR block, or None."""
+    try:
+        network = ipaddress.ip_network(address, strict=False)
+    except ValueError:
+        return None
+    if network.version != 4:
+        return None
+    return network.prefixlen, int(network.network_address)
+
+
+class PolicyIndex(object):
+    """Group membership and rule references, indexed for lookups by address.
+
+    Members are stored as integer networks in one hash table per prefix length, so
+    finding the groups of an address costs one probe per prefix length in use
+    (a single one when groups only hold host addresses). Each group also keeps a
+    version, taken from a counter that only grows, which changes whenever its
+    membership does; the compiler uses it to reuse the flows of rules whose groups
+    did not change. Aggregated prefixes are computed once per group version.
+
+    Nothing here is locked: updates modify the tables in place, so lookups have
+    to run on the POX thread too. Callers on other threads, such as the
+    controller API, hand them over with core.callLater and wait for the result.
+    """
+    def __init__(self):
+        self.versions = itertools.count(1)
+        self.members = {}  # group id -> {address: (prefix length, network)}
+        self.group_versions = {}  # group id -> version
+        self.aggregated = {}  # group id -> (version, aggregated prefixes)
+        self.tables = {}  # prefix length -> {network: {group id: member count}}
+        self.lengths = ()  # Prefix lengths in use, longest first
+        self.rules = {}  # rule id -> CompiledRule
+        self.rules_by_group = {}  # group id -> set of rule ids referring to it
+
+    def load(self, rules, groups):
+        self.set_rules(rules)
+        self.set_groups(groups)
+
+    def set_rules(self, rules):
+        by_group = {}
+        for rule in rules:
+            for group_id in (rule.src_group, rule.dst_group):
+                if group_id is not None:
+                    by_group.setdefault(group_id, set()).add(rule.id)
+        self.rules = {rule.id: rule for rule in rules}
+        self.rules_by_group = by_group
+
+    def set_groups(self, groups):
+        """Bring the index in line with a full group dict; unchanged groups keep their version."""
+        for group_id in [group_id for group_id in self.members if group_id not in groups]:
+            self.remove_group(group_id)
+        for group_id, addresses in groups.items():
+            self.set_group(group_id, addresses)
+
+    def set_group(self, group_id, addresses):
+        current = self.members.get(group_id)
+        wanted = set(addresses)
+        if current is not None and set(current) == wanted:
+            return
+        if current is None:
+            self.members[group_id] = {}
+            self.bump(group_id)
+        for address in set(self.members[group_id]) - wanted:
+            self.remove_member(group_id, address)
+        for address in wanted - set(self.members[group_id]):
+            self.add_member(group_id, address)
+
+    def remove_group(self, group_id):
+        for address in list(self.members.get(group_id, ())):
+            self.remove_member(group_id, address)
+        self.members.pop(group_id, None)
+        self.group_versions.pop(group_id, None)
+        self.aggregated.pop(group_id, None)
+
+    def add_member(self, group_id, address):
+        members = self.members.setdefault(group_id, {})
+        if address in members:
+            return False
+        member = parse_member(address)
+        if member is None:
+            log.error("Ignoring invalid or non-IPv4 address in group %s: %s", group_id, address)
+            return False
+        members[address] = member
+        length, network = member
+        table = self.tables.get(length)
+        if table is None:
+            table = self.tables[length] = {}
+            self.lengths = tuple(sorted(self.tables, reverse=True))
+        counts = table.setdefault(network, {})
+        counts[group_id] = counts.get(group_id, 0) + 1
+        self.bump(group_id)
+        return True
+
+    def remove_member(self, group_id, address):
+        member = self.members.get(group_id, {}).pop(address, None)
+        if member is None:
+            return False
+        length, network = member
+        table = self.tables[length]
+        counts = table[network]
+        counts[group_id] -= 1
+        if not counts[group_id]:
+            del counts[group_id]
+            if not counts:
+                del table[network]
+                if not table:
+                    del self.tables[length]
+                    self.lengths = tuple(sorted(self.tables, reverse=True))
+        self.bump(group_id)
+        return True
+
+    def bump(self, group_id):
+        self.group_versions[group_id] = next(self.versions)
+
+    def group_version(self, group_id):
+        """The membership version of a group; None for no group or a missing one."""
+        return self.group_versions.get(group_id) if group_id is not None else None
+
+    def prefixes(self, group_id):
+        """Aggregated prefixes of a group, or None if it does not exist."""
+        version = self.group_versions.get(group_id)
+        if version is None:
+            return None
+        cached = self.aggregated.get(group_id)
+        if cached is None or cached[0] != version:
+            cached = self.aggregated[group_id] = (version, aggregate_prefixes(self.members[group_id]))
+        return cached[1]
+
+    def size(self, group_id):
+        return len(self.members.get(group_id, ()))
+
+    def affected_rules(self, group_id):
+        return self.rules_by_group.get(group_id, set())
+
+    def groups_for(self, address):
+        """Ids of the groups containing an address (a string or an integer)."""
+        if not isinstance(address, int):
+            address = int(ipaddress.IPv4Address(address))
+        found = set()
+        for length in self.lengths:
+            counts = self.tables.get(length, {}).get(address & MASKS[length])
+            if counts:
+                found.update(counts)
+        return found
+
+    def rules_for(self, address):
+        """The rules matching an address as source or destination, highest priority first.
+
+        Returns (rule, side) pairs, side being "src" or "dst".
+        """
+        address = ipaddress.IPv4Address(address)
+        groups = self.groups_for(int(address))
+        matches = []
+        for rule in list(self.rules.values()):
+            for side, field, group_id in (("src", rule.nw_src, rule.src_group), ("dst", rule.nw_dst, rule.dst_group)):
+                if group_id is not None:
+                    matched = group_id in groups
+                elif field == "any":
+                    matched = True
+                else:
+                    member = parse_member(field)
+                    matched = member is not None and int(address) & MASKS[member[0]] == member[1]
+                if matched:
+                    matches.append((rule, side))
+        matches.sort(key=lambda match: -match[0].priority)
+        return matches
+
+    def metrics(self, params=None):
+        return {
+            "groups": len(self.members),
+            "members": sum(len(members) for members in self.members.values()),
+            "prefix_lengths": list(self.lengths),
+            "rules": len(self.rules)
+        }
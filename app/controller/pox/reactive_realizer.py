@@ -0,0 +1,129 @@
+import ipaddress
+import time
+import logging
+import pox.openflow.libopenflow_01 as of
+from pox.lib.revent import EventHalt
+from pox.lib.packet.ipv4 import ipv4
+from rule_compiler import FlowEntry, make_cookie, flow_priority, is_reactive_cookie, CLASSIFIER_TABLE, IP_TYPE, \
+    REACTIVE_TAG
+from policy_classifier import PolicyClassifier, split_rules
+from packet_filter import is_ipv4
+
+log = logging.getLogger(__name__)
+
+class ReactiveRealizer(object):
+    """Realizes group rules on demand from packet-ins instead of installing every expanded flow.
+
+    Only rules that take precedence over every group rule are installed up front,
+    plus an entry sending the remaining IPv4 traffic to the controller.
+    A packet reaching the controller is classified against an in-memory
+    PolicyClassifier and answered with an exact-match entry for its flow that
+    expires after `idle_timeout` (and `hard_timeout` when set), so switch table use
+    follows the active traffic instead of the group sizes. Installed entries are
+    tracked per switch and re-checked after every policy change; entries whose
+    verdict changed are deleted so their next packet is classified again.
+    """
+    def __init__(self, controller, idle_timeout=10, hard_timeout=0):
+        self.controller = controller
+        self.idle_timeout = idle_timeout
+        self.hard_timeout = hard_timeout
+        self.classifier = PolicyClassifier([], {})
+        self.punt_priority = None  # Switch priority of the entry sending IPv4 to the controller
+        self.flow_priority = None  # Switch priority of per-flow entries, above the punt entry
+        self.installed = {}  # dpid -> {flow key: flow entry} installed from packet-ins
+        self.counts = {"packet_ins": 0, "installed": 0, "unmatched": 0, "invalidated": 0, "expired": 0}
+        self.classify_time = 0.0
+
+    def split_rules(self, rules):
+        """Return the rules installed up front and the rules realized per flow (see policy_classifier.split_rules)."""
+        proactive, reactive, punt_priority = split_rules(rules)
+        self.punt_priority = None if punt_priority is None else flow_priority(punt_priority)
+        self.flow_priority = None if punt_priority is None else flow_priority(punt_priority + 1)
+        return proactive, reactive
+
+    def default_entry(self):
+        if self.punt_priority is None:
+            return None
+        return FlowEntry(None, CLASSIFIER_TABLE, self.punt_priority, "controller", dl_type=IP_TYPE,
+                         cookie=make_cookie(0, 0))
+
+    def refresh(self, rules, groups):
+        """Rebuild the classifier and delete installed entries whose verdict changed."""
+        self.classifier = PolicyClassifier(rules, groups)
+        controller = self.controller
+        for dpid, entries in list(self.installed.items()):
+            stale = [entry for entry in entries.values()
+                     if entry.priority != self.flow_priority or self.entry_cookie(entry) != entry.cookie]
+            for entry in stale:
+                del entries[entry.key]
+            connection = controller.connections.get(dpid)
+            if stale and connection is not None:
+                controller.programmer.submit(dpid, connection,
+                                             [controller.packed_flow_mod(entry, of.OFPFC_DELETE_STRICT) for entry in stale])
+            self.counts["invalidated"] += len(stale)
+
+    def entry_cookie(self, entry):
+        rule = self.classifier.classify(entry.nw_proto, int(ipaddress.IPv4Address(entry.nw_src)),
+                                        int(ipaddress.IPv4Address(entry.nw_dst)), entry.tp_src, entry.tp_dst)
+        return None if rule is None else make_cookie(rule.id, rule.cookie_version, REACTIVE_TAG)
+
+    def handle_packet_in(self, event):
+        # Only IPv4 is classified; anything else is left unparsed for the handlers after this one
+        if not is_ipv4(event.data):
+            return
+        packet = event.parsed
+        ip_packet = packet.find('ipv4') if packet.parsed else None
+        if ip_packet is None:
+            return
+
+        self.counts["packet_ins"] += 1
+        tp_src = tp_dst = None
+        if ip_packet.protocol in (ipv4.TCP_PROTOCOL, ipv4.UDP_PROTOCOL):
+            transport = ip_packet.payload
+            tp_src, tp_dst = transport.srcport, transport.dstport
+        elif ip_packet.protocol == ipv4.ICMP_PROTOCOL:
+            # OpenFlow 1.0 matches the ICMP type and code in the transport port fields
+            tp_src, tp_dst = ip_packet.payload.type, ip_packet.payload.code
+
+        started = time.perf_counter()
+        rule = self.classifier.classify(ip_packet.protocol, ip_packet.srcip.toUnsigned(),
+                                        ip_packet.dstip.toUnsigned(), tp_src, tp_dst)
+        self.classify_time += time.perf_counter() - started
+        if rule is None:
+            # Nothing in the policy covers it; leave the packet to the other handlers as before
+            self.counts["unmatched"] += 1
+            return
+
+        entry = FlowEntry(rule.id, CLASSIFIER_TABLE, self.flow_priority, rule.action, IP_TYPE, ip_packet.protocol,
+                          tp_src, tp_dst, str(ip_packet.srcip), str(ip_packet.dstip),
+                          cookie=make_cookie(rule.id, rule.cookie_version, REACTIVE_TAG))
+        flow_mod = self.controller.create_flow_mod(entry, of.OFPFC_ADD)
+        flow_mod.idle_timeout = self.idle_timeout
+        flow_mod.hard_timeout = self.hard_timeout
+        flow_mod.flags = of.OFPFF_SEND_FLOW_REM
+        flow_mod.data = event.ofp  # Releases the packet that triggered it
+        event.connection.send(flow_mod)
+
+        self.installed.setdefault(event.dpid, {})[entry.key] = entry
+        self.counts["installed"] += 1
+        return EventHalt
+
+    def handle_flow_removed(self, event):
+        removed = event.ofp
+        if not is_reactive_cookie(removed.cookie):
+            return
+        match = removed.match
+        key = (CLASSIFIER_TABLE, removed.priority, match.dl_type, match.nw_proto, match.tp_src, match.tp_dst,
+               str(match.nw_src), str(match.nw_dst), None)
+        if self.installed.get(event.dpid, {}).pop(key, None) is not None:
+            self.counts["expired"] += 1
+
+    def connection_down(self, dpid):
+        self.installed.pop(dpid, None)
+
+    def metrics(self):
+        classified = self.counts["packet_ins"]
+        return dict(self.counts,
+                    active_flows=sum(len(entries) for entries in self.installed.values()),
+                    classifier_rules=len(self.classifier.rules),
+                    avg_classify_time=self.classify_time / classified if classified else None)
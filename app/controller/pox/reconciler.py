@@ -0,0 +1,164 @@
+import time
+import logging
+import pox.openflow.libopenflow_01 as of
+import pox.openflow.nicira as nx
+from rule_compiler import FlowEntry, is_firewall_cookie, is_reactive_cookie, cookie_rule_id
+from flow_stats import format_prefix
+
+log = logging.getLogger(__name__)
+
+def entry_view(entry):
+    """The fields of a desired entry that an OpenFlow 1.0 stats reply reports back."""
+    return (entry.table, entry.priority, entry.dl_type, entry.nw_proto, entry.tp_src, entry.tp_dst,
+            entry.nw_src, entry.nw_dst, entry.cookie)
+
+
+def stats_view(flow):
+    match = flow.match
+    return (flow.table_id, flow.priority, match.dl_type, match.nw_proto, match.tp_src, match.tp_dst,
+            format_prefix(match.get_nw_src()), format_prefix(match.get_nw_dst()), flow.cookie)
+
+
+class FlowReconciler(object):
+    """Detects and repairs drift between the desired and the realized flow tables.
+
+    Flows installed by the firewall carry a cookie encoding the rule id, rule version
+    and source tag, so each reported flow maps back to exactly one desired entry.
+    Missing or altered entries are re-added and unknown firewall flows are deleted;
+    flows without the firewall cookie marker (ARP handling, manual additions) are
+    only counted. Switches still being programmed are skipped for the round.
+    """
+    def __init__(self, controller):
+        self.controller = controller
+        self.rounds = 0
+        self.totals = {"missing": 0, "unexpected": 0, "modified": 0}
+        self.last = {}  # dpid -> drift counts from the most recent comparison
+        self.last_run = None
+
+    def reconcile_all(self):
+        controller = self.controller
+        connections = {dpid: connection for dpid, connection in controller.connections.items()
+                       if controller.programmer.is_converged(dpid)}
+        if not connections:
+            return
+        generation = controller.sync_generation
+        controller.stats_collector.collect(connections, lambda result: self._on_stats(result, connections, generation),
+                                           max_age=0)
+
+    def reconcile_switch(self, dpid, connection):
+        """Bring a newly connected switch in line with the desired state from its current table.
+
+        The desired state is the flow table of the last sync; changes since then are
+        pushed by the pending sync like on every other switch. A switch that does
+        not answer the stats request in time gets the full table.
+        """
+        controller = self.controller
+
+        def on_stats(result):
+            if getattr(connection, "disconnected", False):
+                return
+            controller.connections[dpid] = connection
+            desired = controller.desired_flows
+            if dpid in result["flows"]:
+                self.repair(dpid, connection, result["flows"][dpid], desired)
+            else:
+                controller.realized_flows[dpid] = {}
+                controller.sync_connection(dpid, connection, desired)
+
+        controller.stats_collector.collect({dpid: connection}, on_stats, max_age=0)
+
+    def _on_stats(self, result, connections, generation):
+        self.rounds += 1
+        self.last_run = time.time()
+        if generation != self.controller.sync_generation:
+            log.debug("Policy changed during reconciliation, retrying next round")
+            return
+        for dpid, flows in result["flows"].items():
+            connection = connections.get(dpid)
+            if connection is None or self.controller.connections.get(dpid) is not connection:
+                continue
+            self.repair(dpid, connection, flows, self.controller.realized_flows.get(dpid, {}))
+
+    def repair(self, dpid, connection, flows, desired):
+        controller = self.controller
+        desired_views = {entry_view(entry): entry for entry in desired.values()}
+        seen = set()
+        messages = []
+        readd = []
+        deleted_scopes = set()
+        counts = {"missing": 0, "unexpected": 0, "modified": 0, "foreign": 0}
+
+        for flow in flows:
+            if is_reactive_cookie(flow.cookie):
+                continue  # Per-flow entries from reactive mode expire on their own
+            if not is_firewall_cookie(flow.cookie):
+                counts["foreign"] += 1
+                continue
+            view = stats_view(flow)
+            entry = desired_views.get(view)
+            if entry is None:
+                messages.append(self.delete_flow(flow))
+                if controller.nicira:
+                    deleted_scopes.add((flow.table_id, flow.cookie))
+                counts["unexpected"] += 1
+                continue
+            seen.add(view)
+            if entry.action in ("allow", "deny") and entry.action != self.reported_action(flow):
+                messages.append(controller.packed_flow_mod(entry, of.OFPFC_ADD))
+                counts["modified"] += 1
+
+        for view, entry in desired_views.items():
+            if view not in seen:
+                messages.append(controller.packed_flow_mod(entry, of.OFPFC_ADD))
+                counts["missing"] += 1
+            elif (entry.table, entry.cookie) in deleted_scopes:
+                # A non-strict delete also takes narrower flows of the same cookie; put wanted ones back after it
+                readd.append(controller.packed_flow_mod(entry, of.OFPFC_ADD))
+        messages.extend(readd)
+
+        controller.realized_flows[dpid] = desired
+        controller.programmer.submit(dpid, connection, messages)
+
+        self.last[dpid] = counts
+        for name in self.totals:
+            self.totals[name] += counts[name]
+        if messages:
+            log.warning("Repaired drift on switch %s: %d missing, %d unexpected, %d modified",
+                        dpid, counts["missing"], counts["unexpected"], counts["modified"])
+        return counts
+
+    def delete_flow(self, flow):
+        """A flow_mod deleting a reported flow that is not in the desired state.
+
+        Stats replies are OpenFlow 1.0 and do not report the table 1 REG0 tag, so
+        with the Nicira extensions an exact delete could miss the entry. The delete
+        is then non-strict, limited to the flow's table and cookie, and matches the
+        reported fields, which the tagged entry narrows.
+        """
+        match = flow.match
+        entry = FlowEntry(cookie_rule_id(flow.cookie), flow.table_id, flow.priority, self.reported_action(flow),
+                          dl_type=match.dl_type, nw_proto=match.nw_proto, tp_src=match.tp_src, tp_dst=match.tp_dst,
+                          nw_src=format_prefix(match.get_nw_src()), nw_dst=format_prefix(match.get_nw_dst()),
+                          cookie=flow.cookie)
+        if not self.controller.nicira:
+            return self.controller.create_flow_mod(entry, of.OFPFC_DELETE_STRICT).pack()
+        flow_mod = nx.nx_flow_mod(command=of.OFPFC_DELETE, out_port=of.OFPP_NONE)
+        if self.controller.multi_table:
+            flow_mod.table_id = flow.table_id
+        flow_mod.match = self.controller.create_nx_match(entry)
+        flow_mod.match.append(nx.NXM_NX_COOKIE(flow.cookie, 0xffffffffffffffff))
+        return flow_mod.pack()
+
+    def reported_action(self, flow):
+        for action in flow.actions:
+            if isinstance(action, of.ofp_action_output) and action.port == of.OFPP_NORMAL:
+                return "allow"
+        return "deny" if not flow.actions else "other"
+
+    def metrics(self):
+        return {
+            "rounds": self.rounds,
+            "last_run": self.last_run,
+            "total_drift": dict(self.totals),
+            "last_drift": {str(dpid): counts for dpid, counts in self.last.items()}
+        }
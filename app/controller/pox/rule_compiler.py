@@ -0,0 +1,363 @@
+import ipaddress
+import logging
+import zlib
+
+log = logging.getLogger(__name__)
+
+CLASSIFIER_TABLE = 0
+POLICY_TABLE = 1
+
+# Priority bands: every firewall flow sits at least FIREWALL_PRIORITY_BASE, so the learned forwarding
+# flows of ArpController (priority 0, below the band) never tie with a firewall entry, default deny
+# and the table 0 catch-all included. Rule priorities keep their API values and are offset on the switch;
+# the API accepts at most MAX_PRIORITY - FIREWALL_PRIORITY_BASE so no two rule priorities share a flow priority.
+FIREWALL_PRIORITY_BASE = 1
+MAX_PRIORITY = 0xffff
+
+IP_TYPE = 0x0800
+PROTOCOLS = {"icmp": 1, "tcp": 6, "udp": 17}
+
+# Flow cookie layout: firewall marker (bit 63) | rule id (23 bits) | rule version (24 bits) | source tag (16 bits)
+COOKIE_MARKER = 1 << 63
+RULE_ID_MASK = 0x7fffff
+VERSION_MASK = 0xffffff
+TAG_MASK = 0xffff
+
+# Masks selecting every flow of a rule, or of one version of a rule
+RULE_COOKIE_MASK = COOKIE_MARKER | RULE_ID_MASK << 40
+VERSION_COOKIE_MASK = RULE_COOKIE_MASK | VERSION_MASK << 16
+
+# Source tag reserved for per-flow entries installed in reactive mode
+REACTIVE_TAG = TAG_MASK
+
+def make_cookie(rule_id, version, tag=None):
+    return COOKIE_MARKER | ((rule_id or 0) & RULE_ID_MASK) << 40 | (version & VERSION_MASK) << 16 | ((tag or 0) & TAG_MASK)
+
+
+def flow_priority(priority):
+    """The switch priority of a firewall flow for a rule priority.
+
+    Rule priorities above the API limit (MAX_PRIORITY - FIREWALL_PRIORITY_BASE) are clamped and then tie.
+    """
+    return min(priority + FIREWALL_PRIORITY_BASE, MAX_PRIORITY)
+
+
+def is_firewall_cookie(cookie):
+    return bool(cookie & COOKIE_MARKER)
+
+
+def is_reactive_cookie(cookie):
+    return is_firewall_cookie(cookie) and cookie & TAG_MASK == REACTIVE_TAG
+
+
+def cookie_rule_id(cookie):
+    return (cookie >> 40) & RULE_ID_MASK
+
+
+def parse_proto(proto):
+    if proto is None or proto == "any":
+        return None
+    return PROTOCOLS.get(proto.lower()) or int(proto)
+
+
+def _parse_int(value, base=10):
+    if value is None or value == "any":
+        return None
+    return int(value, base)
+
+
+def _group_id(field):
+    if field and field.startswith("group:"):
+        return field.split(":")[1]
+    return None
+
+
+class CompiledRule(object):
+    """A firewall rule normalized once when it is fetched.
+
+    Match fields are parsed into integers up front so compiling flows never
+    re-parses the JSON strings. Source and destination keep their raw form
+    ("any", an address or "group:<id>") because they are expanded per sync.
+    """
+    __slots__ = ("id", "priority", "action", "dl_type", "nw_proto", "tp_src", "tp_dst",
+                 "nw_src", "nw_dst", "src_group", "dst_group", "version", "generation")
+
+    def __init__(self, rule):
+        self.id = rule.get("id")
+        self.priority = int(rule.get("priority") or 0)
+        self.action = rule.get("action", "deny")
+        self.dl_type = _parse_int(rule.get("dl_type"), 0)
+        self.nw_proto = parse_proto(rule.get("nw_proto"))
+        self.tp_src = _parse_int(rule.get("tp_src"))
+        self.tp_dst = _parse_int(rule.get("tp_dst"))
+        self.nw_src = rule.get("nw_src") or "any"
+        self.nw_dst = rule.get("nw_dst") or "any"
+        self.src_group = _group_id(self.nw_src)
+        self.dst_group = _group_id(self.nw_dst)
+
+        # The version only changes when the definition does, and survives controller restarts
+        definition = (self.priority, self.action, self.dl_type, self.nw_proto,
+                      self.tp_src, self.tp_dst, self.nw_src, self.nw_dst)
+        self.version = zlib.crc32(repr(definition).encode()) & VERSION_MASK
+
+        # Bumped by the controller to retire all flows of the rule with one cookie-masked delete
+        self.generation = 0
+
+    @property
+    def cookie_version(self):
+        return (self.version + self.generation) & VERSION_MASK
+
+    def __repr__(self):
+        return "<CompiledRule %s %s %s -> %s prio=%s>" % (self.id, self.action, self.nw_src, self.nw_dst, self.priority)
+
+
+def compile_rules(rules):
+    compiled = []
+    for rule in rules:
+        try:
+            compiled.append(CompiledRule(rule))
+        except (ValueError, TypeError, AttributeError) as e:
+            log.error("Skipping invalid firewall rule %s: %s", rule, e)
+    return compiled
+
+
+class FlowEntry(object):
+    """One flow table entry produced by the compiler.
+
+    `key` identifies the entry on a switch (table, priority and match) and `packed`
+    caches the encoded flow_mod per command, so an entry is packed once per sync
+    no matter how many switches it is sent to. Match fields are normalized to what
+    a switch actually installs: network fields imply IPv4 and transport ports are
+    only kept for TCP, UDP and ICMP.
+    """
+    __slots__ = ("rule_id", "table", "priority", "action", "dl_type", "nw_proto", "tp_src", "tp_dst",
+                 "nw_src", "nw_dst", "src_tag", "set_tag", "cookie", "key", "packed")
+
+    def __init__(self, rule_id, table, priority, action, dl_type=None, nw_proto=None, tp_src=None,
+                 tp_dst=None, nw_src=None, nw_dst=None, src_tag=None, set_tag=None, cookie=0):
+        if dl_type is None and (nw_proto is not None or nw_src is not None or nw_dst is not None):
+            dl_type = IP_TYPE
+        if nw_proto not in (1, 6, 17):
+            tp_src = tp_dst = None
+
+        self.rule_id = rule_id
+        self.table = table
+        self.priority = priority
+        self.action = action
+        self.dl_type = dl_type
+        self.nw_proto = nw_proto
+        self.tp_src = tp_src
+        self.tp_dst = tp_dst
+        self.nw_src = nw_src
+        self.nw_dst = nw_dst
+        self.src_tag = src_tag
+        self.set_tag = set_tag
+        self.cookie = cookie
+        self.key = (table, priority, dl_type, nw_proto, tp_src, tp_dst, nw_src, nw_dst, src_tag)
+        self.packed = {}
+
+    def same_actions(self, other):
+        return self.action == other.action and self.set_tag == other.set_tag and self.cookie == other.cookie
+
+    def __repr__(self):
+        return "<FlowEntry rule=%s table=%s prio=%s %s %s -> %s>" % (
+            self.rule_id, self.table, self.priority, self.action, self.nw_src or "any", self.nw_dst or "any")
+
+
+def aggregate_prefixes(addresses):
+    """Collapse IP addresses and CIDR blocks into the minimal list of prefixes.
+
+    Host prefixes are returned as plain addresses, wider ones in a.b.c.d/n form.
+    """
+    networks = []
+    for address in addresses:
+        try:
+            network = ipaddress.ip_network(address, strict=False)
+        except ValueError:
+            log.error("Ignoring invalid address in group: %s", address)
+            continue
+        if network.version != 4:
+            log.error("Ignoring non-IPv4 address in group: %s", address)
+            continue
+        networks.append(network)
+    return [_prefix_str(network) for network in ipaddress.collapse_addresses(networks)]
+
+
+def _prefix_str(network):
+    if network.prefixlen == network.max_prefixlen:
+        return str(network.network_address)
+    return str(network)
+
+
+class CompiledPolicy(object):
+    def __init__(self, flows, naive_flow_count, classifier_flow_count, pipelined_rules, recompiled_rules=None):
+        self.flows = flows  # flow key -> flow entry
+        self.naive_flow_count = naive_flow_count  # Flows the per-IP cross product would need
+        self.classifier_flow_count = classifier_flow_count
+        self.pipelined_rules = pipelined_rules
+        self.recompiled_rules = recompiled_rules  # Rules expanded again rather than reused, with an index
+
+    @property
+    def flow_count(self):
+        return len(self.flows)
+
+    def stats(self):
+        return {
+            "flow_count": self.flow_count,
+            "naive_flow_count": self.naive_flow_count,
+            "classifier_flow_count": self.classifier_flow_count,
+            "pipelined_rules": self.pipelined_rules,
+            "recompiled_rules": self.recompiled_rules
+        }
+
+
+class RuleCompiler(object):
+    """Turns group-based firewall rules into a compact flow table.
+
+    Group members are aggregated into minimal CIDR prefixes before expansion. With
+    `multi_table` (Nicira extensions, e.g. Open vSwitch) rules whose source is a
+    group and whose cross product exceeds `pipeline_threshold` are split into two
+    tables: table 0 tags IPv4 packets with the class of source groups their address
+    belongs to (in NXM_NX_REG0) and table 1 matches the tag instead of every source
+    prefix. Everything else falls back to the prefix cross product.
+
+    Given a PolicyIndex, groups are resolved through it and the flows of every
+    rule expanded without the pipeline are kept per rule, keyed by the rule's
+    cookie version and the versions of its groups. A membership change then only
+    expands the rules referring to the changed group again.
+    """
+    def __init__(self, multi_table=False, pipeline_threshold=64):
+        self.multi_table = multi_table
+        self.pipeline_threshold = pipeline_threshold
+        self.rule_flows = {}  # rule id -> (cache key, flow entries)
+
+    def compile(self, rules, groups, index=None):
+        """Compile CompiledRule objects against the group membership dict, or the index if given."""
+        policy_table = POLICY_TABLE if self.multi_table else CLASSIFIER_TABLE
+        naive_flow_count = 0
+        expanded = []
+        pipelined_groups = set()
+
+        for rule in rules:
+            src = self.resolve(rule.nw_src, rule.src_group, groups, index)
+            dst = self.resolve(rule.nw_dst, rule.dst_group, groups, index)
+            naive_flow_count += self.naive_count(rule.src_group, groups, index) * \
+                self.naive_count(rule.dst_group, groups, index)
+
+            pipelined = self.multi_table and rule.src_group is not None and len(src) * len(dst) > self.pipeline_threshold
+            if pipelined:
+                pipelined_groups.add(rule.src_group)
+            expanded.append((rule, src, dst, pipelined))
+
+        flows = {}
+        tags = {}
+        classifier_flow_count = 0
+        if self.multi_table:
+            tags, classifier = self.classify_sources(pipelined_groups, groups)
+            classifier_flow_count = len(classifier)
+            for entry in classifier:
+                flows[entry.key] = entry
+
+        recompiled = 0
+        rule_flows = {}
+        for rule, src, dst, pipelined in expanded:
+            if pipelined:
+                sources = [(None, tag) for tag in tags.get(rule.src_group, [])]
+            else:
+                sources = [(prefix, None) for prefix in src]
+                if index is not None:
+                    key = (rule.version, rule.cookie_version, rule.src_group, rule.dst_group,
+                           index.group_version(rule.src_group), index.group_version(rule.dst_group))
+                    cached = self.rule_flows.get(rule.id)
+                    if cached is None or cached[0] != key:
+                        cached = (key, self.expand(rule, policy_table, sources, dst))
+                        recompiled += 1
+                    rule_flows[rule.id] = cached
+                    for entry in cached[1]:
+                        flows[entry.key] = entry
+                    continue
+
+            for entry in self.expand(rule, policy_table, sources, dst):
+                flows[entry.key] = entry
+
+        if index is not None:
+            self.rule_flows = rule_flows  # Rules gone or pipelined now are forgotten
+        return CompiledPolicy(flows, naive_flow_count, classifier_flow_count,
+                              sum(1 for expansion in expanded if expansion[3]),
+                              recompiled if index is not None else None)
+
+    def expand(self, rule, policy_table, sources, dst):
+        return [FlowEntry(rule.id, policy_table, flow_priority(rule.priority), rule.action, rule.dl_type,
+                          rule.nw_proto, rule.tp_src, rule.tp_dst, nw_src, nw_dst, src_tag,
+                          cookie=make_cookie(rule.id, rule.cookie_version, src_tag))
+                for nw_src, src_tag in sources for nw_dst in dst]
+
+    def resolve(self, field, group_id, groups, index=None):
+        """Return the prefixes a rule field expands to; [None] stands for "any".
+
+        A group that is missing or empty expands to no prefixes, so the rule
+        produces no flows instead of silently matching every address.
+        """
+        if group_id is not None:
+            prefixes = index.prefixes(group_id) if index is not None else \
+                (aggregate_prefixes(groups[group_id]) if group_id in groups else None)
+            if prefixes is None:
+                log.error("Group %s not found in groups", group_id)
+                return []
+            return prefixes
+        if field == "any":
+            return [None]
+        return [field]
+
+    def naive_count(self, group_id, groups, index=None):
+        if group_id is not None:
+            return index.size(group_id) if index is not None else len(groups.get(group_id, []))
+        return 1
+
+    def classify_sources(self, group_ids, groups):
+        """Build the table 0 entries that tag packets with their source group class.
+
+        Addresses are split into disjoint ranges by the exact set of pipelined groups
+        containing them; each distinct set gets a tag. Returns the tags per group id
+        and the classifier entries.
+        """
+        boundaries = {}
+        for group_id in group_ids:
+            for prefix in aggregate_prefixes(groups.get(group_id, [])):
+                network = ipaddress.ip_network(prefix)
+                start, end = int(network.network_address), int(network.broadcast_address) + 1
+                boundaries.setdefault(start, []).append((group_id, 1))
+                boundaries.setdefault(end, []).append((group_id, -1))
+
+        # Sweep the range boundaries, merging adjacent ranges of the same class
+        ranges = []
+        active = {}
+        previous = None
+        for point in sorted(boundaries):
+            members = frozenset(group_id for group_id, count in active.items() if count > 0)
+            if previous is not None and members:
+                if ranges and ranges[-1][2] == members and ranges[-1][1] == previous:
+                    ranges[-1][1] = point
+                else:
+                    ranges.append([previous, point, members])
+            for group_id, delta in boundaries[point]:
+                active[group_id] = active.get(group_id, 0) + delta
+            previous = point
+
+        class_tags = {}
+        entries = []
+        for start, end, members in ranges:
+            tag = class_tags.setdefault(members, len(class_tags) + 1)
+            first, last = ipaddress.IPv4Address(start), ipaddress.IPv4Address(end - 1)
+            for network in ipaddress.summarize_address_range(first, last):
+                entries.append(FlowEntry(None, CLASSIFIER_TABLE, flow_priority(1), "classify", dl_type=IP_TYPE,
+                                         nw_src=_prefix_str(network), set_tag=tag, cookie=make_cookie(0, 0, tag)))
+
+        # Unclassified traffic continues to the policy table untagged
+        entries.append(FlowEntry(None, CLASSIFIER_TABLE, flow_priority(0), "classify", cookie=make_cookie(0, 0)))
+
+        tags = {}
+        for members, tag in class_tags.items():
+            for group_id in members:
+                tags.setdefault(group_id, []).append(tag)
+        return tags, entries
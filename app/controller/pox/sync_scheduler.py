@@ -0,0 +1,94 @@
+import time
+import logging
+from threading import Condition, Thread
+
+log = logging.getLogger(__name__)
+
+class SyncScheduler(object):
+    """Coalesces change notifications into debounced realization passes.
+
+    A pass runs once no notification has arrived for `debounce` seconds, but never
+    later than `max_latency` seconds after the oldest pending notification. The
+    pass itself is handed to `dispatch` (core.callLater on POX) so it runs on the
+    controller thread rather than on the scheduler thread.
+    """
+    def __init__(self, callback, debounce=0.2, max_latency=2.0, dispatch=None):
+        self.callback = callback
+        self.debounce = debounce
+        self.max_latency = max_latency
+        self.dispatch = dispatch or (lambda func, *args: func(*args))
+        self.cond = Condition()
+        self.first_request = None  # Monotonic time of the oldest pending notification
+        self.last_request = None
+        self.pending = 0
+
+        # Metrics
+        self.notification_count = 0
+        self.coalesced_count = 0
+        self.sync_count = 0
+        self.last_latency = 0.0
+        self.max_latency_seen = 0.0
+        self.total_latency = 0.0
+
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def request_sync(self):
+        with self.cond:
+            now = time.monotonic()
+            if self.first_request is None:
+                self.first_request = now
+            else:
+                self.coalesced_count += 1
+            self.last_request = now
+            self.pending += 1
+            self.notification_count += 1
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.first_request is None:
+                    self.cond.wait()
+
+                # Wait out the quiet period, bounded by the latency cap
+                while True:
+                    due = min(self.last_request + self.debounce, self.first_request + self.max_latency)
+                    remaining = due - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+
+                first_request, pending = self.first_request, self.pending
+                self.first_request = None
+                self.pending = 0
+
+            self.dispatch(self._realize, first_request, pending)
+
+    def _realize(self, first_request, pending):
+        try:
+            self.callback()
+        except Exception as e:
+            log.exception("Error during scheduled sync: %s", e)
+        finally:
+            latency = time.monotonic() - first_request
+            with self.cond:
+                self.sync_count += 1
+                self.last_latency = latency
+                self.max_latency_seen = max(self.max_latency_seen, latency)
+                self.total_latency += latency
+            log.info("Sync realized %d notifications in %.3fs", pending, latency)
+
+    def metrics(self):
+        with self.cond:
+            return {
+                "sync_count": self.sync_count,
+                "notification_count": self.notification_count,
+                "coalesced_notification_count": self.coalesced_count,
+                "pending_notifications": self.pending,
+                "last_realization_latency": self.last_latency,
+                "max_realization_latency": self.max_latency_seen,
+                "avg_realization_latency": self.total_latency / self.sync_count if self.sync_count else 0.0,
+                "debounce": self.debounce,
+                "max_latency": self.max_latency
+            }
@@ -1,9 +1,15 @@
 # app/main/__init__.py
 from app import db
 from app.main.models.models import DiscoverOSEventModel
-from celery_worker import notify_services, add_ip_to_group_task, delete_ip_from_group_task
+from celery_worker import notify_services, notify_services_batch, add_ip_to_group_task, \
+    update_group_ips_task, delete_ip_from_group_task
 from sqlalchemy import event
 
+OS_GROUPS = ["windows_group", "linux_group"]
+
+def os_group_name(os_type):
+    return f"{os_type.lower()}_group"
+
 # Define the event listener
 @event.listens_for(DiscoverOSEventModel, 'after_insert')
 def after_event_insert(mapper, connection, target):
@@ -15,21 +21,34 @@ def after_event_insert(mapper, connection, target):
         'os_type': target.os_type,
         'arp': target.arp
     }])
-    os_type = target.os_type.lower()
-    group_name = f"{os_type}_group"
-    if group_name in ["windows_group", "linux_group"]:
+    group_name = os_group_name(target.os_type)
+    if group_name in OS_GROUPS:
         ip_address = target.ipv4
-        # Call the add_ip_to_group_task Celery task
-        add_ip_to_group_task.apply_async(args=[group_name, ip_address])
+        if target.event == 'os_deleted':
+            # The controller aged the host out
+            delete_ip_from_group_task.apply_async(args=[group_name, ip_address])
+        else:
+            # Call the add_ip_to_group_task Celery task
+            add_ip_to_group_task.apply_async(args=[group_name, ip_address])
 
 # Define the event listener for after delete
 @event.listens_for(DiscoverOSEventModel, 'after_delete')
 def after_event_delete(mapper, connection, target):
-    os_type = target.os_type.lower()
-    group_name = f"{os_type}_group"
+    group_name = os_group_name(target.os_type)
 
-    if group_name in ["windows_group", "linux_group"]:
+    if group_name in OS_GROUPS:
         ip_address = target.ipv4
         # Call the delete_ip_from_group_task Celery task
         delete_ip_from_group_task.apply_async(args=[group_name, ip_address])
 
+
+# Bulk inserts bypass the ORM listeners above, so their downstream work is queued here once per batch
+def dispatch_event_batch(events_data):
+    if not events_data:
+        return
+    notify_services_batch.apply_async(args=[events_data])
+    memberships = [[os_group_name(event_data['os_type']), event_data['ipv4'],
+                    'remove' if event_data['event'] == 'os_deleted' else 'add']
+                   for event_data in events_data if os_group_name(event_data['os_type']) in OS_GROUPS]
+    if memberships:
+        update_group_ips_task.apply_async(args=[memberships])
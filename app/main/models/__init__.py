@@ -2,5 +2,5 @@ from flask import Blueprint
 
 models_bp = Blueprint('models', __name__)
 
-from app.main.models import models, firewall_model, grouping_model
+from app.main.models import models, firewall_model, grouping_model, change_model
 
@@ -0,0 +1,11 @@
+from app import db
+
+class ChangeLogModel(db.Model):
+    __tablename__ = 'change_log'
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(32), nullable=False) #rule, group, group_ip or group_ips (a batch of one group's IPs)
+    op = db.Column(db.String(16), nullable=False) #create, delete, add or remove
+    payload = db.Column(db.Text, nullable=False) #JSON encoded change data
+
+    def __repr__(self):
+        return f"<ChangeLogModel {self.seq} {self.entity} {self.op}>"
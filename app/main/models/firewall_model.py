@@ -5,6 +5,8 @@ from sqlalchemy import event
 
 class FirewallRuleModel(db.Model):
     __tablename__ = 'firewall_rules'
+    # Rules are looked up by their full match (e.g. the default rules at startup)
+    __table_args__ = (db.Index('ix_firewall_rules_match', 'nw_dst', 'nw_src', 'tp_dst', 'tp_src', 'nw_proto', 'dl_type'),)
     id = db.Column(db.Integer, primary_key=True)
     dl_type = db.Column(db.String(64), nullable=True)
     nw_proto = db.Column(db.String(64), nullable=True)
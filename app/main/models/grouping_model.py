@@ -14,6 +14,8 @@ class GroupModel(db.Model):
 
 class GroupIPModel(db.Model):
     __tablename__ = 'group_ips'
+    # An address is in a group at most once; also serves every (group, address) lookup
+    __table_args__ = (db.Index('ix_group_ips_group_id_ip_address', 'group_id', 'ip_address', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
     group_id = db.Column(db.Integer, ForeignKey('groups.id'), nullable=False)
     ip_address = db.Column(db.String(64), nullable=False)
@@ -21,3 +23,13 @@ class GroupIPModel(db.Model):
     def __repr__(self):
         return f"<GroupIPModel {self.id} {self.group_id} {self.ip_address}>"
 
+
+class GroupSnapshotModel(db.Model):
+    # Denormalized copy of each group with its IPs, kept in step with group_ips when GROUP_SNAPSHOTS is on
+    __tablename__ = 'group_snapshots'
+    group_id = db.Column(db.Integer, primary_key=True)
+    group_name = db.Column(db.String(64), nullable=False)
+    ips = db.Column(db.Text, nullable=False) #JSON encoded list of IP addresses
+
+    def __repr__(self):
+        return f"<GroupSnapshotModel {self.group_id} {self.group_name}>"
@@ -3,6 +3,8 @@ from sqlalchemy import event
 #import datetime
 
 class DiscoverOSEventModel(db.Model):
+    __table_args__ = (db.Index('ix_discover_os_event_model_ipv4', 'ipv4'),
+                      db.Index('ix_discover_os_event_model_arp', 'arp'))
     id = db.Column(db.Integer, primary_key=True)
     event = db.Column(db.String(50), nullable=False) #os_added or os_removed
     os_type = db.Column(db.String(255), nullable=False)
@@ -0,0 +1,43 @@
+import time
+from flask import request, jsonify, current_app
+from app.main.routes import routes_bp
+from app import db, logger
+from app.main.models.change_model import ChangeLogModel
+from app.utils.change_feed import latest_change_seq, change_to_dict
+
+
+# Route to read the policy change feed, optionally waiting for new entries
+@routes_bp.route('/prosec/api/changes', methods=['GET'])
+def get_changes():
+    since = request.args.get('since', type=int)
+    limit = request.args.get('limit', 1000, type=int)
+    timeout = min(request.args.get('timeout', 0, type=float), current_app.config['CHANGE_FEED_MAX_WAIT'])
+
+    # Without a cursor the caller only wants to know where the feed currently ends
+    if since is None:
+        return jsonify({'changes': [], 'last_seq': latest_change_seq(), 'reset': False}), 200
+
+    deadline = time.monotonic() + timeout
+    while True:
+        oldest = db.session.query(db.func.min(ChangeLogModel.seq)).scalar()
+        last_seq = latest_change_seq()
+
+        # The cursor points into pruned history or past the end of the feed: force a full reload
+        if (oldest is not None and since < oldest - 1) or since > last_seq:
+            logger.info("Change feed cursor %s is out of range, requesting reset", since)
+            return jsonify({'changes': [], 'last_seq': last_seq, 'reset': True}), 200
+
+        changes = ChangeLogModel.query.filter(ChangeLogModel.seq > since) \
+            .order_by(ChangeLogModel.seq).limit(limit).all()
+        if changes or time.monotonic() >= deadline:
+            break
+
+        # Release the connection while waiting so writers are never blocked by a poller
+        db.session.close()
+        time.sleep(current_app.config['CHANGE_FEED_POLL_INTERVAL'])
+
+    return jsonify({
+        'changes': [change_to_dict(change) for change in changes],
+        'last_seq': changes[-1].seq if changes else since,
+        'reset': False
+    }), 200
@@ -1,10 +1,17 @@
+import requests
 from flask import request, jsonify, current_app
 from app.main.routes import routes_bp
 from app import db, logger
 from app.main.models.firewall_model import FirewallRuleModel
 from app.main.models.grouping_model import GroupModel, GroupIPModel
+from app.utils.change_feed import record_change, policy_etag
+from app.utils.listing import list_response
 #from app.controller.pox.an_fw_controller import FirewallController
 
+# The controller installs a rule at its priority + 1 (FIREWALL_PRIORITY_BASE in rule_compiler.py),
+# and OpenFlow priorities are 16 bits, so higher rule priorities would tie on the switch
+MAX_RULE_PRIORITY = 0xffff - 1
+
 # Error handler for all exceptions
 @routes_bp.errorhandler(Exception)
 def handle_error(error):
@@ -21,25 +28,27 @@ def get_group_ips(group_name):
     return []
 
 
+def rule_to_dict(rule):
+    return {
+        "id": rule.id,
+        "priority": rule.priority,
+        "dl_type": rule.dl_type,
+        "nw_proto": rule.nw_proto,
+        "tp_src": rule.tp_src,
+        "tp_dst": rule.tp_dst,
+        "nw_src": rule.nw_src,
+        "nw_dst": rule.nw_dst,
+        "action": rule.action,
+    }
+
+
+RULE_COLUMNS = {name: getattr(FirewallRuleModel, name) for name in
+                ("id", "priority", "dl_type", "nw_proto", "tp_src", "tp_dst", "nw_src", "nw_dst", "action")}
+
 @routes_bp.route('/prosec/api/firewall/rules', methods=['GET'])
 def get_firewall_rules():
-    rules = FirewallRuleModel.query.all()
-    return jsonify({
-        "rules": [
-            {
-                "id": rule.id,
-                "priority": rule.priority,
-                "dl_type": rule.dl_type,
-                "nw_proto": rule.nw_proto,
-                "tp_src": rule.tp_src,
-                "tp_dst": rule.tp_dst,
-                "nw_src": rule.nw_src,
-                "nw_dst": rule.nw_dst,
-                "action": rule.action,
-            }
-            for rule in rules
-        ]
-    })
+    # Same pagination, projection and streaming options as GET /prosec/api/events
+    return list_response("rules", RULE_COLUMNS, "id", etag=policy_etag())
 
 
 @routes_bp.route('/prosec/api/firewall/rules/<int:rule_id>', methods=['DELETE'])
@@ -52,6 +61,7 @@ def delete_firewall_rule(rule_id):
 
         # Delete the rule
         db.session.delete(rule)
+        record_change('rule', 'delete', id=rule_id)
         db.session.commit()
 
         return jsonify({"message": "Firewall rule deleted successfully"}), 200
@@ -70,6 +80,9 @@ def create_firewall_rule():
         for field in required_fields:
             if field not in data:
                 return jsonify({"error": f"'{field}' is required"}), 400
+        priority = data['priority']
+        if isinstance(priority, bool) or not isinstance(priority, int) or not 0 <= priority <= MAX_RULE_PRIORITY:
+            return jsonify({"error": f"'priority' must be an integer from 0 to {MAX_RULE_PRIORITY}"}), 400
 
         # Create a new FirewallRuleModel object
         new_rule = FirewallRuleModel(
@@ -85,6 +98,8 @@ def create_firewall_rule():
 
         # Save the new rule to the database
         db.session.add(new_rule)
+        db.session.flush()
+        record_change('rule', 'create', rule=rule_to_dict(new_rule))
         db.session.commit()
 
         return jsonify({"message": "Firewall rule created successfully", "rule": data}), 201
@@ -92,51 +107,24 @@ def create_firewall_rule():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-'''
+# Route to retrieve the flows actually installed on the switches, as reported by the controller
 @routes_bp.route('/prosec/api/firewall/realized-rules', methods=['GET'])
 def get_realized_firewall_rules():
+    url = current_app.config['CONTROLLER_API_URL'] + '/flows'
     try:
-        controller = core.FirewallController
-        controller.get_flow_stats()
-
-        # Trigger POX to get flow stats
-        #requests.get('http://localhost:8080/get_flow_stats')
-        
-        # Wait for a short time to allow POX to process the request and log the results
-        sleep(2)
-        
-        # Read the flow stats from the POX log (for simplicity)
-        with open('logs/controller.log', 'r') as f:
-            logs = f.readlines()
+        response = requests.get(url, params=request.args, timeout=current_app.config['CONTROLLER_API_TIMEOUT'])
+    except requests.Timeout:
+        logger.error("Timed out waiting for realized rules from %s", url)
+        return jsonify({"error": "Timed out waiting for the controller"}), 504
+    except requests.RequestException as e:
+        logger.error("Error fetching realized rules from %s: %s", url, e)
+        return jsonify({"error": "Controller is not reachable"}), 502
 
-        # Filter the flow stats logs
-        flow_stats = [log for log in logs if 'Flow:' in log]
+    if response.status_code != 200:
+        logger.error("Controller returned %s for realized rules", response.status_code)
+        return jsonify({"error": "Controller failed to collect flow stats"}), 502
 
-        # Format the flow stats
-        formatted_stats = format_flow_stats(flow_stats)
-
-        return jsonify({"realized_rules": formatted_stats}), 200
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return jsonify(response.json()), 200
 
-def format_flow_stats(flow_stats):
-    formatted_stats = []
-    for flow in flow_stats:
-        flow_data = eval(flow.split("Flow: ")[1])
-        rule = {
-            "priority": flow_data["priority"],
-            "dl_type": flow_data["dl_type"],
-            "nw_proto": flow_data["nw_proto"],
-            "tp_src": flow_data["tp_src"],
-            "tp_dst": flow_data["tp_dst"],
-            "nw_src": flow_data["nw_src"],
-            "nw_dst": flow_data["nw_dst"],
-            "action": "allow" if any("OUTPUT" in action for action in flow_data["actions"]) else "deny"
-        }
-        formatted_stats.append(rule)
-    return formatted_stats
-
-'''
 # Other route functions with error handling...
 
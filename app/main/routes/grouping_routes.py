@@ -1,10 +1,17 @@
 # app/main/routes.py
 
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy.orm import selectinload
 from app import db, logger
 from app.main.routes import routes_bp
 
-from app.main.models.grouping_model import GroupModel, GroupIPModel
+from app.main.models.grouping_model import GroupModel, GroupIPModel, GroupSnapshotModel
+from app.utils.change_feed import record_change, policy_etag
+from app.utils.group_membership import update_group_ips
+from app.utils.group_snapshot import refresh_group_snapshots, patch_group_snapshot
+from app.utils.listing import list_response
+from app.utils.upsert import insert_ignore
 
 # Error handler for all exceptions
 @routes_bp.errorhandler(Exception)
@@ -24,22 +31,20 @@ def create_group():
         logger.error("Group name is required")
         return jsonify({'error': 'Group name is required'}), 400
 
-    # Check if group with the same name already exists
-    existing_group = GroupModel.query.filter_by(name=group_name).first()
-    if existing_group:
+    # Create a new group, unless one with the same name already exists
+    logger.info("Creating a new group: %s", group_name)
+    if not insert_ignore(GroupModel.__table__, [{'name': group_name}]):
+        db.session.rollback()
         logger.error("Group with the same name already exists: %s", group_name)
         return jsonify({'error': 'Group with the same name already exists'}), 400
 
-    # Create a new group
-    new_group = GroupModel(name=group_name)
-    logger.info("Creating a new group: %s", group_name)
-
-    # Add the new group to the database
-    db.session.add(new_group)
+    group_id = db.session.query(GroupModel.id).filter_by(name=group_name).scalar()
+    record_change('group', 'create', group_id=group_id, group_name=group_name)
+    refresh_group_snapshots([group_id])
     db.session.commit()
     logger.info("Group created successfully: %s", group_name)
 
-    return jsonify({'message': 'Group created successfully', 'group_id': new_group.id}), 201
+    return jsonify({'message': 'Group created successfully', 'group_id': group_id}), 201
 
 # Route to add an IP address to a group
 @routes_bp.route('/prosec/api/groups/<int:group_id>/ip', methods=['POST'])
@@ -59,22 +64,19 @@ def add_ip_to_group(group_id):
         logger.error("Group does not exist: %s", group_id)
         return jsonify({'error': 'Group does not exist'}), 404
 
-    # Check if IP address is already in the group
-    existing_ip = GroupIPModel.query.filter_by(group_id=group_id, ip_address=ip_address).first()
-    if existing_ip:
+    # Add IP address to the group, unless it is already in it
+    logger.info("Adding IP address %s to group %s", ip_address, group.name)
+    if not insert_ignore(GroupIPModel.__table__, [{'group_id': group_id, 'ip_address': ip_address}]):
+        db.session.rollback()
         logger.error("IP address already exists in the group: %s", ip_address)
         return jsonify({'error': 'IP address already exists in the group'}), 400
 
-    # Add IP address to the group
-    new_ip = GroupIPModel(group_id=group_id, ip_address=ip_address)
-    logger.info("Adding IP address %s to group %s", ip_address, group.name)
-
-    # Add the new IP address to the database
-    db.session.add(new_ip)
+    record_change('group_ip', 'add', group_id=group_id, ip_address=ip_address)
+    patch_group_snapshot(group_id, added=[ip_address])
     db.session.commit()
     logger.info("IP address added to group successfully: %s", ip_address)
 
-    return jsonify({'message': 'IP address added to group successfully', 'ip_address': new_ip.ip_address}), 201
+    return jsonify({'message': 'IP address added to group successfully', 'ip_address': ip_address}), 201
 
 
 @routes_bp.route('/prosec/api/groups/<int:group_id>/ip', methods=['DELETE'])
@@ -99,32 +101,83 @@ def remove_ip_from_group(group_id):
 
     # Delete the IP address from the group
     db.session.delete(existing_ip)
+    record_change('group_ip', 'remove', group_id=group_id, ip_address=ip_address)
+    patch_group_snapshot(group_id, removed=[ip_address])
     db.session.commit()
 
     return jsonify({'message': 'IP address removed from group successfully', 'ip_address': ip_address}), 200
 
 
-# Route to retrieve all groups
-@routes_bp.route('/prosec/api/groups', methods=['GET'])
-def get_all_groups():
-    groups = GroupModel.query.all()
-    group_data = []
+def ip_list(data, field):
+    # A missing field is an empty set; anything but a list of non-empty strings is rejected
+    ips = data.get(field, [])
+    if not isinstance(ips, list) or not all(isinstance(ip, str) and ip for ip in ips):
+        raise ValueError(f"'{field}' must be a list of IP addresses")
+    return ips
+
+# Route to change many IP addresses of a group at once:
+# PATCH {"add": [...], "remove": [...]} or PUT {"ips": [...]} to replace the whole set
+@routes_bp.route('/prosec/api/groups/<int:group_id>/ips', methods=['PUT', 'PATCH'])
+def update_ips_of_group(group_id):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'A JSON object is required'}), 400
+    try:
+        if request.method == 'PUT':
+            replace, add, remove = ip_list(data, 'ips'), (), ()
+        else:
+            replace, add, remove = None, ip_list(data, 'add'), ip_list(data, 'remove')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if set(add) & set(remove):
+        return jsonify({'error': 'IP addresses cannot be both added and removed'}), 400
+
+    group = GroupModel.query.get(group_id)
+    if not group:
+        return jsonify({'error': 'Group does not exist'}), 404
+
+    # One transaction and one change log entry for the whole batch
+    added, removed = update_group_ips(group_id, add=add, remove=remove, replace=replace)
+    if added or removed:
+        record_change('group_ips', 'update', group_id=group_id, added=added, removed=removed)
+        if replace is not None:
+            refresh_group_snapshots([group_id])
+        else:
+            patch_group_snapshot(group_id, added=added, removed=removed)
+    db.session.commit()
+    logger.info("Group %s: %d IP addresses added, %d removed", group.name, len(added), len(removed))
+
+    return jsonify({'message': 'Group IP addresses updated successfully', 'group_id': group_id,
+                    'added': len(added), 'removed': len(removed)}), 200
 
-    for group in groups:
-        ips = [ip.ip_address for ip in group.ips]
-        group_data.append({
-            'group_id': group.id,
-            'group_name': group.name,
-            'ips': ips
-        })
 
-    return jsonify({'groups': group_data})
+GROUP_COLUMNS = {'group_id': GroupModel.id, 'group_name': GroupModel.name}
+SNAPSHOT_COLUMNS = {'group_id': GroupSnapshotModel.group_id, 'group_name': GroupSnapshotModel.group_name,
+                    'ips': GroupSnapshotModel.ips}
+
+def fill_group_ips(rows):
+    # One query for the IPs of every group in the chunk
+    ips = {row['group_id']: [] for row in rows}
+    members = db.session.query(GroupIPModel.group_id, GroupIPModel.ip_address) \
+        .filter(GroupIPModel.group_id.in_(list(ips))).order_by(GroupIPModel.id)
+    for group_id, ip_address in members:
+        ips[group_id].append(ip_address)
+    for row in rows:
+        row['ips'] = ips[row['group_id']]
+
+# Route to retrieve groups with their IPs; supports the same paging and streaming options as events
+@routes_bp.route('/prosec/api/groups', methods=['GET'])
+def get_all_groups():
+    if current_app.config['GROUP_SNAPSHOTS']:
+        # One row per group, IPs included, read in primary key order
+        return list_response('groups', SNAPSHOT_COLUMNS, 'group_id', decoders={'ips': json.loads}, etag=policy_etag())
+    return list_response('groups', GROUP_COLUMNS, 'group_id', extras={'ips': fill_group_ips}, etag=policy_etag())
 
 
 # Route to retrieve IP addresses for a specific group
 @routes_bp.route('/prosec/api/groups/<int:group_id>', methods=['GET'])
 def get_group_ips(group_id):
-    group = GroupModel.query.get(group_id)
+    group = GroupModel.query.options(selectinload(GroupModel.ips)).get(group_id)
     if not group:
         return jsonify({'error': 'Group not found'}), 404
 
@@ -141,6 +194,8 @@ def delete_group(group_id):
 
     # Delete the group from the database
     db.session.delete(group)
+    record_change('group', 'delete', group_id=group_id)
+    refresh_group_snapshots([group_id])
     db.session.commit()
 
     logger.info("Group deleted successfully: %s", group.name)
@@ -1,7 +1,17 @@
+import json
 from flask import request, jsonify, current_app
 from app.main.routes import routes_bp
 from app import db, logger
 from app.main.models.models import DiscoverOSEventModel, ServiceModel
+from app.utils.listing import list_response
+
+EVENT_COLUMNS = {
+    'event_id': DiscoverOSEventModel.id,
+    'event': DiscoverOSEventModel.event,
+    'ipv4': DiscoverOSEventModel.ipv4,
+    'os_type': DiscoverOSEventModel.os_type,
+    'arp': DiscoverOSEventModel.arp
+}
 
 # Error handler for all exceptions
 @routes_bp.errorhandler(Exception)
@@ -9,11 +19,13 @@ def handle_error(error):
     logger.exception("An error occurred: %s", error)
     return jsonify({'error': 'An internal server error occurred'}), 500
 
-# Route to create an event
+# Route to create an event, or a batch of events posted as a JSON array
 @routes_bp.route('/prosec/api/events', methods=['POST'])
 def create_event():
     try:
         data = request.json
+        if isinstance(data, list):
+            return create_events(data)
 
         # Extract data from the request
         event = data.get('event')
@@ -36,24 +48,112 @@ def create_event():
         logger.exception("Error creating event: %s", e)
         return jsonify({'error': 'An error occurred while creating the event'}), 500
 
-# Route to retrieve all events
+def create_events(items):
+    # The whole batch is validated first and committed in one transaction
+    invalid = [index for index, item in enumerate(items) if event_row(item) is None]
+    if invalid:
+        logger.error('Invalid events at %s', invalid)
+        return jsonify({'error': 'event, os_type, ipv4 and arp are required', 'invalid': invalid}), 400
+
+    events_data = insert_events([event_row(item) for item in items])
+    db.session.commit()
+    dispatch_events(events_data)
+    logger.info(f"Created {len(events_data)} events")
+    return jsonify({'message': 'Events created successfully',
+                    'event_ids': [event_data['event_id'] for event_data in events_data]}), 201
+
+# Route to ingest a large batch of events as a JSON array or NDJSON (one event per line)
+@routes_bp.route('/prosec/api/events/bulk', methods=['POST'])
+def create_events_bulk():
+    chunk_size = current_app.config['EVENT_BULK_CHUNK_SIZE']
+    pending = []
+    events_data = []
+
+    try:
+        for line_number, item in read_event_stream():
+            row = event_row(item)
+            if row is None:
+                db.session.rollback()
+                logger.error('Invalid event at line %s: %s', line_number, item)
+                return jsonify({'error': 'event, os_type, ipv4 and arp are required', 'line': line_number}), 400
+            pending.append(row)
+            if len(pending) >= chunk_size:
+                events_data.extend(insert_events(pending))
+                pending = []
+        if pending:
+            events_data.extend(insert_events(pending))
+    except ValueError as e:
+        db.session.rollback()
+        logger.error('Malformed event batch: %s', e)
+        return jsonify({'error': f'Malformed event batch: {e}'}), 400
+
+    if not events_data:
+        return jsonify({'error': 'No events given'}), 400
+
+    db.session.commit()
+    for start in range(0, len(events_data), chunk_size):
+        dispatch_events(events_data[start:start + chunk_size])
+
+    count, first_id, last_id = len(events_data), events_data[0]['event_id'], events_data[-1]['event_id']
+    logger.info(f"Ingested {count} events ({first_id}-{last_id})")
+    return jsonify({'message': 'Events created successfully', 'count': count,
+                    'first_event_id': first_id, 'last_event_id': last_id}), 201
+
+def read_event_stream():
+    """Yield (line number, event) from a JSON array body or an NDJSON stream."""
+    if request.mimetype == 'application/json':
+        items = request.get_json(force=True, silent=True)
+        if not isinstance(items, list):
+            raise ValueError('expected a JSON array of events')
+        for index, item in enumerate(items):
+            yield index + 1, item
+        return
+
+    # NDJSON is read line by line so the request body is never held in memory as a whole
+    for line_number, line in enumerate(request.stream, 1):
+        line = line.strip()
+        if line:
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f'line {line_number}: {e.msg}')
+
+def event_row(item):
+    # Every column of the event table is NOT NULL
+    if not isinstance(item, dict) or not all(item.get(field) for field in ('event', 'os_type', 'ipv4', 'arp')):
+        return None
+    return {'event': item['event'], 'os_type': item['os_type'], 'ipv4': item.get('ipv4'), 'arp': item.get('arp')}
+
+def insert_events(rows):
+    """Insert event rows and return them with their ids.
+
+    Core inserts skip the per-row ORM after_insert listener; callers queue the
+    downstream work with dispatch_events() once the batch is committed.
+    """
+    table = DiscoverOSEventModel.__table__
+    if db.engine.dialect.name != 'sqlite':
+        # Other databases let concurrent writers interleave ids, so each row reports its own
+        return [dict(row, event_id=db.session.execute(table.insert(), row).inserted_primary_key[0]) for row in rows]
+
+    # One executemany, which reports no ids. SQLite holds its database-wide write lock from this insert until the
+    # commit, so no other writer can take ids in between: the batch got the contiguous range ending at the new maximum
+    db.session.execute(table.insert(), rows)
+    last_id = db.session.query(db.func.max(DiscoverOSEventModel.id)).scalar()
+    return [dict(row, event_id=event_id) for event_id, row in zip(range(last_id - len(rows) + 1, last_id + 1), rows)]
+
+def dispatch_events(events_data):
+    try:
+        # Imported here: the Celery worker module imports the app this blueprint is registered on
+        from app.extensions.dcn import dispatch_event_batch
+        dispatch_event_batch(events_data)
+    except Exception as e:
+        logger.exception("Error dispatching %d events: %s", len(events_data), e)
+
+# Route to retrieve events: all of them, a page (?after_id=&limit=) or an NDJSON export (?format=ndjson)
 @routes_bp.route('/prosec/api/events', methods=['GET'])
 def get_events():
     try:
-        # Retrieve all events from the database
-        events = DiscoverOSEventModel.query.all()
-
-        # Convert events to a list of dictionaries
-        events_data = [{
-            'event_id': event.id,
-            'event': event.event,
-            'ipv4': event.ipv4,
-            'os_type': event.os_type,
-            'arp': event.arp
-        } for event in events]
-
-        # Return the list of events as JSON
-        return jsonify({'events': events_data}), 200
+        return list_response('events', EVENT_COLUMNS, 'event_id')
 
     except Exception as e:
         logger.exception("Error retrieving events: %s", e)
@@ -0,0 +1,64 @@
+# app/utils/change_feed.py
+import json
+from threading import Lock
+from flask import current_app
+from app import db
+from app.main.models.change_model import ChangeLogModel
+
+# Entries appended by this process since the log was last pruned
+unpruned_lock = Lock()
+unpruned = 0
+
+def record_change(entity, op, **data):
+    """Append a policy change to the change log in the caller's transaction.
+
+    The entry becomes visible to `GET /prosec/api/changes` when the caller commits,
+    so the change feed never reports a write that was rolled back.
+    """
+    db.session.add(ChangeLogModel(entity=entity, op=op, payload=json.dumps(data)))
+    appended(1)
+
+
+def record_changes(entity, op, items):
+    """Append one change per data dict in `items`, in the caller's transaction like record_change()."""
+    items = list(items)
+    db.session.add_all([ChangeLogModel(entity=entity, op=op, payload=json.dumps(data)) for data in items])
+    appended(len(items))
+
+
+def appended(count):
+    # The log may overshoot the retention bound by an interval's worth of entries, so most writes skip the DELETE
+    global unpruned
+    with unpruned_lock:
+        unpruned += count
+        due = unpruned >= current_app.config['CHANGE_LOG_PRUNE_INTERVAL']
+        if due:
+            unpruned = 0
+    if due:
+        prune_changes()
+
+
+def prune_changes():
+    # Keep only the most recent entries; consumers that fall further behind get a reset
+    retention = current_app.config['CHANGE_LOG_RETENTION']
+    newest = db.session.query(db.func.max(ChangeLogModel.seq)).scalar_subquery()
+    ChangeLogModel.query.filter(ChangeLogModel.seq <= newest - retention).delete(synchronize_session=False)
+
+
+def latest_change_seq():
+    return db.session.query(db.func.max(ChangeLogModel.seq)).scalar() or 0
+
+
+def policy_etag():
+    """ETag of the rules and groups: every policy write appends to the change log, so its newest sequence
+    number only moves when they change."""
+    return f'policy-{latest_change_seq()}'
+
+
+def change_to_dict(change):
+    return {
+        'seq': change.seq,
+        'entity': change.entity,
+        'op': change.op,
+        'data': json.loads(change.payload)
+    }
@@ -0,0 +1,50 @@
+# app/utils/group_membership.py
+from sqlalchemy import select, delete
+from app import db
+from app.main.models.grouping_model import GroupIPModel
+from app.utils.upsert import insert_ignore
+
+CHUNK_SIZE = 500
+
+def chunks(items):
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+
+def update_group_ips(group_id, add=(), remove=(), replace=None):
+    """Change a group's IP addresses in the caller's transaction; returns the (added, removed) lists.
+
+    With `replace` the group ends up with exactly those addresses, otherwise
+    `add` and `remove` are applied. The current members are read with one
+    indexed query per 500 requested addresses (or one for the whole group when
+    replacing), then added with insert_ignore() and removed with a DELETE per
+    500, so the cost is a few statements whatever the size of the batch and the
+    SQL is portable across databases. Addresses already in (or missing from)
+    the group are skipped.
+    """
+    table = GroupIPModel.__table__
+    in_group = table.c.group_id == group_id
+    session = db.session
+    add = list(dict.fromkeys(replace if replace is not None else add))
+
+    if replace is not None:
+        current = session.execute(select(table.c.ip_address).where(in_group).order_by(table.c.id)).scalars().all()
+        wanted = set(add)
+        removed = [ip_address for ip_address in current if ip_address not in wanted]
+    else:
+        requested = list(dict.fromkeys(add + list(remove)))
+        current = []
+        for chunk in chunks(requested):
+            current.extend(session.execute(select(table.c.id, table.c.ip_address)
+                                           .where(in_group, table.c.ip_address.in_(chunk))))
+        remove = set(remove)
+        removed = [ip_address for _, ip_address in sorted(current) if ip_address in remove]
+        current = [ip_address for _, ip_address in current]
+
+    current = set(current)
+    added = [ip_address for ip_address in add if ip_address not in current]
+    # A concurrent writer may have added some of them meanwhile; those are skipped, not duplicated
+    insert_ignore(table, [{'group_id': group_id, 'ip_address': ip_address} for ip_address in added])
+    for chunk in chunks(removed):
+        session.execute(delete(table).where(in_group, table.c.ip_address.in_(chunk)))
+    return added, removed
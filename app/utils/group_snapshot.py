@@ -0,0 +1,64 @@
+# app/utils/group_snapshot.py
+import json
+from flask import current_app
+from app import db
+from app.main.models.grouping_model import GroupModel, GroupIPModel, GroupSnapshotModel
+
+def snapshots_enabled():
+    return current_app.config['GROUP_SNAPSHOTS']
+
+
+def refresh_group_snapshots(group_ids):
+    """Rewrite the snapshot rows of the given groups in the caller's transaction.
+
+    Call it after creating or deleting a group or changing many of its IPs, and
+    before committing, like record_change(); the snapshot then never shows a
+    write that was rolled back. Groups that no longer exist lose their row.
+    Single-IP changes use patch_group_snapshot().
+    """
+    if not snapshots_enabled():
+        return
+    group_ids = sorted(set(group_ids))
+    db.session.flush()  # Pending ORM adds and deletes have to be visible to the queries below
+    for start in range(0, len(group_ids), 500):
+        chunk = group_ids[start:start + 500]
+        names = dict(db.session.query(GroupModel.id, GroupModel.name).filter(GroupModel.id.in_(chunk)))
+        ips = {group_id: [] for group_id in names}
+        for group_id, ip_address in db.session.query(GroupIPModel.group_id, GroupIPModel.ip_address) \
+                .filter(GroupIPModel.group_id.in_(list(names))).order_by(GroupIPModel.id):
+            ips[group_id].append(ip_address)
+
+        GroupSnapshotModel.query.filter(GroupSnapshotModel.group_id.in_(chunk)).delete(synchronize_session=False)
+        if names:
+            db.session.execute(GroupSnapshotModel.__table__.insert(), [
+                {'group_id': group_id, 'group_name': name, 'ips': json.dumps(ips[group_id])}
+                for group_id, name in names.items()])
+
+
+def patch_group_snapshot(group_id, added=(), removed=()):
+    """Apply a few address changes to a group's snapshot row in the caller's transaction.
+
+    Meant for single-IP adds and removes: only the snapshot row is read and
+    rewritten, where refresh_group_snapshots() reads every address of the group
+    again. Added addresses go last, as they have the highest ids. A group
+    without a row gets one built from group_ips instead.
+    """
+    if not snapshots_enabled():
+        return
+    ips = db.session.query(GroupSnapshotModel.ips).filter_by(group_id=group_id).with_for_update().scalar()
+    if ips is None:
+        refresh_group_snapshots([group_id])
+        return
+    removed = set(removed)
+    ips = [ip_address for ip_address in json.loads(ips) if ip_address not in removed]
+    ips.extend(ip_address for ip_address in added if ip_address not in ips)
+    GroupSnapshotModel.query.filter_by(group_id=group_id).update({'ips': json.dumps(ips)},
+                                                                  synchronize_session=False)
+
+
+def rebuild_group_snapshots():
+    """Recreate every snapshot row, e.g. at startup after writes made while snapshots were off."""
+    if not snapshots_enabled():
+        return
+    GroupSnapshotModel.query.delete(synchronize_session=False)
+    refresh_group_snapshots(group_id for (group_id,) in db.session.query(GroupModel.id))
@@ -0,0 +1,140 @@
+# app/utils/listing.py
+import hashlib
+import json
+from flask import request, jsonify, current_app, Response, stream_with_context
+from sqlalchemy import select
+from app import db
+
+def list_response(name, columns, key, extras=None, decoders=None, etag=None):
+    """Serve a list endpoint from plain column selects, never materializing the whole table.
+
+    `columns` maps response fields to table columns and `key` names the integer
+    primary key field used as the cursor. `extras` maps computed fields to a
+    function that fills them in for a chunk of rows (e.g. one query for the IPs
+    of a page of groups), and `decoders` maps fields to a function applied to
+    their stored value. Query parameters:
+
+    - fields=a,b: only return these fields
+    - after_id=N&limit=M: one page of rows with key > N, plus `next_after_id`
+      (null on the last page)
+    - format=ndjson: every row as one JSON line, streamed in chunks
+
+    Without any of them the whole list is returned as before, but streamed in
+    chunks rather than built in memory.
+
+    With an `etag`, responses carry it and a request whose If-None-Match
+    matches gets an empty 304 instead of the list. Read the etag before the
+    rows: a list that changed in between is then only sent again next time.
+    The etag is suffixed with a digest of the parameters above, so a page or
+    projection is never validated against another one's etag.
+    """
+    extras = extras or {}
+    decoders = decoders or {}
+    try:
+        fields = parse_fields(request.args.get('fields'), list(columns) + list(extras))
+        after_id = parse_int('after_id', request.args.get('after_id'), minimum=0)
+        limit = parse_int('limit', request.args.get('limit'), minimum=1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if etag is not None:
+        etag = variant_etag(etag, fields, list(columns) + list(extras), after_id, limit)
+    if etag is not None and etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    response = list_body(name, columns, key, fields, extras, decoders, after_id, limit)
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+def list_body(name, columns, key, fields, extras, decoders, after_id, limit):
+    chunk_size = current_app.config['LIST_CHUNK_SIZE']
+    if request.args.get('format') == 'ndjson':
+        lines = (json.dumps(row) + '\n'
+                 for rows in iter_chunks(columns, key, fields, extras, decoders, after_id, chunk_size) for row in rows)
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+    if limit is not None or after_id is not None:
+        limit = min(limit or current_app.config['LIST_PAGE_SIZE'], current_app.config['LIST_MAX_PAGE_SIZE'])
+        rows, last_key = fetch_chunk(columns, key, fields, extras, decoders, after_id, limit)
+        return jsonify({name: rows, 'next_after_id': last_key if len(rows) == limit else None})
+
+    chunks = iter_chunks(columns, key, fields, extras, decoders, None, chunk_size)
+    return Response(stream_with_context(json_document(name, chunks)), mimetype='application/json')
+
+
+def variant_etag(etag, fields, allowed, after_id, limit):
+    # The plain full list keeps the bare etag; any other body gets its own
+    variant = {'fields': fields if fields != allowed else None, 'after_id': after_id, 'limit': limit,
+               'format': request.args.get('format') or None}
+    if not any(value is not None for value in variant.values()):
+        return etag
+    digest = hashlib.sha1(json.dumps(variant, sort_keys=True).encode()).hexdigest()[:16]
+    return f'{etag}-{digest}'
+
+
+def parse_fields(value, allowed):
+    if not value:
+        return allowed
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def parse_int(name, value, minimum):
+    if value is None or value == '':
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer')
+    if number < minimum:
+        raise ValueError(f'{name} must be at least {minimum}')
+    return number
+
+
+def fetch_chunk(columns, key, fields, extras, decoders, after_id, limit):
+    """Return up to `limit` rows with a key above `after_id`, and the last key read."""
+    # The key is always read, as the cursor, even when it is not a requested field
+    names = [key] + [field for field in fields if field in columns and field != key]
+    statement = select(*[columns[field].label(field) for field in names]).order_by(columns[key]).limit(limit)
+    if after_id is not None:
+        statement = statement.where(columns[key] > after_id)
+    rows = [dict(row._mapping) for row in db.session.execute(statement)]
+    if not rows:
+        return rows, None
+
+    last_key = rows[-1][key]
+    for field, decode in decoders.items():
+        if field in fields:
+            for row in rows:
+                row[field] = decode(row[field])
+    for field, fill in extras.items():
+        if field in fields:
+            fill(rows)
+    # Fields come back in the order they were asked for, without the key unless it was asked for
+    return [{field: row[field] for field in fields} for row in rows], last_key
+
+
+def iter_chunks(columns, key, fields, extras, decoders, after_id, chunk_size):
+    while True:
+        rows, after_id = fetch_chunk(columns, key, fields, extras, decoders, after_id, chunk_size)
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+
+
+def json_document(name, chunks):
+    yield '{"%s": [' % name
+    separator = ''
+    for rows in chunks:
+        for row in rows:
+            yield separator + json.dumps(row)
+            separator = ', '
+    yield ']}'
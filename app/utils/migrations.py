@@ -0,0 +1,45 @@
+# app/utils/migrations.py
+from sqlalchemy import text
+from app import logger
+
+# (version, description, statements), applied in order, each in its own transaction.
+# db.create_all() builds new tables as the models describe them, indexes included;
+# migrations bring databases created by older versions up to the same schema, so
+# every statement has to be a no-op on a database that already has the change.
+MIGRATIONS = [
+    (1, 'Unique group membership and indexes for event and rule lookups', [
+        # The unique index cannot be built over duplicates left by the old check-then-insert paths
+        'DELETE FROM group_ips WHERE id NOT IN (SELECT MIN(id) FROM group_ips GROUP BY group_id, ip_address)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_group_ips_group_id_ip_address ON group_ips (group_id, ip_address)',
+        'CREATE INDEX IF NOT EXISTS ix_discover_os_event_model_ipv4 ON discover_os_event_model (ipv4)',
+        'CREATE INDEX IF NOT EXISTS ix_discover_os_event_model_arp ON discover_os_event_model (arp)',
+        'CREATE INDEX IF NOT EXISTS ix_firewall_rules_match '
+        'ON firewall_rules (nw_dst, nw_src, tp_dst, tp_src, nw_proto, dl_type)',
+    ]),
+]
+
+
+def schema_version(connection):
+    connection.execute(text('CREATE TABLE IF NOT EXISTS schema_version '
+                            '(version INTEGER PRIMARY KEY, description VARCHAR(255) NOT NULL)'))
+    return connection.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+
+
+def run_migrations(engine):
+    """Apply the migrations newer than the version recorded in schema_version; returns the new version."""
+    with engine.begin() as connection:
+        current = schema_version(connection)
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        with engine.begin() as connection:
+            # The web app and the Celery worker both migrate at startup; the first one to get here wins
+            if schema_version(connection) >= version:
+                continue
+            for statement in statements:
+                connection.execute(text(statement))
+            connection.execute(text('INSERT INTO schema_version (version, description) VALUES (:version, :description)'),
+                               {'version': version, 'description': description})
+        logger.info("Applied schema migration %d: %s", version, description)
+        current = version
+    return current
@@ -0,0 +1,15 @@
+# app/utils/upsert.py
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+
+def insert_ignore(table, rows):
+    """Insert rows, skipping those that would violate a unique constraint, in the caller's transaction.
+
+    Replaces check-then-insert: the database decides atomically, so concurrent
+    writers cannot both insert the same row. Returns the number of rows inserted.
+    """
+    if not rows:
+        return 0
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    result = db.session.execute(dialect.insert(table).on_conflict_do_nothing(), rows)
+    return result.rowcount
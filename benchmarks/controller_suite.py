@@ -0,0 +1,214 @@
+"""Throughput and realization benchmarks for ArpController and FirewallController.
+
+Runs the real controllers on the fake POX runtime in harness.py:
+
+- arp: a synthetic ARP/ICMP packet-in stream across many switches
+  (packet-ins/sec, flow_mods and packet_outs sent)
+- firewall: initial realization of a generated rule/group dataset on every
+  switch, single-address group changes (flow_mods per change, realization
+  latency) and switch reconnect churn (time and flow_mods per reconnect)
+
+--memory adds the peak traced allocation per scenario (tracing slows the rest
+down, so compare timings only between runs with the same setting). --json
+prints the results for saving as a baseline, and --baseline compares against
+one, exiting non-zero when a metric regressed by more than --tolerance:
+
+    python benchmarks/controller_suite.py --pox ~/pox --json > baseline.json
+    python benchmarks/controller_suite.py --pox ~/pox --baseline baseline.json
+
+Experimental: like harness.py it has not yet been run against a real POX
+checkout, and no baseline is checked in; check a first run's numbers by hand
+before saving them as one.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import harness
+
+def traced(memory):
+    if memory:
+        tracemalloc.start()
+
+    def stop():
+        if not memory:
+            return {}
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {"peak_memory_mb": peak / 2 ** 20}
+    return stop
+
+
+def arp_scenario(runtime, openflow, args):
+    import arp_controller
+    from os_scan_pool import OsScanPool
+    harness.quiet(arp_controller)
+    openflow.reset()
+    frames = list(harness.packet_in_stream(args.switches, args.hosts, args.packets, seed=args.seed))
+
+    stop = traced(args.memory)
+    controller = arp_controller.ArpController(fingerprint_db=":memory:")
+    # Events are counted instead of posted, and every host fingerprints as Linux without nmap
+    events = []
+    controller.event_sender.send = events.append
+    controller.scanner.shutdown()
+    controller.scanner = OsScanPool(controller.handle_scan_result, backend=lambda ip: "Linux", processes=False,
+                                    dispatch=harness.core.callLater)
+    openflow.add_app(controller)
+    for dpid in range(1, args.switches + 1):
+        openflow.connect(dpid)
+    runtime.run()
+    flow_mods_before, packet_outs_before, _ = openflow.sent()
+
+    started = time.perf_counter()
+    for dpid, port, data in frames:
+        openflow.packet_in(dpid, port, data)
+        runtime.run()
+    elapsed = time.perf_counter() - started
+    while controller.scanner.metrics()["pending"]:
+        time.sleep(0.01)
+    runtime.run()
+
+    flow_mods, packet_outs, _ = openflow.sent()
+    result = {
+        "packet_ins_per_s": len(frames) / elapsed,
+        "flow_mods": flow_mods - flow_mods_before,
+        "packet_outs": packet_outs - packet_outs_before,
+        "events": len(events),
+        "hosts": len(controller.hosts),
+    }
+    result.update(stop())
+    controller.scanner.shutdown()
+    return result
+
+
+def firewall_scenario(runtime, openflow, args):
+    import firewall_controller
+    harness.quiet(firewall_controller)
+    openflow.reset()
+    rules, groups = harness.policy_dataset(args.groups, args.members, args.rules, seed=args.seed)
+
+    class IdleWatcher(object):
+        # Changes are applied by the scenario, not read from a management plane
+        def __init__(self, *args, **kw):
+            pass
+
+        def start(self):
+            pass
+
+    class BenchFirewall(firewall_controller.FirewallController):
+        def fetch(self, url):
+            return {self.rule_url: rules, self.group_url: groups}.get(url, {"last_seq": 0})
+
+    firewall_controller.ChangeFeedWatcher = IdleWatcher
+    stop = traced(args.memory)
+    controller = BenchFirewall(reconcile_interval=0, nicira=args.nicira, multi_table=args.multi_table)
+    openflow.add_app(controller)
+
+    started = time.perf_counter()
+    for dpid in range(1, args.switches + 1):
+        openflow.connect(dpid)
+    runtime.run()
+    initial = time.perf_counter() - started
+    initial_flow_mods = openflow.sent()[0]
+
+    latencies, flow_mods = [], []
+    for change in harness.group_ip_changes(groups, args.changes, seed=args.seed):
+        before = openflow.sent()[0]
+        started = time.perf_counter()
+        controller.apply_change(change)
+        controller.sync_flows()
+        runtime.run()
+        latencies.append(time.perf_counter() - started)
+        flow_mods.append(openflow.sent()[0] - before)
+
+    reconnects, reconnect_flow_mods = [], openflow.sent()[0]
+    for step, dpid in harness.churn_schedule(args.switches, args.churn_rounds, seed=args.seed):
+        started = time.perf_counter()
+        if step == "down":
+            openflow.disconnect(dpid)
+        else:
+            openflow.connect(dpid)
+        runtime.run()
+        if step == "up":
+            reconnects.append(time.perf_counter() - started)
+    reconnect_flow_mods = openflow.sent()[0] - reconnect_flow_mods
+
+    result = {
+        "desired_flows": len(controller.desired_flows),
+        "initial_realization_ms": initial * 1000,
+        "initial_flow_mods": initial_flow_mods,
+        "change_latency_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "change_latency_max_ms": max(latencies) * 1000 if latencies else 0.0,
+        "flow_mods_per_change": statistics.mean(flow_mods) if flow_mods else 0.0,
+        "reconnect_ms": statistics.mean(reconnects) * 1000 if reconnects else 0.0,
+        "flow_mods_per_reconnect": reconnect_flow_mods / len(reconnects) if reconnects else 0.0,
+    }
+    result.update(stop())
+    return result
+
+
+SCENARIOS = {"arp": arp_scenario, "firewall": firewall_scenario}
+
+def regressions(results, baseline, tolerance):
+    """Metrics worse than the baseline by more than the tolerance; rates should not drop, the rest not grow."""
+    found = []
+    for scenario, metrics in baseline.items():
+        for name, old in metrics.items():
+            new = results.get(scenario, {}).get(name)
+            if new is None or not old:
+                continue
+            worse = new < old * (1 - tolerance) if name.endswith("_per_s") else new > old * (1 + tolerance)
+            if worse:
+                found.append("%s.%s: %.2f -> %.2f" % (scenario, name, old, new))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pox", default=os.environ.get("POX_DIR", "~/pox"), help="POX checkout")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("--switches", type=int, default=16)
+    parser.add_argument("--hosts", type=int, default=200, help="hosts per switch")
+    parser.add_argument("--packets", type=int, default=50000)
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--members", type=int, default=200, help="addresses per group")
+    parser.add_argument("--rules", type=int, default=50)
+    parser.add_argument("--changes", type=int, default=50, help="group membership changes")
+    parser.add_argument("--churn-rounds", type=int, default=4)
+    parser.add_argument("--nicira", action="store_true")
+    parser.add_argument("--multi-table", action="store_true")
+    parser.add_argument("--memory", action="store_true", help="trace peak memory")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--baseline", help="results saved with --json to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    print("controller_suite is experimental and unverified against real POX; check results by hand",
+          file=sys.stderr)
+
+    runtime = harness.setup(args.pox)
+    openflow = harness.core.openflow
+    results = {name: SCENARIOS[name](runtime, openflow, args) for name in args.scenarios}
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        for scenario, metrics in results.items():
+            for name, value in sorted(metrics.items()):
+                print("%-10s %-26s %14.2f" % (scenario, name, value))
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            found = regressions(results, json.load(baseline), args.tolerance)
+        for line in found:
+            print("REGRESSION " + line, file=sys.stderr)
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""Fake POX runtime and synthetic workloads for driving the controllers without switches.
+
+The controllers are real; what is faked is everything around them:
+
+- FakeOpenFlow stands in for core.openflow. It hands events straight to the
+  controllers' _handle_* methods (after listeners added by name, by priority)
+  and knows the FakeConnections of connected switches.
+- FakeConnection records every OpenFlow message sent to it, counted by type
+  from the message headers, and answers barrier and flow stats requests the way
+  an empty switch would, so flow programming and reconciliation run to the end.
+- core.callLater and core.callDelayed are replaced by a queue that run() drains
+  on the calling thread, so a scenario is finished when run() returns.
+- recoco's Timer is replaced too, so the controllers' expiry, reconcile and
+  barrier timers only fire when a scenario calls advance(); nothing runs on
+  POX's scheduler thread while a scenario is measured.
+
+POX itself is still needed for its packet and OpenFlow libraries; call
+setup(pox_dir) before anything else.
+
+Experimental: the fakes follow POX's documented interfaces but have not yet
+been exercised against a real POX checkout, so a scenario that fails may be
+the harness's fault rather than the controller's.
+"""
+import functools
+import ipaddress
+import logging
+import os
+import random
+import struct
+import sys
+import time
+from collections import Counter, deque
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "controller", "pox")
+
+# OpenFlow 1.0 message types
+OFPT_VENDOR = 4
+OFPT_PACKET_OUT = 13
+OFPT_FLOW_MOD = 14
+OFPT_STATS_REQUEST = 16
+OFPT_BARRIER_REQUEST = 18
+
+core = None
+of = None
+
+def setup(pox_dir):
+    """Make POX and the controller modules importable and install the fake runtime."""
+    global core, of
+    sys.path.insert(0, os.path.expanduser(pox_dir))
+    sys.path.insert(0, PACKAGE_DIR)
+
+    # The controllers log to a fixed file via basicConfig at import; configuring logging first makes that a no-op
+    logging.basicConfig(level=logging.WARNING)
+
+    import pox.core
+    if pox.core.core is None:
+        pox.core.initialize()
+    core = pox.core.core
+    import pox.openflow.libopenflow_01 as openflow
+    of = openflow
+
+    runtime = FakeRuntime()
+    core.callLater = runtime.call_later
+    core.callDelayed = runtime.call_delayed
+    # The controllers import Timer by name, so this has to happen before they are imported
+    import pox.lib.recoco
+    pox.lib.recoco.Timer = runtime.timer
+    core.register("openflow", FakeOpenFlow(runtime))
+    return runtime
+
+
+def quiet(*modules):
+    # The controllers add a DEBUG console handler of their own
+    for module in modules:
+        module.log.setLevel(logging.WARNING)
+
+
+class FakeTimer(object):
+    def __init__(self, due, function, args, interval=None):
+        self.due = due
+        self.function = function
+        self.args = args
+        self.interval = interval  # Set for recurring timers
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeRuntime(object):
+    """The POX thread: calls scheduled with callLater, run to completion by run().
+
+    Timers run on a virtual clock that only moves with advance().
+    """
+    def __init__(self):
+        self.calls = deque()
+        self.timers = []
+        self.clock = 0.0
+
+    def call_later(self, function, *args, **kw):
+        self.calls.append((function, args, kw))
+
+    def call_delayed(self, seconds, function, *args, **kw):
+        # Only timeouts use this, and the fake switches always answer first
+        timer = FakeTimer(self.clock + seconds, function, args)
+        self.timers.append(timer)
+        return timer
+
+    def timer(self, timeToWake, callback, absoluteTime=False, recurring=False, args=(), kw={}, scheduler=None,
+              started=True, selfStoppable=True):
+        """Stands in for pox.lib.recoco.Timer, taking the same arguments; times are relative to the virtual clock."""
+        function = functools.partial(callback, **kw) if kw else callback
+        timer = FakeTimer(self.clock + timeToWake, function, tuple(args), interval=timeToWake if recurring else None)
+        self.timers.append(timer)
+        return timer
+
+    def advance(self, seconds):
+        """Move the virtual clock, fire the timers that fall due in order and run what they schedule."""
+        target = self.clock + seconds
+        while True:
+            due = [timer for timer in self.timers if not timer.cancelled and timer.due <= target]
+            if not due:
+                break
+            timer = min(due, key=lambda timer: timer.due)
+            self.clock = timer.due
+            if timer.interval:
+                timer.due += timer.interval
+            else:
+                timer.cancel()
+            timer.function(*timer.args)
+            self.run()
+        self.clock = target
+
+    def run(self, timeout=60):
+        """Run scheduled calls, including ones they schedule, until none are left."""
+        deadline = time.monotonic() + timeout
+        while self.calls:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Scenario did not settle within %ss" % timeout)
+            function, args, kw = self.calls.popleft()
+            function(*args, **kw)
+        self.timers = [timer for timer in self.timers if not timer.cancelled]
+
+
+class FakeEvent(object):
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+        self.halt = False
+
+
+class FakePacketIn(FakeEvent):
+    @property
+    def parsed(self):
+        # Parsed on first use, like POX's PacketIn
+        if "_parsed" not in self.__dict__:
+            from pox.lib.packet.ethernet import ethernet
+            self._parsed = ethernet(self.data)
+        return self._parsed
+
+
+class FakeConnection(object):
+    def __init__(self, runtime, openflow, dpid):
+        self.runtime = runtime
+        self.openflow = openflow
+        self.dpid = dpid
+        self.disconnected = False
+        self.counts = Counter()  # OpenFlow message type -> messages sent
+        self.bytes = 0
+
+    def send(self, message):
+        data = message if isinstance(message, bytes) else message.pack()
+        self.bytes += len(data)
+        self.openflow.bytes += len(data)
+        offset = 0
+        # Batches are several messages written at once; walk their headers
+        while offset + 8 <= len(data):
+            _, message_type, length, xid = struct.unpack_from("!BBHL", data, offset)
+            self.counts[message_type] += 1
+            self.openflow.counts[message_type] += 1
+            if message_type == OFPT_BARRIER_REQUEST:
+                self.runtime.call_later(self.openflow.raise_event, "BarrierIn",
+                                        FakeEvent(connection=self, dpid=self.dpid, xid=xid))
+            elif message_type == OFPT_STATS_REQUEST:
+                reply = FakeEvent(xid=xid)
+                self.runtime.call_later(self.openflow.raise_event, "FlowStatsReceived",
+                                        FakeEvent(connection=self, dpid=self.dpid, stats=[], ofp=[reply]))
+            offset += max(length, 8)
+
+    @property
+    def flow_mods(self):
+        # Nicira flow_mods are vendor messages
+        return self.counts[OFPT_FLOW_MOD] + self.counts[OFPT_VENDOR]
+
+
+class FakeOpenFlow(object):
+    _eventMixin_events = set()  # listenTo() binds nothing; events are delivered by raise_event()
+
+    def __init__(self, runtime):
+        self.runtime = runtime
+        self.apps = []
+        self.listeners = []  # (priority, event name, handler)
+        self.connections = {}
+        self.counts = Counter()  # Over all connections, including closed ones
+        self.bytes = 0
+
+    def reset(self):
+        # Each scenario starts without controllers or switches
+        self.__init__(self.runtime)
+
+    def addListenerByName(self, name, handler, priority=0, **kw):
+        self.listeners.append((priority, name, handler))
+        self.listeners.sort(key=lambda listener: -listener[0])
+
+    def add_app(self, app):
+        self.apps.append(app)
+        return app
+
+    def getConnection(self, dpid):
+        return self.connections.get(dpid)
+
+    def raise_event(self, name, event):
+        from pox.lib.revent import EventHalt
+        for _, listener_name, handler in self.listeners:
+            if listener_name == name and handler(event) is EventHalt:
+                return
+        for app in self.apps:
+            handler = getattr(app, "_handle_" + name, None)
+            if handler is not None:
+                handler(event)
+
+    def connect(self, dpid):
+        connection = self.connections[dpid] = FakeConnection(self.runtime, self, dpid)
+        self.raise_event("ConnectionUp", FakeEvent(connection=connection, dpid=dpid))
+        return connection
+
+    def disconnect(self, dpid):
+        connection = self.connections.pop(dpid)
+        connection.disconnected = True
+        self.raise_event("ConnectionDown", FakeEvent(connection=connection, dpid=dpid))
+
+    def packet_in(self, dpid, port, data):
+        connection = self.connections[dpid]
+        ofp = of.ofp_packet_in(in_port=port, data=data, reason=of.OFPR_NO_MATCH)
+        self.raise_event("PacketIn", FakePacketIn(connection=connection, dpid=dpid, port=port, data=data, ofp=ofp))
+
+    def sent(self):
+        """Totals over all connections so far: (flow_mods, packet_outs, bytes)."""
+        return self.counts[OFPT_FLOW_MOD] + self.counts[OFPT_VENDOR], self.counts[OFPT_PACKET_OUT], self.bytes
+
+
+# Workload generators
+
+def host_mac(dpid, host):
+    return "02:%02x:%02x:00:%02x:%02x" % (dpid >> 8 & 0xff, dpid & 0xff, host >> 8 & 0xff, host & 0xff)
+
+
+def host_ip(dpid, host):
+    return "10.%d.%d.%d" % (dpid & 0xff, host >> 8 & 0xff, host & 0xff or 1)
+
+
+def packet_in_stream(switches, hosts, count, icmp_share=0.5, seed=1):
+    """Yield (dpid, port, frame) packet-ins: ARP requests and ICMP echoes between hosts of a switch."""
+    from pox.lib.packet.ethernet import ethernet
+    from pox.lib.packet.arp import arp
+    from pox.lib.packet.ipv4 import ipv4
+    from pox.lib.packet.icmp import icmp, echo
+    from pox.lib.addresses import EthAddr, IPAddr, ETHER_BROADCAST
+
+    rng = random.Random(seed)
+    for _ in range(count):
+        dpid = rng.randint(1, switches)
+        src, dst = rng.randrange(hosts), rng.randrange(hosts)
+        src_mac = EthAddr(host_mac(dpid, src))
+        if rng.random() < icmp_share:
+            packet = ipv4(protocol=ipv4.ICMP_PROTOCOL, srcip=IPAddr(host_ip(dpid, src)), dstip=IPAddr(host_ip(dpid, dst)))
+            packet.payload = icmp(type=8, payload=echo(id=rng.randint(0, 65535)))
+            frame = ethernet(type=ethernet.IP_TYPE, src=src_mac, dst=EthAddr(host_mac(dpid, dst)))
+        else:
+            packet = arp()
+            packet.opcode = arp.REQUEST
+            packet.hwsrc = src_mac
+            packet.hwdst = ETHER_BROADCAST
+            packet.protosrc = IPAddr(host_ip(dpid, src))
+            packet.protodst = IPAddr(host_ip(dpid, dst))
+            frame = ethernet(type=ethernet.ARP_TYPE, src=src_mac, dst=ETHER_BROADCAST)
+        frame.payload = packet
+        yield dpid, src % 48 + 1, frame.pack()
+
+
+def churn_schedule(switches, rounds, share=0.25, seed=1):
+    """Yield ("down"|"up", dpid) steps: each round a random share of the switches reconnects."""
+    rng = random.Random(seed)
+    for _ in range(rounds):
+        flapping = rng.sample(range(1, switches + 1), max(1, int(switches * share)))
+        for dpid in flapping:
+            yield "down", dpid
+        for dpid in flapping:
+            yield "up", dpid
+
+
+def policy_dataset(groups, members, rules, seed=1):
+    """Rules and groups in the management plane's API format.
+
+    Members are scattered over 10.128.0.0/9 so aggregation only partly helps;
+    rules pick a protocol, a port and one or two groups at random.
+    """
+    rng = random.Random(seed)
+    base = int(ipaddress.IPv4Address("10.128.0.0"))
+    addresses = rng.sample(range(1, 1 << 23), groups * members)
+    group_list = [{"group_id": group + 1,
+                   "ips": [str(ipaddress.IPv4Address(base + address))
+                           for address in addresses[group * members:(group + 1) * members]]}
+                  for group in range(groups)]
+
+    rule_list = [{"id": 1, "dl_type": "0x0806", "action": "allow", "priority": 1000}]
+    for rule_id in range(2, rules + 1):
+        rule = {"id": rule_id, "nw_proto": rng.choice(("tcp", "udp")), "tp_dst": str(rng.choice((22, 53, 80, 443, 3389))),
+                "action": rng.choice(("allow", "deny")), "priority": rng.randint(10, 500),
+                "nw_dst": "group:%d" % rng.randint(1, groups)}
+        if rng.random() < 0.3:
+            rule["nw_src"] = "group:%d" % rng.randint(1, groups)
+        rule_list.append(rule)
+    rule_list.append({"id": rules + 1, "action": "deny", "priority": 0})
+    return {"rules": rule_list}, {"groups": group_list}
+
+
+def group_ip_changes(dataset, count, seed=1):
+    """Change feed entries adding fresh addresses to random groups, one per change."""
+    rng = random.Random(seed)
+    groups = dataset["groups"]
+    changes = []
+    for seq in range(1, count + 1):
+        group = rng.choice(groups)
+        address = str(ipaddress.IPv4Address(int(ipaddress.IPv4Address("10.64.0.0")) + seq))
+        changes.append({"seq": seq, "entity": "group_ip", "op": "add",
+                        "data": {"group_id": group["group_id"], "ip_address": address}})
+    return changes
@@ -0,0 +1,118 @@
+"""Time ArpController's packet-in entry with and without the raw-byte pre-filter.
+
+Generates a mix of ARP, ICMP, TCP, UDP and LLDP frames and measures the cost per
+packet-in of parsing every frame with POX (as before the filter) against
+checking the frame bytes first and parsing only ARP and ICMP. POX has to be
+importable:
+
+    python benchmarks/packet_in_filter.py --pox ~/pox --arp-icmp-share 0.05 0.2 0.5 1.0
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "controller", "pox"))
+
+from packet_filter import is_arp_or_icmp
+
+LLDP_TYPE = 0x88cc
+
+def make_frames(count, arp_icmp_share, seed):
+    from pox.lib.packet.ethernet import ethernet
+    from pox.lib.packet.arp import arp
+    from pox.lib.packet.ipv4 import ipv4
+    from pox.lib.packet.icmp import icmp, echo
+    from pox.lib.packet.tcp import tcp
+    from pox.lib.packet.udp import udp
+    from pox.lib.addresses import EthAddr, IPAddr, ETHER_BROADCAST
+
+    rng = random.Random(seed)
+    src, dst = EthAddr("02:00:00:00:00:01"), EthAddr("02:00:00:00:00:02")
+    frames = []
+    for _ in range(count):
+        if rng.random() < arp_icmp_share:
+            if rng.random() < 0.5:
+                request = arp()
+                request.opcode = arp.REQUEST
+                request.hwsrc = src
+                request.hwdst = ETHER_BROADCAST
+                request.protosrc = IPAddr("10.0.0.1")
+                request.protodst = IPAddr("10.0.0.2")
+                frame = ethernet(type=ethernet.ARP_TYPE, src=src, dst=ETHER_BROADCAST)
+                frame.payload = request
+                frames.append(frame.pack())
+                continue
+            payload = icmp(type=8, payload=echo(id=rng.randint(0, 65535)))
+            protocol = ipv4.ICMP_PROTOCOL
+        elif rng.random() < 0.9:
+            if rng.random() < 0.7:
+                payload = tcp(srcport=rng.randint(1024, 65535), dstport=443, off=5, flags=tcp.SYN_flag)
+                protocol = ipv4.TCP_PROTOCOL
+            else:
+                payload = udp(srcport=rng.randint(1024, 65535), dstport=53)
+                payload.payload = b"\x00" * 32
+                protocol = ipv4.UDP_PROTOCOL
+        else:
+            frame = ethernet(type=LLDP_TYPE, src=src, dst=EthAddr("01:80:c2:00:00:0e"))
+            frame.payload = b"\x00" * 46
+            frames.append(frame.pack())
+            continue
+        packet = ipv4(protocol=protocol, srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"))
+        packet.payload = payload
+        frame = ethernet(type=ethernet.IP_TYPE, src=src, dst=dst)
+        frame.payload = packet
+        frames.append(frame.pack())
+    return frames
+
+
+def parse_all(frames, ethernet):
+    handled = 0
+    for data in frames:
+        packet = ethernet(data)
+        if packet.type == ethernet.ARP_TYPE or (packet.type == ethernet.IP_TYPE and packet.payload.protocol == 1):
+            handled += 1
+    return handled
+
+
+def filter_first(frames, ethernet):
+    handled = 0
+    for data in frames:
+        if not is_arp_or_icmp(data):
+            continue
+        packet = ethernet(data)
+        if packet.type == ethernet.ARP_TYPE or (packet.type == ethernet.IP_TYPE and packet.payload.protocol == 1):
+            handled += 1
+    return handled
+
+
+def timed(function, frames, ethernet):
+    started = time.perf_counter()
+    handled = function(frames, ethernet)
+    return handled, (time.perf_counter() - started) / len(frames) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pox", default=os.environ.get("POX_DIR", "~/pox"), help="POX checkout")
+    parser.add_argument("--packets", type=int, default=100000)
+    parser.add_argument("--arp-icmp-share", type=float, nargs="+", default=[0.05, 0.2, 0.5, 1.0],
+                        help="fraction of packet-ins that are ARP or ICMP")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    sys.path.insert(0, os.path.expanduser(args.pox))
+    from pox.lib.packet.ethernet import ethernet
+
+    columns = ("arp_icmp_share", "parse_all_us", "filter_first_us", "speedup")
+    print(" ".join("%16s" % column for column in columns))
+    for share in args.arp_icmp_share:
+        frames = make_frames(args.packets, share, args.seed)
+        parsed, parse_us = timed(parse_all, frames, ethernet)
+        filtered, filter_us = timed(filter_first, frames, ethernet)
+        assert parsed == filtered, "the filter dropped %d frames the handler wants" % (parsed - filtered)
+        print(" ".join("%16.2f" % value for value in (share, parse_us, filter_us, parse_us / filter_us)))
+
+
+if __name__ == "__main__":
+    main()
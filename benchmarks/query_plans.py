@@ -0,0 +1,75 @@
+"""Check that the management plane's hot lookups are served by an index.
+
+Builds the schema an older version created (tables without the new indexes,
+with duplicate group memberships), runs the schema migrations on it and prints
+SQLite's EXPLAIN QUERY PLAN for each lookup. Exits non-zero when a lookup scans
+its table instead of searching an index, or when the migrations leave
+duplicates behind. Run from the repository root:
+
+    python benchmarks/query_plans.py
+"""
+import os
+import sys
+
+from sqlalchemy import create_engine, select, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app import db
+from app.main.models.firewall_model import FirewallRuleModel
+from app.main.models.grouping_model import GroupModel, GroupIPModel
+from app.main.models.models import DiscoverOSEventModel
+from app.utils.migrations import run_migrations
+
+def lookups():
+    rule_match = dict(dl_type='any', nw_proto='tcp', tp_src='any', tp_dst='22', nw_src='any', nw_dst='group:2')
+    return {
+        "group by name": select(GroupModel.id).where(GroupModel.name == 'linux_group'),
+        "membership check": select(GroupIPModel.id).where(GroupIPModel.group_id == 1,
+                                                          GroupIPModel.ip_address == '10.0.0.1'),
+        "group members": select(GroupIPModel.ip_address).where(GroupIPModel.group_id.in_([1, 2])),
+        "events by ipv4": select(DiscoverOSEventModel.id).where(DiscoverOSEventModel.ipv4 == '10.0.0.1'),
+        "events by arp": select(DiscoverOSEventModel.id).where(DiscoverOSEventModel.arp == '02:00:00:00:00:01'),
+        "rule by match": select(FirewallRuleModel.id).filter_by(action='allow', priority=100, **rule_match),
+    }
+
+
+def legacy_database():
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(text("DROP INDEX %s" % index.name))
+        connection.execute(text("INSERT INTO groups (id, name) VALUES (1, 'windows_group'), (2, 'linux_group')"))
+        connection.execute(text("INSERT INTO group_ips (group_id, ip_address) "
+                                "VALUES (1, '10.0.0.1'), (1, '10.0.0.1'), (2, '10.0.0.1')"))
+    return engine
+
+
+def main():
+    engine = legacy_database()
+    version = run_migrations(engine)
+    print("schema version %d" % version)
+
+    failed = []
+    with engine.connect() as connection:
+        duplicates = connection.execute(text("SELECT COUNT(*) - COUNT(DISTINCT group_id || '/' || ip_address) "
+                                             "FROM group_ips")).scalar()
+        if duplicates:
+            failed.append("%d duplicate group memberships left" % duplicates)
+
+        for name, statement in lookups().items():
+            compiled = statement.compile(engine, compile_kwargs={"literal_binds": True})
+            plan = [row[-1] for row in connection.execute(text("EXPLAIN QUERY PLAN %s" % compiled))]
+            print("%-18s %s" % (name, "; ".join(plan)))
+            if any(step.startswith("SCAN") and "INDEX" not in step for step in plan):
+                failed.append(name + " scans its table")
+
+    for reason in failed:
+        print("FAIL " + reason, file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,10 @@ from app.main.models.models import ServiceModel
 import requests
 import logging
 from app.main.models.grouping_model import GroupModel, GroupIPModel
+from app.utils.change_feed import record_change
+from app.utils.group_membership import update_group_ips
+from app.utils.group_snapshot import refresh_group_snapshots, patch_group_snapshot
+from app.utils.upsert import insert_ignore
 
 celery = Celery(app.name, broker=app.config['CELERY_BROKER_URL'])
 celery.conf.update(app.config)
@@ -13,22 +17,34 @@ def notify_services(event_data):
     with app.app_context():
         services = ServiceModel.query.all()
         for service in services:
-            payload = {
-                'event_id': event_data['event_id'],
-                'event': event_data['event'],
-                'ipv4': event_data['ipv4'],
-                'os_type': event_data['os_type'],
-                'arp': event_data['arp']
-            }
-            url = service.url
-            try:
-                response = requests.post(url, json=payload)
-                if response.status_code == 200:
-                    logger.info(f"Service {url} is notified about {event_data} successfully")
-                else:
-                    logger.info(f"Failed to send notification to {url}. Status code: {response.status_code}")
-            except Exception as e:
-                logger.info(f"Error sending notification to {url}: {e}")
+            notify_service(service.url, event_data)
+
+@celery.task
+def notify_services_batch(events_data):
+    # One task per ingested batch; services are loaded once and reuse a pooled session
+    with app.app_context():
+        services = ServiceModel.query.all()
+        with requests.Session() as session:
+            for event_data in events_data:
+                for service in services:
+                    notify_service(service.url, event_data, session)
+
+def notify_service(url, event_data, session=requests):
+    payload = {
+        'event_id': event_data['event_id'],
+        'event': event_data['event'],
+        'ipv4': event_data['ipv4'],
+        'os_type': event_data['os_type'],
+        'arp': event_data['arp']
+    }
+    try:
+        response = session.post(url, json=payload)
+        if response.status_code == 200:
+            logger.info(f"Service {url} is notified about {event_data} successfully")
+        else:
+            logger.info(f"Failed to send notification to {url}. Status code: {response.status_code}")
+    except Exception as e:
+        logger.info(f"Error sending notification to {url}: {e}")
 
 @celery.task
 def add_ip_to_group_task(group_name, ip_address):
@@ -39,13 +55,13 @@ def add_ip_to_group_task(group_name, ip_address):
                 logger.error(f"Group {group_name} does not exist")
                 return
 
-            existing_ip = GroupIPModel.query.filter_by(group_id=group.id, ip_address=ip_address).first()
-            if existing_ip:
+            if not insert_ignore(GroupIPModel.__table__, [{'group_id': group.id, 'ip_address': ip_address}]):
                 logger.info(f"IP address {ip_address} already exists in the group {group_name}")
+                db.session.rollback()
                 return
 
-            new_ip = GroupIPModel(group_id=group.id, ip_address=ip_address)
-            db.session.add(new_ip)
+            record_change('group_ip', 'add', group_id=group.id, ip_address=ip_address)
+            patch_group_snapshot(group.id, added=[ip_address])
             db.session.commit()
             logger.info(f"IP address {ip_address} added to group {group_name} successfully")
         except Exception as e:
@@ -67,9 +83,45 @@ def delete_ip_from_group_task(group_name, ip_address):
                 return
 
             db.session.delete(existing_ip)
+            record_change('group_ip', 'remove', group_id=group.id, ip_address=ip_address)
+            patch_group_snapshot(group.id, removed=[ip_address])
             db.session.commit()
             logger.info(f"IP address {ip_address} removed from group {group_name} successfully")
         except Exception as e:
             logger.error(f"Error removing IP address {ip_address} from group {group_name}: {e}")
             db.session.rollback()
 
+
+@celery.task
+def update_group_ips_task(memberships):
+    """Apply a batch of [group_name, ip_address, op] changes, op being 'add' or 'remove'.
+
+    The last change per address wins, and the whole batch is one transaction.
+    """
+    with app.app_context():
+        try:
+            by_group = {}
+            for group_name, ip_address, op in memberships:
+                by_group.setdefault(group_name, {})[ip_address] = op
+
+            groups = GroupModel.query.filter(GroupModel.name.in_(list(by_group))).all()
+            for group_name in set(by_group) - {group.name for group in groups}:
+                logger.error(f"Group {group_name} does not exist")
+
+            changed = []
+            for group in groups:
+                ops = by_group[group.name]
+                ip_addresses = sorted(ops)
+                # One diff and one change log entry per group, as PATCH /prosec/api/groups/<id>/ips does
+                added, removed = update_group_ips(group.id,
+                                                  add=[ip for ip in ip_addresses if ops[ip] == 'add'],
+                                                  remove=[ip for ip in ip_addresses if ops[ip] == 'remove'])
+                if added or removed:
+                    record_change('group_ips', 'update', group_id=group.id, added=added, removed=removed)
+                    changed.append(group.id)
+                    logger.info(f"Group {group.name}: {len(added)} IP addresses added, {len(removed)} removed")
+            refresh_group_snapshots(changed)
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Error updating {len(memberships)} group IP addresses: {e}")
+            db.session.rollback()
@@ -9,6 +9,27 @@ class Config:
     SQLALCHEMY_DATABASE_URI = 'sqlite:///app.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Policy change feed consumed by the controller
+    CHANGE_LOG_RETENTION = 10000  # Entries kept before older history is pruned
+    CHANGE_LOG_PRUNE_INTERVAL = 500  # Entries appended by a process between two prunes
+    CHANGE_FEED_MAX_WAIT = 30  # Upper bound in seconds for a long-poll request
+    CHANGE_FEED_POLL_INTERVAL = 0.25
+
+    # Events inserted per executemany by POST /prosec/api/events/bulk
+    EVENT_BULK_CHUNK_SIZE = 1000
+
+    # List endpoints: default and largest page for ?limit=, rows read per query when streaming
+    LIST_PAGE_SIZE = 100
+    LIST_MAX_PAGE_SIZE = 1000
+    LIST_CHUNK_SIZE = 1000
+
+    # Serve GET /prosec/api/groups from a per-group snapshot row updated with every membership change
+    GROUP_SNAPSHOTS = False
+
+    # Controller status API (see main_controller --api_port)
+    CONTROLLER_API_URL = 'http://localhost:8081'
+    CONTROLLER_API_TIMEOUT = 10
+
     # Other configurations...
     CELERY_BROKER_URL = 'redis://localhost:6379/0'  # Example: Redis as broker
     CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
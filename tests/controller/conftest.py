@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The controller modules import each other by bare name, as POX loads them from app/controller/pox
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "app", "controller", "pox"))
@@ -0,0 +1,51 @@
+from host_table import HostTable
+
+
+def test_learn_records_moves_and_new_addresses():
+    table = HostTable()
+    entry, previous_ip, evicted = table.learn(1, "aa", 1, "10.0.0.1", now=0)
+    assert (previous_ip, evicted) == (None, [])
+    assert table.port_for(1, "aa") == 1
+
+    same, previous_ip, _ = table.learn(1, "aa", 2, "10.0.0.2", now=1)
+    assert same is entry and previous_ip == "10.0.0.1"
+    assert (entry.port, entry.ip) == (2, "10.0.0.2")
+    assert table.metrics()["moved"] == 1 and table.metrics()["readdressed"] == 1
+
+
+def test_capacity_evicts_the_least_recently_seen_host():
+    table = HostTable(capacity=2)
+    table.learn(1, "aa", 1, "10.0.0.1", now=0)
+    table.learn(1, "bb", 2, "10.0.0.2", now=1)
+    table.touch(1, "aa", now=2)
+    _, _, evicted = table.learn(1, "cc", 3, "10.0.0.3", now=3)
+
+    assert [entry.mac for entry in evicted] == ["bb"]
+    assert table.get(1, "bb") is None and "bb" not in table.by_mac
+    assert len(table) == 2
+
+
+def test_expire_removes_hosts_not_seen_for_the_ttl():
+    table = HostTable(ttl=10)
+    table.learn(1, "aa", 1, "10.0.0.1", now=0)
+    table.learn(2, "aa", 1, "10.0.0.1", now=5)
+    table.learn(1, "bb", 2, "10.0.0.2", now=8)
+
+    expired = table.expire(now=12)
+    assert [(entry.dpid, entry.mac) for entry in expired] == [(1, "aa")]
+    assert list(table.by_mac["aa"]) == [2]
+    assert table.touch(1, "aa") is None
+    assert [entry.mac for entry in table.expire(now=100)] == ["aa", "bb"]
+    assert table.by_mac == {}
+
+
+def test_known_os_type_looks_at_other_switches_with_the_same_address():
+    table = HostTable()
+    first, _, _ = table.learn(1, "aa", 1, "10.0.0.1")
+    second, _, _ = table.learn(2, "aa", 1, "10.0.0.1")
+    assert table.known_os_type("aa", "10.0.0.1") is None
+
+    first.os_type = "Linux"
+    assert table.known_os_type("aa", "10.0.0.1", exclude=second) == "Linux"
+    assert table.known_os_type("aa", "10.0.0.1", exclude=first) is None
+    assert table.known_os_type("aa", "10.0.0.9") is None
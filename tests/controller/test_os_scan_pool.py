@@ -0,0 +1,138 @@
+import time
+from threading import Event, Lock
+from unittest import mock
+
+import os_scan_pool
+from os_scan_pool import OsScanPool, UNKNOWN_OS
+
+
+class FakeBackend(object):
+    """Scanner backend whose scans block until released, with the OS type to report per address."""
+    def __init__(self, results=None):
+        self.results = results or {}
+        self.lock = Lock()
+        self.calls = []
+        self.gates = {}
+
+    def gate(self, ip):
+        with self.lock:
+            return self.gates.setdefault(ip, Event())
+
+    def release(self, ip):
+        self.gate(ip).set()
+
+    def __call__(self, ip):
+        with self.lock:
+            self.calls.append(ip)
+        assert self.gate(ip).wait(5), "scan of %s never released" % ip
+        result = self.results.get(ip)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class Results(object):
+    def __init__(self):
+        self.lock = Lock()
+        self.received = []
+        self.changed = Event()
+
+    def __call__(self, ip, mac, os_type):
+        with self.lock:
+            self.received.append((ip, mac, os_type))
+        self.changed.set()
+
+    def wait_for(self, count):
+        deadline = time.monotonic() + 5
+        while len(self.received) < count:
+            assert time.monotonic() < deadline, "only got %r" % self.received
+            self.changed.wait(0.05)
+            self.changed.clear()
+        return sorted(self.received)
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def make_pool(backend, results, **options):
+    options.setdefault("workers", 4)
+    return OsScanPool(results, backend=backend, processes=False, **options)
+
+
+def test_per_subnet_limit_and_next_scan_started_when_one_finishes():
+    backend, results = FakeBackend({"10.0.0.1": "Linux", "10.0.0.2": "Windows", "10.0.1.1": "Linux"}), Results()
+    pool = make_pool(backend, results, per_subnet=1)
+    for ip in ("10.0.0.1", "10.0.0.2", "10.0.1.1"):
+        assert pool.submit(ip, "mac-" + ip)
+
+    # One scan per /24: 10.0.0.2 waits behind 10.0.0.1, 10.0.1.1 runs at once
+    wait_until(lambda: len(backend.calls) == 2)
+    assert sorted(backend.calls) == ["10.0.0.1", "10.0.1.1"]
+    assert pool.metrics()["running"] == 2 and pool.metrics()["pending"] == 3
+
+    backend.release("10.0.0.1")
+    wait_until(lambda: "10.0.0.2" in backend.calls)
+    backend.release("10.0.0.2")
+    backend.release("10.0.1.1")
+    assert results.wait_for(3) == [("10.0.0.1", "mac-10.0.0.1", "Linux"), ("10.0.0.2", "mac-10.0.0.2", "Windows"),
+                                   ("10.0.1.1", "mac-10.0.1.1", "Linux")]
+    wait_until(lambda: pool.metrics()["pending"] == 0)
+    assert pool.metrics()["running"] == 0 and not pool.waiting
+    pool.shutdown()
+
+
+def test_address_in_flight_is_scanned_once_for_every_mac():
+    backend, results = FakeBackend({"10.0.0.1": "Linux"}), Results()
+    pool = make_pool(backend, results)
+    assert pool.submit("10.0.0.1", "aa")
+    assert pool.submit("10.0.0.1", "bb")
+    backend.release("10.0.0.1")
+
+    assert results.wait_for(2) == [("10.0.0.1", "aa", "Linux"), ("10.0.0.1", "bb", "Linux")]
+    assert backend.calls == ["10.0.0.1"]
+    assert pool.metrics()["deduplicated"] == 1
+    pool.shutdown()
+
+
+def test_full_queue_rejects_new_addresses():
+    backend, results = FakeBackend(), Results()
+    pool = make_pool(backend, results, max_pending=1)
+    assert pool.submit("10.0.0.1", "aa")
+    assert not pool.submit("10.0.0.2", "bb")
+    assert pool.submit("10.0.0.1", "cc")  # Joining a scan in flight needs no queue slot
+    assert pool.metrics()["rejected"] == 1
+    backend.release("10.0.0.1")
+    results.wait_for(2)
+    pool.shutdown()
+
+
+def test_results_are_cached_until_the_ttl_and_failures_are_not():
+    backend = FakeBackend({"10.0.0.1": "Linux", "10.0.0.2": RuntimeError("nmap failed")})
+    results = Results()
+    pool = make_pool(backend, results, cache_ttl=60)
+    for ip in ("10.0.0.1", "10.0.0.2"):
+        pool.submit(ip, "aa")
+        backend.release(ip)
+
+    assert results.wait_for(2) == [("10.0.0.1", "aa", "Linux"), ("10.0.0.2", "aa", UNKNOWN_OS)]
+    assert pool.lookup("10.0.0.1", "aa") == "Linux"
+    assert pool.lookup("10.0.0.1", "bb") is None  # Cached per (ip, mac)
+    assert pool.lookup("10.0.0.2", "aa") is None
+    with mock.patch.object(os_scan_pool.time, "time", return_value=time.time() + 61):
+        assert pool.lookup("10.0.0.1", "aa") is None
+    pool.shutdown()
+
+
+def test_results_go_through_dispatch():
+    backend, results = FakeBackend({"10.0.0.1": "Linux"}), Results()
+    dispatched = []
+    pool = make_pool(backend, results, dispatch=lambda function, *args: dispatched.append(args) or function(*args))
+    pool.submit("10.0.0.1", "aa")
+    backend.release("10.0.0.1")
+    results.wait_for(1)
+    assert dispatched == [("10.0.0.1", "aa", "Linux")]
+    pool.shutdown()
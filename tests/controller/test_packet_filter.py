@@ -0,0 +1,36 @@
+import struct
+
+from packet_filter import is_arp_or_icmp, is_ipv4, ARP_TYPE, IP_TYPE, VLAN_TYPE
+
+MACS = b"\xff" * 6 + b"\x02" * 6
+
+
+def ipv4_frame(protocol, vlan=False):
+    header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20, 0, 0, 64, protocol, 0, b"\x0a\0\0\x01", b"\x0a\0\0\x02")
+    if vlan:
+        return MACS + struct.pack("!HHH", VLAN_TYPE, 1, IP_TYPE) + header
+    return MACS + struct.pack("!H", IP_TYPE) + header
+
+
+def test_arp_and_icmp_pass_other_traffic_is_dropped():
+    assert is_arp_or_icmp(MACS + struct.pack("!H", ARP_TYPE) + b"\0" * 28)
+    assert is_arp_or_icmp(ipv4_frame(1))
+    assert not is_arp_or_icmp(ipv4_frame(6))
+    assert not is_arp_or_icmp(ipv4_frame(17))
+    assert not is_arp_or_icmp(MACS + struct.pack("!H", 0x86dd) + b"\0" * 40)
+    # ArpController dispatches on the outer type, so tagged ICMP is dropped too
+    assert not is_arp_or_icmp(ipv4_frame(1, vlan=True))
+
+
+def test_frames_too_short_to_tell_are_left_to_the_parser():
+    assert is_arp_or_icmp(b"\0" * 10)
+    assert is_arp_or_icmp(MACS + struct.pack("!H", IP_TYPE) + b"\x45\0")
+    assert is_ipv4(b"\0" * 10)
+    assert is_ipv4(MACS + struct.pack("!H", VLAN_TYPE) + b"\0")
+
+
+def test_is_ipv4_sees_through_one_vlan_tag():
+    assert is_ipv4(ipv4_frame(6))
+    assert is_ipv4(ipv4_frame(6, vlan=True))
+    assert not is_ipv4(MACS + struct.pack("!H", ARP_TYPE) + b"\0" * 28)
+    assert not is_ipv4(MACS + struct.pack("!HHH", VLAN_TYPE, 1, ARP_TYPE) + b"\0" * 28)
@@ -0,0 +1,57 @@
+from policy_index import PolicyIndex
+from rule_compiler import CompiledRule
+
+
+def rule(rule_id, priority, nw_src="any", nw_dst="any"):
+    return CompiledRule({"id": rule_id, "priority": priority, "action": "allow", "dl_type": "0x0800",
+                         "nw_proto": "tcp", "tp_src": "any", "tp_dst": "22", "nw_src": nw_src, "nw_dst": nw_dst})
+
+
+def test_groups_for_matches_hosts_and_cidr_members():
+    index = PolicyIndex()
+    index.set_groups({"1": ["10.0.0.1", "10.0.1.0/24"], "2": ["10.0.0.1"], "3": ["192.168.0.0/16"]})
+    assert index.groups_for("10.0.0.1") == {"1", "2"}
+    assert index.groups_for("10.0.1.77") == {"1"}
+    assert index.groups_for("192.168.4.4") == {"3"}
+    assert index.groups_for("172.16.0.1") == set()
+    assert index.lengths == (32, 24, 16)
+
+
+def test_versions_only_change_with_membership():
+    index = PolicyIndex()
+    index.set_groups({"1": ["10.0.0.1"], "2": ["10.0.0.2"]})
+    first, second = index.group_version("1"), index.group_version("2")
+
+    index.set_groups({"1": ["10.0.0.1"], "2": ["10.0.0.2", "10.0.0.3"]})
+    assert index.group_version("1") == first
+    assert index.group_version("2") > second
+    assert index.prefixes("2") == ["10.0.0.2/31"]
+
+
+def test_removed_members_and_groups_leave_no_entries_behind():
+    index = PolicyIndex()
+    index.set_groups({"1": ["10.0.0.1", "10.1.0.0/16"], "2": ["10.0.0.1"]})
+    index.set_groups({"2": []})
+    assert index.group_version("1") is None and index.prefixes("1") is None
+    assert index.tables == {} and index.lengths == ()
+    assert index.groups_for("10.0.0.1") == set()
+
+
+def test_invalid_members_are_skipped():
+    index = PolicyIndex()
+    index.set_groups({"1": ["10.0.0.1", "not-an-ip", "2001:db8::1"]})
+    assert index.size("1") == 1
+
+
+def test_rules_for_orders_matches_by_priority_and_tracks_group_references():
+    index = PolicyIndex()
+    rules = [rule(1, 10, nw_src="group:1", nw_dst="192.168.0.1"),
+             rule(2, 30, nw_src="192.168.0.1", nw_dst="10.0.0.0/8"),
+             rule(3, 20, nw_src="192.168.0.1", nw_dst="group:2")]
+    index.load(rules, {"1": ["10.0.0.1"], "2": ["10.9.9.9"]})
+
+    assert [(match.id, side) for match, side in index.rules_for("10.0.0.1")] == [(2, "dst"), (1, "src")]
+    assert [(match.id, side) for match, side in index.rules_for("10.9.9.9")] == [(2, "dst"), (3, "dst")]
+    assert [(match.id, side) for match, side in index.rules_for("192.168.0.1")] == [(2, "src"), (3, "src"), (1, "dst")]
+    assert index.affected_rules("1") == {1}
+    assert index.affected_rules("3") == set()
@@ -0,0 +1,56 @@
+import time
+from threading import Event
+
+from sync_scheduler import SyncScheduler
+
+
+class Counter(object):
+    def __init__(self):
+        self.calls = 0
+        self.called = Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.called.set()
+
+
+def test_a_burst_of_notifications_becomes_one_sync():
+    counter = Counter()
+    scheduler = SyncScheduler(counter, debounce=0.1, max_latency=5.0)
+    for _ in range(20):
+        scheduler.request_sync()
+    assert counter.called.wait(2)
+    time.sleep(0.3)
+
+    metrics = scheduler.metrics()
+    assert counter.calls == 1
+    assert metrics["notification_count"] == 20 and metrics["coalesced_notification_count"] == 19
+    assert metrics["pending_notifications"] == 0
+
+
+def test_steady_notifications_still_sync_within_max_latency():
+    counter = Counter()
+    scheduler = SyncScheduler(counter, debounce=0.2, max_latency=0.3)
+    started = time.monotonic()
+    # Never quiet for the debounce period, so only the latency cap can trigger a pass
+    while not counter.called.is_set() and time.monotonic() - started < 2:
+        scheduler.request_sync()
+        time.sleep(0.02)
+    assert counter.called.is_set()
+    assert time.monotonic() - started < 1.0
+
+
+def test_passes_go_through_dispatch_and_survive_callback_errors():
+    dispatched = Event()
+
+    def failing():
+        raise RuntimeError("sync failed")
+
+    def dispatch(function, *args):
+        function(*args)
+        dispatched.set()
+
+    scheduler = SyncScheduler(failing, debounce=0.01, max_latency=1.0, dispatch=dispatch)
+    scheduler.request_sync()
+    assert dispatched.wait(2)
+    assert scheduler.metrics()["sync_count"] == 1